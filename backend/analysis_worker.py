@@ -0,0 +1,172 @@
+"""
+分析工作进程 - 从持久化队列领取待分析错误，分析后写回
+
+采集时错误先入库并加入 analysis_jobs 队列，工作协程以租约方式领取：
+租约到期前未完成（进程崩溃、重启）的任务会被重新领取，失败的任务按退避重试。
+任务按严重程度优先、同级新错误优先领取；积压过多时推迟低优先级任务，继续增长则丢弃告警级任务。
+既可以在 API 进程内运行（ANALYSIS_WORKERS > 0），也可以单独运行：
+
+用法: python analysis_worker.py [--db logs.db] [--workers 2]
+"""
+import argparse
+import asyncio
+import uuid
+from typing import Dict, List, Optional
+import logging
+
+from async_storage import AsyncLogStorage
+from config import ANALYSIS_BATCH_CONFIG, ANALYSIS_QUEUE_CONFIG, ANALYSIS_SERVICE_CONFIG
+from llm_client import LLMClient
+from log_analysis import AnalysisCache, ErrorAnalyzer
+from log_storage import DEFER_MIN_PRIORITY, SHED_MAX_PRIORITY, LogStorage
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisWorker:
+    """分析任务工作池：workers 个协程并发领取和处理任务
+
+    db 为 AsyncLogStorage；每次领取 lease_size 个任务交给 ErrorAnalyzer，
+    同一批中签名相同的错误只分析一次，其余打包成批量请求。
+    待分析积压超过 defer_backlog 时优先整批领取 DEFER_MIN_PRIORITY 及以上的任务，其余任务推迟到空闲时小批处理，
+    超过 shed_backlog 时把超出部分中优先级不高于 SHED_MAX_PRIORITY 的任务标记为丢弃（0 表示不启用）
+    """
+    
+    def __init__(self, db, analyzer: ErrorAnalyzer, workers: int = 2, lease_size: int = 16,
+                 visibility_timeout: float = 300, max_attempts: int = 5,
+                 retry_delay: float = 30, poll_interval: float = 2,
+                 defer_backlog: int = 500, shed_backlog: int = 2000):
+        self.db = db
+        self.analyzer = analyzer
+        self.workers = workers
+        self.lease_size = lease_size
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.defer_backlog = defer_backlog
+        self.shed_backlog = shed_backlog
+        self._tasks: List[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._stats = {'leased': 0, 'completed': 0, 'failed': 0, 'errors': 0, 'busy': 0,
+                       'deferring': 0, 'shed': 0}
+    
+    def start(self):
+        """在当前事件循环中启动工作协程"""
+        if self._tasks:
+            return
+        self._stopping = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(index)) for index in range(self.workers)]
+        logger.info(f"分析工作池启动: {self.workers} 个工作协程")
+    
+    async def stop(self):
+        """停止领取新任务，等待处理中的任务完成"""
+        if not self._tasks:
+            return
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    async def run_once(self) -> int:
+        """领取并处理一批任务，返回领取的任务数"""
+        min_priority = await self._shed_load()
+        lease_token = uuid.uuid4().hex
+        jobs = await self.db.lease_analysis_jobs(
+            self.lease_size, int(self.visibility_timeout * 1000), lease_token, self.max_attempts, min_priority
+        )
+        if not jobs and min_priority:
+            # 没有高优先级任务时才处理被推迟的任务，每次只领一个批量请求的量，新到的严重错误不用等太久
+            jobs = await self.db.lease_analysis_jobs(
+                min(self.lease_size, max(self.analyzer.batch_size, 1)), int(self.visibility_timeout * 1000), lease_token, self.max_attempts
+            )
+        if not jobs:
+            return 0
+        
+        self._stats['leased'] += len(jobs)
+        self._stats['busy'] += 1
+        try:
+            results = await self.analyzer.analyze([job['error'] for job in jobs])
+        finally:
+            self._stats['busy'] -= 1
+        
+        done = [(job['job_id'], result['analysis'], result['analyzed_at'])
+                for job, result in zip(jobs, results) if not result.get('failed')]
+        failed = [(job['job_id'], result['analysis'])
+                  for job, result in zip(jobs, results) if result.get('failed')]
+        if done:
+            await self.db.complete_analysis_jobs(lease_token, done)
+        if failed:
+            await self.db.fail_analysis_jobs(lease_token, failed, self.max_attempts, int(self.retry_delay * 1000))
+        self._stats['completed'] += len(done)
+        self._stats['failed'] += len(failed)
+        return len(jobs)
+    
+    async def _shed_load(self) -> int:
+        """按积压情况丢弃多余的低优先级任务，返回本次领取的最低优先级"""
+        if not self.defer_backlog and not self.shed_backlog:
+            return 0
+        backlog = await self.db.count_pending_analysis_jobs()
+        if self.shed_backlog and backlog > self.shed_backlog:
+            shed = await self.db.shed_analysis_jobs(backlog - self.shed_backlog, SHED_MAX_PRIORITY)
+            if shed:
+                self._stats['shed'] += shed
+                logger.warning(f"分析积压 {backlog} 个任务，丢弃 {shed} 个低优先级任务")
+        deferring = bool(self.defer_backlog) and backlog > self.defer_backlog
+        self._stats['deferring'] = int(deferring)
+        return DEFER_MIN_PRIORITY if deferring else 0
+    
+    async def _run(self, index: int):
+        while not self._stopping.is_set():
+            try:
+                leased = await self.run_once()
+            except Exception as e:
+                # 已领取的任务保持租约，到期后会被重新领取
+                self._stats['errors'] += 1
+                logger.error(f"分析工作协程 {index} 处理失败: {e}")
+                leased = 0
+            if not leased:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+    
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['workers'] = len(self._tasks)
+        stats['running'] = bool(self._tasks) and self._stopping is not None and not self._stopping.is_set()
+        return stats
+
+
+async def run_worker(db_path: str, workers: int):
+    """单独运行工作池，直到被中断"""
+    storage = LogStorage(db_path)
+    db = AsyncLogStorage(storage)
+    client = LLMClient(**ANALYSIS_SERVICE_CONFIG)
+    analyzer = ErrorAnalyzer(client, AnalysisCache(db), **ANALYSIS_BATCH_CONFIG)
+    worker = AnalysisWorker(db, analyzer, **{**ANALYSIS_QUEUE_CONFIG, 'workers': workers})
+    worker.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+        await client.aclose()
+        db.close()
+        storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="错误分析工作进程")
+    parser.add_argument("--db", default="logs.db", help="数据库路径")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_QUEUE_CONFIG['workers'] or 2,
+                        help="并发工作协程数")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run_worker(args.db, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
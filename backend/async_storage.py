@@ -0,0 +1,174 @@
+"""
+异步存储模块 - 在事件循环中以非阻塞方式访问 LogStorage
+
+读操作在线程池中执行（每个线程有自己的读连接）；写操作排队交给专门的写线程，
+写线程把短时间内到达的多个写操作合并为一个事务提交（组提交）
+"""
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import logging
+
+from log_storage import LogStorage
+
+logger = logging.getLogger(__name__)
+
+# 在读线程池中执行的方法
+READ_METHODS = {
+    'get_errors', 'get_error_by_id', 'search_errors', 'explain_errors_query',
+    'get_issues', 'get_issue_by_id', 'get_collection_history', 'get_collection_cursor', 'get_raw_next_line',
+    'get_retention_policies', 'list_partitions', 'storage_stats', 'get_stats',
+    'get_cached_analyses', 'get_analysis_job_stats', 'count_pending_analysis_jobs',
+}
+
+# 交给写线程、可以合并提交的方法
+WRITE_METHODS = {
+    'save_error', 'save_errors', 'save_collection_history', 'save_collection_cursor',
+    'update_error_status', 'update_issue_status', 'set_retention_policy',
+    'save_cached_analysis', 'lease_analysis_jobs', 'complete_analysis_jobs', 'fail_analysis_jobs',
+    'retry_failed_analysis_jobs', 'shed_analysis_jobs',
+}
+
+# 交给写线程、但必须单独执行的维护方法（内部有 ATTACH / VACUUM 或自行分批提交）
+EXCLUSIVE_METHODS = {
+    'archive_errors', 'purge_expired', 'incremental_vacuum', 'rebuild_rollups',
+}
+
+
+class _WriteOp:
+    __slots__ = ('func', 'args', 'kwargs', 'future', 'exclusive')
+    
+    def __init__(self, func: Callable, args: tuple, kwargs: dict, exclusive: bool):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.exclusive = exclusive
+
+
+class AsyncLogStorage:
+    """LogStorage 的异步门面：await storage.get_errors(...) 不会阻塞事件循环
+    
+    写操作的 await 在事务提交后才返回；组内某个写操作失败只回滚它自己（保存点），
+    提交失败时组内所有写操作都收到该异常
+    """
+    
+    def __init__(self, storage: LogStorage, read_workers: int = 4,
+                 max_batch: int = 64, max_delay: float = 0.002):
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="storage-read")
+        self._queue: "queue.Queue[Optional[_WriteOp]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="storage-write", daemon=True)
+        self._writer.start()
+        self._stats = {'writes': 0, 'commits': 0, 'max_batch': 0, 'reads': 0}
+    
+    def __getattr__(self, name: str):
+        if name in READ_METHODS:
+            func = getattr(self.storage, name)
+            
+            async def read(*args, **kwargs):
+                self._stats['reads'] += 1
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._readers, lambda: func(*args, **kwargs))
+            return read
+        
+        if name in WRITE_METHODS or name in EXCLUSIVE_METHODS:
+            func = getattr(self.storage, name)
+            exclusive = name in EXCLUSIVE_METHODS
+            
+            async def write(*args, **kwargs):
+                return await asyncio.wrap_future(self.submit(func, *args, exclusive=exclusive, **kwargs))
+            return write
+        
+        # 不访问数据库的辅助方法（如 page_cursor）直接转发
+        return getattr(self.storage, name)
+    
+    def submit(self, func: Callable, *args, exclusive: bool = False, **kwargs) -> Future:
+        """把写操作交给写线程，返回 concurrent.futures.Future（可在普通线程中使用）"""
+        op = _WriteOp(func, args, kwargs, exclusive)
+        self._queue.put(op)
+        return op.future
+    
+    def _write_loop(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            batch = [op]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay
+            # 攒一小批：队列里已有的直接取走，最多再等 max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    op = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if op is None:
+                    stopping = True
+                    break
+                batch.append(op)
+            
+            # 按到达顺序执行：连续的普通写操作合并提交，维护操作单独执行
+            for exclusive, ops in itertools.groupby(batch, key=lambda o: o.exclusive):
+                ops = list(ops)
+                if exclusive:
+                    for op in ops:
+                        self._run_exclusive(op)
+                else:
+                    self._run_group(ops)
+            if stopping:
+                return
+    
+    def _run_exclusive(self, op: _WriteOp):
+        if not op.future.set_running_or_notify_cancel():
+            return
+        try:
+            op.future.set_result(op.func(*op.args, **op.kwargs))
+        except Exception as e:
+            op.future.set_exception(e)
+    
+    def _run_group(self, ops):
+        ops = [op for op in ops if op.future.set_running_or_notify_cancel()]
+        if not ops:
+            return
+        outcomes = []
+        try:
+            with self.storage.group_commit():
+                for op in ops:
+                    try:
+                        outcomes.append((op, op.func(*op.args, **op.kwargs), None))
+                    except Exception as e:
+                        outcomes.append((op, None, e))
+        except Exception as e:
+            logger.error(f"组提交失败（{len(ops)} 个写操作）: {e}")
+            for op in ops:
+                op.future.set_exception(e)
+            return
+        
+        self._stats['writes'] += len(ops)
+        self._stats['commits'] += 1
+        self._stats['max_batch'] = max(self._stats['max_batch'], len(ops))
+        for op, result, error in outcomes:
+            if error is not None:
+                op.future.set_exception(error)
+            else:
+                op.future.set_result(result)
+    
+    def stats(self) -> Dict:
+        """写入次数、提交次数和平均每次提交的写操作数"""
+        stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['avg_batch'] = round(stats['writes'] / stats['commits'], 2) if stats['commits'] else 0
+        return stats
+    
+    def close(self):
+        """处理完已排队的写操作后停止写线程，关闭读线程池"""
+        self._queue.put(None)
+        self._writer.join(timeout=30)
+        self._readers.shutdown(wait=True)
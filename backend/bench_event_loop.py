@@ -0,0 +1,124 @@
+"""事件循环负载测试 - 重查询和并发写入进行时，对比健康检查延迟
+
+同步模式在协程里直接调用 LogStorage（与改造前的处理函数相同），
+异步模式通过 AsyncLogStorage 执行；健康检查延迟即事件循环被阻塞的时间
+
+用法: python bench_event_loop.py [--rows 50000] [--clients 8] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from async_storage import AsyncLogStorage
+from log_storage import LogStorage
+
+CONTAINERS = [f"service-{i}" for i in range(8)]
+
+
+def letters(n: int) -> str:
+    """数字转字母串，避免被指纹归一化成相同错误"""
+    text = ''
+    while True:
+        n, digit = divmod(n, 20)
+        text += chr(ord('g') + digit)
+        if not n:
+            return text
+
+
+def make_error(n: int) -> dict:
+    return {
+        'original': {
+            'content': f"ERROR OrderService failed in handler {letters(n)}",
+            'context': [f"\tat com.otc.market.OrderService.handle{letters(n)}(OrderService.java:42)"] * 8,
+            'timestamp_ms': 1_700_000_000_000 + n * 1000,
+            'level': 'ERROR',
+        }
+    }
+
+
+def populate(storage: LogStorage, rows: int):
+    per_container = rows // len(CONTAINERS)
+    for i, container in enumerate(CONTAINERS):
+        start = i * per_container
+        storage.save_errors(container, (make_error(n) for n in range(start, start + per_container)))
+
+
+async def probe_health(stop: asyncio.Event, interval: float = 0.01):
+    """模拟健康检查：记录每次预期唤醒与实际唤醒之间的延迟"""
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append((time.perf_counter() - started - interval) * 1000)
+    return latencies
+
+
+async def run_load(mode: str, storage: LogStorage, db: AsyncLogStorage, clients: int, seconds: float):
+    """clients 个并发客户端循环执行：错误列表大页查询、全文检索、单条写入"""
+    stop = asyncio.Event()
+    counters = {'reads': 0, 'writes': 0}
+    rng = random.Random(1)
+    
+    async def client(k: int):
+        while not stop.is_set():
+            container = rng.choice(CONTAINERS)
+            if mode == 'sync':
+                storage.get_errors(container, limit=2000)
+                storage.search_errors('OrderService', limit=200)
+                storage.save_error(container, make_error(10 ** 7 + k * 10 ** 5 + counters['writes']))
+                await asyncio.sleep(0)
+            else:
+                await db.get_errors(container, limit=2000)
+                await db.search_errors('OrderService', limit=200)
+                await db.save_error(container, make_error(10 ** 7 + k * 10 ** 5 + counters['writes']))
+            counters['reads'] += 2
+            counters['writes'] += 1
+    
+    probe = asyncio.create_task(probe_health(stop))
+    clients_tasks = [asyncio.create_task(client(k)) for k in range(clients)] if mode != 'idle' else []
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*clients_tasks)
+    return await probe, counters
+
+
+def report(name: str, latencies, counters, seconds: float):
+    latencies.sort()
+    
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+    
+    print(f"{name:<6} 健康检查延迟 p50 {percentile(0.5):7.2f} ms  p99 {percentile(0.99):7.2f} ms  "
+          f"max {latencies[-1]:7.2f} ms | 读 {counters['reads'] / seconds:6.0f}/s  写 {counters['writes'] / seconds:6.0f}/s")
+
+
+async def main_async(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LogStorage(os.path.join(tmp, "load.db"))
+        populate(storage, args.rows)
+        db = AsyncLogStorage(storage)
+        print(f"模拟数据: {args.rows:,} 条错误, {args.clients} 个并发客户端, 每轮 {args.seconds}s")
+        print("=" * 80)
+        for mode, name in (('idle', '空闲'), ('sync', '同步'), ('async', '异步')):
+            latencies, counters = await run_load(mode, storage, db, args.clients, args.seconds)
+            report(name, latencies, counters, args.seconds)
+        print("=" * 80)
+        print(f"组提交: {db.stats()}")
+        db.close()
+        storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="事件循环负载测试")
+    parser.add_argument("--rows", type=int, default=50000, help="模拟错误条数")
+    parser.add_argument("--clients", type=int, default=8, help="并发客户端数")
+    parser.add_argument("--seconds", type=float, default=5, help="每种模式的持续时间")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""解析性能基准 - 对比逐模式 re.search 的旧解析器与预编译匹配器的吞吐量
+
+用法: python bench_parser.py [--lines 1000000] [--seed 1] [--workers N]
+"""
+import argparse
+import os
+import random
+import re
+import time
+
+from log_collector import LogCollector
+from log_parser import ERROR_PATTERNS, EXCLUDE_PATTERNS
+
+# 模拟 Java 服务日志：大部分是普通 INFO/DEBUG，夹杂少量错误、堆栈和排除行
+LINE_TEMPLATES = [
+    (80, "2024-01-01 10:00:{s:02d}.123 INFO  [http-nio-8080-exec-{t}] c.o.market.OrderService - processed order {n} in {m} ms"),
+    (12, "2024-01-01 10:00:{s:02d}.456 DEBUG [pool-{t}-thread-1] c.o.market.PriceCache - cache hit key=quote:{n} size={m}"),
+    (2, "2024-01-01 10:00:{s:02d}.789 ERROR [http-nio-8080-exec-{t}] c.o.market.OrderService - Failed to settle order {n}: code {m}"),
+    (3, "\tat com.otc.market.OrderService.settle(OrderService.java:{m})"),
+    (1, "2024-01-01 10:00:{s:02d}.000 WARN  [main] c.o.market.Gateway - Could not connect to 10.0.{t}.{m}"),
+    (1, "Caused by: java.net.SocketTimeoutException: Read timed out after {m} ms"),
+    (1, "2024-01-01 10:00:{s:02d}.000 INFO  [main] c.o.market.Batch - batch {n} finished with no error"),
+]
+
+
+def generate_logs(line_count: int, seed: int) -> str:
+    """生成模拟日志"""
+    rng = random.Random(seed)
+    weights = [w for w, _ in LINE_TEMPLATES]
+    templates = [t for _, t in LINE_TEMPLATES]
+    lines = []
+    for template in rng.choices(templates, weights, k=line_count):
+        lines.append(template.format(
+            s=rng.randint(0, 59), t=rng.randint(1, 200),
+            n=rng.randint(0, 10 ** 6), m=rng.randint(0, 999)
+        ))
+    return '\n'.join(lines)
+
+
+def legacy_extract_timestamp(log_line: str):
+    """旧版时间戳提取：每次依次尝试所有格式"""
+    timestamp_patterns = [
+        r'\d{4}-\d{2}-\d{2}[\sT]\d{2}:\d{2}:\d{2}',
+        r'\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2}',
+        r'\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]'
+    ]
+    for pattern in timestamp_patterns:
+        match = re.search(pattern, log_line)
+        if match:
+            return match.group(0)
+    return None
+
+
+def legacy_parse_error_logs(logs: str):
+    """旧版解析器：每行依次对每个模式执行 re.search"""
+    lines = logs.split('\n')
+    errors = []
+    current_error = None
+    
+    for i, line in enumerate(lines):
+        if any(re.search(pattern, line, re.IGNORECASE) for pattern in EXCLUDE_PATTERNS):
+            continue
+        
+        if any(re.search(pattern, line, re.IGNORECASE) for pattern in ERROR_PATTERNS):
+            if current_error:
+                errors.append(current_error)
+            current_error = {
+                'line_number': i + 1,
+                'timestamp': legacy_extract_timestamp(line),
+                'content': line,
+                'context': []
+            }
+        elif current_error:
+            current_error['context'].append(line)
+            if len(current_error['context']) > 10:
+                errors.append(current_error)
+                current_error = None
+    
+    if current_error:
+        errors.append(current_error)
+    
+    return errors
+
+
+def same_errors(old_errors, new_errors) -> bool:
+    """比较解析结果，新解析器额外给出的 timestamp_ms 等字段不参与比较"""
+    return len(old_errors) == len(new_errors) and all(
+        all(new.get(key) == value for key, value in old.items())
+        for old, new in zip(old_errors, new_errors)
+    )
+
+
+def bench(name: str, func, logs: str, line_count: int):
+    start = time.perf_counter()
+    errors = func(logs)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed:8.2f} s  {line_count / elapsed:>12,.0f} 行/秒  {len(errors)} 个错误")
+    return errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志解析性能基准")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="模拟日志行数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行解析的进程数")
+    args = parser.parse_args()
+    
+    collector = LogCollector(host="bench", port=22, username="bench")
+    logs = generate_logs(args.lines, args.seed)
+    print(f"模拟日志: {args.lines:,} 行, {len(logs) / 1024 / 1024:.1f} MB")
+    print("=" * 60)
+    
+    old_errors, old_elapsed = bench("旧解析器", legacy_parse_error_logs, logs, args.lines)
+    new_errors, new_elapsed = bench("新解析器", lambda text: collector.parse_error_logs(text, workers=1), logs, args.lines)
+    if args.workers > 1:
+        parallel_errors, parallel_elapsed = bench(
+            f"并行x{args.workers}", lambda text: collector.parse_error_logs(text, workers=args.workers), logs, args.lines
+        )
+    
+    print("=" * 60)
+    print(f"加速比: {old_elapsed / new_elapsed:.1f}x")
+    print(f"结果一致: {'是' if same_errors(old_errors, new_errors) else '否'}")
+    if args.workers > 1:
+        print(f"并行加速比: {old_elapsed / parallel_elapsed:.1f}x")
+        print(f"并行结果一致: {'是' if same_errors(old_errors, parallel_errors) else '否'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""存储性能基准 - 对比每次调用新建连接的旧存储与长连接 + WAL 调优后的 LogStorage
+
+用法: python bench_storage.py [--inserts 5000] [--queries 2000] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from log_storage import LogStorage
+
+CONTAINERS = [f"service-{i}" for i in range(8)]
+
+
+class LegacyStorage(LogStorage):
+    """旧版行为：每次读写都新建连接，默认 DELETE 日志模式、FULL 同步"""
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def _reader(self) -> sqlite3.Connection:
+        return _ClosingConnection(self._connect())
+    
+    def _write(self):
+        return _LegacyWrite(self._connect())
+
+
+class _ClosingConnection:
+    """execute 的结果取完后即关闭连接，对应旧代码的 connect/close 配对"""
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+    
+    def execute(self, *args):
+        rows = self.conn.execute(*args).fetchall()
+        self.conn.close()
+        return _Rows(rows)
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+    
+    def fetchall(self):
+        return self.rows
+    
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class _LegacyWrite:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+    
+    def __enter__(self):
+        return self.conn.cursor()
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+        self.conn.close()
+        return False
+
+
+def make_error(rng: random.Random, n: int) -> dict:
+    """生成一条模拟错误"""
+    return {
+        'original': {
+            'line_number': n,
+            'timestamp': datetime.fromtimestamp(1_700_000_000 + n).isoformat(),
+            'timestamp_ms': (1_700_000_000 + n) * 1000,
+            'content': f"ERROR Failed to settle order {rng.randint(0, 10 ** 6)}: code {rng.randint(0, 999)}",
+            'context': [f"\tat com.otc.market.OrderService.settle(OrderService.java:{rng.randint(1, 999)})"] * 5,
+            'level': 'ERROR',
+        }
+    }
+
+
+def bench(name: str, storage: LogStorage, inserts: int, queries: int, seed: int):
+    """写入吞吐 + 查询延迟分位"""
+    rng = random.Random(seed)
+    
+    start = time.perf_counter()
+    for n in range(inserts):
+        storage.save_error(rng.choice(CONTAINERS), make_error(rng, n))
+    insert_elapsed = time.perf_counter() - start
+    
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        if rng.random() < 0.5:
+            storage.get_errors(rng.choice(CONTAINERS), limit=50)
+        else:
+            storage.get_error_by_id(rng.randint(1, inserts))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    
+    print(f"{name:<8} 写入 {inserts / insert_elapsed:>9,.0f} 条/秒 | "
+          f"查询 p50 {percentile(0.5):6.2f} ms  p99 {percentile(0.99):6.2f} ms")
+    return inserts / insert_elapsed, percentile(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志存储性能基准")
+    parser.add_argument("--inserts", type=int, default=5000, help="写入条数")
+    parser.add_argument("--queries", type=int, default=2000, help="查询次数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = LegacyStorage(os.path.join(tmp, "legacy.db"))
+        tuned = LogStorage(os.path.join(tmp, "tuned.db"))
+        print("=" * 60)
+        old_rate, old_p99 = bench("旧存储", legacy, args.inserts, args.queries, args.seed)
+        new_rate, new_p99 = bench("新存储", tuned, args.inserts, args.queries, args.seed)
+        rng = random.Random(args.seed)
+        start = time.perf_counter()
+        tuned.save_errors(CONTAINERS[0], (make_error(rng, n) for n in range(args.inserts)),
+                          log_lines=args.inserts * 100)
+        bulk_rate = args.inserts / (time.perf_counter() - start)
+        print(f"{'批量写入':<6} 写入 {bulk_rate:>9,.0f} 条/秒 (save_errors, 单事务)")
+        print("=" * 60)
+        print(f"写入加速比: {new_rate / old_rate:.1f}x, 查询 p99 降低: {old_p99 / new_p99:.1f}x")
+        tuned.close()
+
+
+if __name__ == "__main__":
+    main()
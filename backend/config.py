@@ -15,3 +15,33 @@ LOCAL_MODEL_CONFIG = {
     "temperature": 0.7,
     "max_tokens": 2000,
 }
+
+# 日志分析模型服务配置（log_api 后台分析使用）；每秒请求数和每分钟 token 数预算按进程计算，0 表示不限制，
+# 单独运行 analysis_worker.py 时各进程共享同一模型服务，预算需要按进程拆分
+ANALYSIS_SERVICE_CONFIG = {
+    "url": os.getenv("AI_SERVICE_URL", "http://172.16.50.103:8000/v1/chat"),
+    "max_concurrency": int(os.getenv("AI_MAX_CONCURRENCY", "8")),
+    "timeout": float(os.getenv("AI_TIMEOUT", "30")),
+    "max_retries": int(os.getenv("AI_MAX_RETRIES", "3")),
+    "requests_per_second": float(os.getenv("AI_REQUESTS_PER_SECOND", "0")),
+    "tokens_per_minute": int(os.getenv("AI_TOKENS_PER_MINUTE", "0")),
+}
+
+# 批量分析配置：每个请求最多打包的错误数（1 表示不打包）和提示词 token 预算
+ANALYSIS_BATCH_CONFIG = {
+    "batch_size": int(os.getenv("AI_BATCH_SIZE", "8")),
+    "batch_token_budget": int(os.getenv("AI_BATCH_TOKENS", "3000")),
+}
+
+# 分析任务队列配置：API 进程内的工作协程数（0 表示不在 API 进程内分析，改为单独运行 analysis_worker.py）、
+# 每次领取的任务数、租约时长（秒）、最大尝试次数和首次重试延迟（秒）；
+# 待分析积压超过 defer_backlog 时只分析 ERROR 及以上的任务，超过 shed_backlog 时丢弃多出的告警级任务
+ANALYSIS_QUEUE_CONFIG = {
+    "workers": int(os.getenv("ANALYSIS_WORKERS", "2")),
+    "lease_size": int(os.getenv("ANALYSIS_LEASE_SIZE", "16")),
+    "visibility_timeout": float(os.getenv("ANALYSIS_VISIBILITY_TIMEOUT", "300")),
+    "max_attempts": int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5")),
+    "retry_delay": float(os.getenv("ANALYSIS_RETRY_DELAY", "30")),
+    "defer_backlog": int(os.getenv("ANALYSIS_DEFER_BACKLOG", "500")),
+    "shed_backlog": int(os.getenv("ANALYSIS_SHED_BACKLOG", "2000")),
+}
@@ -0,0 +1,267 @@
+"""
+模型调用模块 - 异步调用远程分析模型
+
+共享一个保持长连接的 httpx.AsyncClient，用信号量限制同时在途的请求数；
+连接错误、超时、429 和 5xx 按带抖动的指数退避重试，连续失败达到阈值后熔断，
+熔断期间直接失败、不再请求，冷却后放行一个探测请求，成功即恢复；
+可选的每秒请求数和每分钟 token 数预算避免压垮共享的模型服务
+"""
+import asyncio
+import random
+import time
+from typing import Dict, Optional, Tuple
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 可重试的 HTTP 状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 个字符一个 token，其他字符（中文）约一个字符一个 token"""
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+
+class LLMError(Exception):
+    """模型调用失败"""
+
+
+class CircuitOpenError(LLMError):
+    """熔断中，未发出请求"""
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断 reset_timeout 秒，之后半开放行一个探测请求"""
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.trips = 0
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+    
+    def allow(self) -> Tuple[bool, bool]:
+        """返回 (是否放行, 是否为探测请求)；半开状态下同一时间只放行一个探测请求"""
+        state = self.state
+        if state == 'closed':
+            return True, False
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            return True, True
+        return False, False
+    
+    def record_success(self, probe: bool = False):
+        """请求成功；熔断期间只有探测请求的结果能关闭熔断，熔断前发出、此时才返回的请求不算"""
+        if probe:
+            self.probing = False
+            self.opened_at = None
+        if self.opened_at is None:
+            self.failures = 0
+    
+    def release_probe(self):
+        """探测请求未得出结果（被取消）时释放名额，下一个请求可以重新探测"""
+        self.probing = False
+    
+    def record_failure(self, probe: bool = False):
+        """请求失败；探测失败重新熔断，关闭状态下连续失败达到阈值时熔断"""
+        self.failures += 1
+        if probe:
+            self.probing = False
+        elif self.opened_at is not None or self.failures < self.failure_threshold:
+            # 已在熔断中（熔断前发出的请求此时才失败）不影响探测和冷却计时
+            return
+        self.trips += 1
+        self.opened_at = time.monotonic()
+        logger.warning(f"模型服务连续失败 {self.failures} 次，熔断 {self.reset_timeout} 秒")
+
+
+class RateLimiter:
+    """请求数和 token 数双令牌桶：requests_per_second / tokens_per_minute 为 0 表示不限制
+
+    桶容量为一秒的请求数和一分钟的 token 数，允许短时突发；
+    超过整桶容量的单次请求等桶满后放行并透支，后续请求相应等待。
+    等待者按到达顺序排队（asyncio.Lock 公平），不会被后来的小请求插队
+    """
+    
+    def __init__(self, requests_per_second: float = 0, tokens_per_minute: int = 0):
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self._request_capacity = max(requests_per_second, 1)
+        self._requests = self._request_capacity
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._stats = {'throttled': 0, 'wait_seconds': 0.0}
+    
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_second > 0 or self.tokens_per_minute > 0
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_second > 0:
+            self._requests = min(self._request_capacity, self._requests + elapsed * self.requests_per_second)
+        if self.tokens_per_minute > 0:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+    
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_second > 0 and self._requests < 1:
+            wait = (1 - self._requests) / self.requests_per_second
+        if self.tokens_per_minute > 0:
+            needed = min(tokens, self.tokens_per_minute)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+    
+    async def acquire(self, tokens: int):
+        """等待预算足够发出一个约 tokens 个 token 的请求"""
+        if not self.enabled:
+            return
+        async with self._lock:
+            self._refill()
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                self._stats['throttled'] += 1
+                self._stats['wait_seconds'] += wait
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    self._refill()
+                    wait = self._wait_time(tokens)
+            if self.requests_per_second > 0:
+                self._requests -= 1
+            if self.tokens_per_minute > 0:
+                self._tokens -= tokens
+    
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+        stats['requests_per_second'] = self.requests_per_second
+        stats['tokens_per_minute'] = self.tokens_per_minute
+        return stats
+
+
+class LLMClient:
+    """远程模型服务的异步客户端，在事件循环中使用"""
+    
+    def __init__(self, url: str, max_concurrency: int = 8, timeout: float = 30,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8,
+                 breaker: Optional[CircuitBreaker] = None, requests_per_second: float = 0,
+                 tokens_per_minute: int = 0):
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = RateLimiter(requests_per_second, tokens_per_minute)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._stats = {'requests': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'rejected': 0}
+    
+    def _http(self) -> httpx.AsyncClient:
+        # 连接池与并发上限一致，空闲连接保持复用
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+        return self._client
+    
+    def _backoff(self, attempt: int) -> float:
+        """全抖动退避：[0, min(上限, 基数 * 2^attempt)) 内随机"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+    
+    async def complete(self, prompt: str, max_tokens: int = 500, temperature: float = 0.7) -> str:
+        """发送提示词，返回模型回复文本；失败时抛出 LLMError（熔断中为 CircuitOpenError）"""
+        async with self._semaphore:
+            self._in_flight += 1
+            try:
+                return await self._complete(prompt, max_tokens, temperature)
+            finally:
+                self._in_flight -= 1
+    
+    async def _complete(self, prompt: str, max_tokens: int, temperature: float) -> str:
+        payload = {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}
+        # 预算按提示词估算加上回复上限计，每次尝试（含重试）都要占用
+        cost = estimate_tokens(prompt) + max_tokens
+        for attempt in range(self.max_retries + 1):
+            allowed, probe = self.breaker.allow()
+            if not allowed:
+                self._stats['rejected'] += 1
+                raise CircuitOpenError("模型服务熔断中")
+            
+            try:
+                await self.limiter.acquire(cost)
+                self._stats['requests'] += 1
+                response = await self._http().post(self.url, json=payload)
+            except httpx.HTTPError as e:
+                error = LLMError(f"{type(e).__name__}: {e}")
+                retryable = True
+            except BaseException:
+                # 取消（关闭服务、任务被取消）时不会记录成功或失败，半开探测名额必须释放，
+                # 否则熔断器会一直拒绝后续请求
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            else:
+                if response.status_code == 200:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        result = {}
+                    if not isinstance(result, dict) or 'response' not in result:
+                        # 服务可用但返回格式不对，不计入熔断，也不重试
+                        self.breaker.record_success(probe)
+                        self._stats['failed'] += 1
+                        raise LLMError("模型返回中没有 response 字段")
+                    self.breaker.record_success(probe)
+                    self._stats['succeeded'] += 1
+                    return result['response']
+                error = LLMError(f"HTTP {response.status_code}")
+                retryable = response.status_code in RETRY_STATUS
+            
+            if not retryable:
+                # 4xx 说明请求本身有问题，服务是正常的
+                self.breaker.record_success(probe)
+                break
+            self.breaker.record_failure(probe)
+            if attempt < self.max_retries:
+                self._stats['retries'] += 1
+                await asyncio.sleep(self._backoff(attempt))
+        
+        self._stats['failed'] += 1
+        raise error
+    
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['in_flight'] = self._in_flight
+        stats['max_concurrency'] = self.max_concurrency
+        stats['circuit'] = self.breaker.state
+        stats['circuit_trips'] = self.breaker.trips
+        stats['rate_limit'] = self.limiter.stats()
+        return stats
+    
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,315 @@
+"""
+错误分析模块 - 分析提示词、按错误签名的分析结果缓存和批量分析
+
+同一个异常反复出现时，归一化后的错误行和上下文相同，分析结果可以直接复用：
+内存 LRU 在前，SQLite 表持久化（重启后仍然有效），提示词模板变化时升级版本号使旧结果失效。
+未命中缓存的错误在 token 预算内多条打包为一个请求，要求模型返回 JSON 数组，
+解析不出的条目再单独分析
+"""
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from llm_client import LLMClient, LLMError, estimate_tokens
+from log_fingerprint import normalize_message, signature_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 提示词中带上的上下文行数，缓存键使用同样的行
+PROMPT_CONTEXT_LINES = 5
+
+# 修改 ANALYSIS_PROMPT 或 BATCH_PROMPT 后递增，旧版本的缓存结果不再使用
+PROMPT_VERSION = 1
+
+ANALYSIS_PROMPT = """请分析以下错误日志，并提供：
+1. 错误类型和严重程度
+2. 可能的原因
+3. 建议的解决方案
+
+错误日志：
+{error_content}
+
+上下文：
+{context}
+"""
+
+BATCH_PROMPT = """请逐条分析以下 {count} 条错误日志。
+只返回一个 JSON 数组，不要输出其他内容；每条错误对应一个对象，id 为错误编号：
+[{{"id": 1, "severity": "critical|high|medium|low", "cause": "可能的原因", "fix": "建议的解决方案"}}]
+
+{items}"""
+
+BATCH_ITEM = """### 错误 {id}
+错误日志：
+{error_content}
+上下文：
+{context}
+"""
+
+# 批量请求中每条错误预留的回复 token 数
+BATCH_ITEM_MAX_TOKENS = 200
+
+# 单条分析的回复 token 数
+ANALYSIS_MAX_TOKENS = 500
+
+# 分析结果的有效期（秒）
+ANALYSIS_CACHE_TTL = 7 * 86400
+
+
+def build_prompt(error: Dict) -> str:
+    """单个错误的分析提示词"""
+    return ANALYSIS_PROMPT.format(error_content=error['content'], context=_context(error))
+
+
+def _context(error: Dict) -> str:
+    return '\n'.join(error['context'][:PROMPT_CONTEXT_LINES])
+
+
+def build_batch_prompt(errors: List[Dict]) -> str:
+    """多条错误的批量提示词，错误编号从 1 开始"""
+    items = ''.join(
+        BATCH_ITEM.format(id=index, error_content=error['content'], context=_context(error))
+        for index, error in enumerate(errors, 1)
+    )
+    return BATCH_PROMPT.format(count=len(errors), items=items)
+
+
+def plan_batches(items: List[Tuple[str, Dict]], max_items: int, token_budget: int) -> List[List[Tuple[str, Dict]]]:
+    """按顺序把 (key, error) 分成批：每批不超过 max_items 条，提示词估算 token 数不超过 token_budget
+
+    单条就超出预算的错误单独成批（按单条提示词分析）
+    """
+    overhead = estimate_tokens(BATCH_PROMPT.format(count=max_items, items=''))
+    batches = []
+    current = []
+    used = overhead
+    for key, error in items:
+        cost = estimate_tokens(BATCH_ITEM.format(id=len(current) + 1, error_content=error['content'],
+                                                 context=_context(error)))
+        if current and (len(current) >= max_items or used + cost > token_budget):
+            batches.append(current)
+            current = []
+            used = overhead
+        current.append((key, error))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+_JSON_OBJECT = re.compile(r'\{[^{}]*\}')
+
+
+def parse_batch_response(text: str, count: int) -> Dict[int, Dict]:
+    """解析批量分析回复，返回 {错误编号: {severity, cause, fix}}
+
+    先取最外层的 JSON 数组；数组不完整（被截断、混有说明文字）时逐个提取 JSON 对象，
+    编号越界、重复或缺少 cause / fix 的条目丢弃
+    """
+    items = None
+    start, end = text.find('['), text.rfind(']')
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        items = []
+        for match in _JSON_OBJECT.finditer(text):
+            try:
+                items.append(json.loads(match.group()))
+            except ValueError:
+                continue
+    
+    parsed = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            item_id = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        if not 1 <= item_id <= count or item_id in parsed or not item.get('cause') or not item.get('fix'):
+            continue
+        parsed[item_id] = {
+            'severity': str(item.get('severity') or 'unknown').strip().lower(),
+            'cause': str(item['cause']).strip(),
+            'fix': str(item['fix']).strip(),
+        }
+    return parsed
+
+
+def format_batch_item(item: Dict) -> str:
+    """批量分析的结构化结果转为分析文本"""
+    return f"严重程度: {item['severity']}\n可能原因: {item['cause']}\n解决方案: {item['fix']}"
+
+
+def analysis_key(error: Dict) -> str:
+    """分析缓存键：归一化后的错误行加提示词中的上下文行
+
+    与问题指纹不同，上下文不只取栈帧：提示词里的每一行都会影响分析结果
+    """
+    lines = [normalize_message(error.get('content') or '')]
+    lines.extend(normalize_message(line) for line in (error.get('context') or [])[:PROMPT_CONTEXT_LINES])
+    return signature_fingerprint('\n'.join(lines))
+
+
+class AnalysisCache:
+    """分析结果缓存：内存 LRU + SQLite（通过 AsyncLogStorage 访问）"""
+    
+    def __init__(self, db, max_entries: int = 1024, ttl: float = ANALYSIS_CACHE_TTL,
+                 prompt_version: int = PROMPT_VERSION):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prompt_version = prompt_version
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._stats = {'lookups': 0, 'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0}
+    
+    def _fresh(self, entry: Dict) -> bool:
+        return time.time() * 1000 - entry['created_ms'] < self.ttl * 1000
+    
+    def _remember(self, key: str, entry: Dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def get_many(self, keys: List[str]) -> Dict[str, Dict]:
+        """批量查找，返回命中的 {key: {analysis, analyzed_at}}；内存未命中的键一次查询数据库"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            self._stats['lookups'] += 1
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry):
+                self._entries.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                found[key] = entry
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                missing.append(key)
+        
+        if missing:
+            rows = await self.db.get_cached_analyses(missing, self.prompt_version)
+            for key in missing:
+                entry = rows.get(key)
+                if entry is None:
+                    self._stats['misses'] += 1
+                elif not self._fresh(entry):
+                    self._stats['expired'] += 1
+                    self._stats['misses'] += 1
+                else:
+                    self._stats['db_hits'] += 1
+                    self._remember(key, entry)
+                    found[key] = entry
+        
+        return {key: {'analysis': entry['analysis'], 'analyzed_at': entry['analyzed_at']}
+                for key, entry in found.items()}
+    
+    async def put(self, key: str, analysis: str, analyzed_at: Optional[str] = None):
+        """保存一条成功的分析结果（失败的分析不要缓存）"""
+        analyzed_at = analyzed_at or datetime.now().isoformat()
+        self._remember(key, {'analysis': analysis, 'analyzed_at': analyzed_at, 'created_ms': int(time.time() * 1000)})
+        self._stats['stores'] += 1
+        await self.db.save_cached_analysis(key, self.prompt_version, analysis, analyzed_at)
+    
+    def stats(self) -> Dict:
+        """命中统计：hit_rate 为命中次数 / 查找次数"""
+        stats = dict(self._stats)
+        hits = stats['memory_hits'] + stats['db_hits']
+        stats['hit_rate'] = round(hits / stats['lookups'], 4) if stats['lookups'] else 0
+        stats['memory_entries'] = len(self._entries)
+        stats['prompt_version'] = self.prompt_version
+        return stats
+
+
+class ErrorAnalyzer:
+    """错误分析流程：缓存 -> 批量请求 -> 解析失败的条目单独请求
+
+    batch_size 为 1 时不打包，每条错误单独请求
+    """
+    
+    def __init__(self, client: LLMClient, cache: AnalysisCache,
+                 batch_size: int = 8, batch_token_budget: int = 3000):
+        self.client = client
+        self.cache = cache
+        self.batch_size = batch_size
+        self.batch_token_budget = batch_token_budget
+        self._stats = {'analyzed': 0, 'model_calls': 0, 'batches': 0, 'batched_items': 0,
+                       'fallback_items': 0, 'failed_items': 0, 'prompt_tokens': 0}
+    
+    async def analyze(self, errors: List[Dict]) -> List[Dict]:
+        """分析一批错误，按顺序返回 {analysis, analyzed_at}；失败的条目带 failed，analysis 为失败原因
+
+        签名相同的错误（缓存中已有、或本批中重复出现）只分析一次
+        """
+        keys = [analysis_key(error) for error in errors]
+        known = await self.cache.get_many(keys)
+        pending = {}
+        for error, key in zip(errors, keys):
+            if key not in known and key not in pending:
+                pending[key] = error
+        
+        batches = plan_batches(list(pending.items()), max(self.batch_size, 1), self.batch_token_budget)
+        for results in await asyncio.gather(*(self._analyze_batch(batch) for batch in batches)):
+            known.update(results)
+        self._stats['analyzed'] += len(errors)
+        return [known[key] for key in keys]
+    
+    async def _call(self, prompt: str, max_tokens: int) -> str:
+        self._stats['model_calls'] += 1
+        self._stats['prompt_tokens'] += estimate_tokens(prompt)
+        return await self.client.complete(prompt, max_tokens=max_tokens)
+    
+    async def _store(self, key: str, analysis: str) -> Dict:
+        result = {'analysis': analysis, 'analyzed_at': datetime.now().isoformat()}
+        await self.cache.put(key, analysis, result['analyzed_at'])
+        return result
+    
+    async def _analyze_one(self, key: str, error: Dict) -> Tuple[str, Dict]:
+        try:
+            analysis = await self._call(build_prompt(error), ANALYSIS_MAX_TOKENS)
+        except LLMError as e:
+            self._stats['failed_items'] += 1
+            return key, {'analysis': f"AI分析失败: {str(e)}", 'analyzed_at': datetime.now().isoformat(),
+                         'failed': True}
+        return key, await self._store(key, analysis)
+    
+    async def _analyze_batch(self, items: List[Tuple[str, Dict]]) -> Dict[str, Dict]:
+        if len(items) == 1:
+            return dict([await self._analyze_one(*items[0])])
+        
+        self._stats['batches'] += 1
+        prompt = build_batch_prompt([error for _, error in items])
+        try:
+            parsed = parse_batch_response(await self._call(prompt, BATCH_ITEM_MAX_TOKENS * len(items)), len(items))
+        except LLMError as e:
+            # 请求本身失败（重试用尽或熔断），逐条重发只会加重负担
+            self._stats['failed_items'] += len(items)
+            failed = {'analysis': f"AI分析失败: {str(e)}", 'analyzed_at': datetime.now().isoformat(),
+                      'failed': True}
+            return {key: failed for key, _ in items}
+        
+        results = {}
+        fallback = []
+        for index, (key, error) in enumerate(items, 1):
+            if index in parsed:
+                results[key] = await self._store(key, format_batch_item(parsed[index]))
+            else:
+                fallback.append((key, error))
+        self._stats['batched_items'] += len(items) - len(fallback)
+        if fallback:
+            logger.warning(f"批量分析回复中有 {len(fallback)}/{len(items)} 条无法解析，改为单条分析")
+            self._stats['fallback_items'] += len(fallback)
+            results.update(await asyncio.gather(*(self._analyze_one(key, error) for key, error in fallback)))
+        return results
+    
+    def stats(self) -> Dict:
+        return dict(self._stats)
@@ -1,19 +1,30 @@
 """
 日志监控API - 提供日志采集和查询接口
 """
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, AsyncIterator
 import asyncio
+import json
 import logging
-import requests
-from datetime import datetime
-
-from log_collector import LogCollector, LogAnalyzer
+import time
+
+from async_storage import AsyncLogStorage
+from analysis_worker import AnalysisWorker
+from config import ANALYSIS_BATCH_CONFIG, ANALYSIS_QUEUE_CONFIG, ANALYSIS_SERVICE_CONFIG
+from llm_client import LLMClient
+from log_analysis import AnalysisCache, ErrorAnalyzer
+from log_archive import RawLogArchive
+from log_collector import LogCollector, LogAnalyzer, DockerLogCursor
+from log_follower import LogFollowManager
+from log_parser import PROFILES, get_profile
+from log_retention import RetentionJob
 from log_storage import LogStorage
 from qwen_agent import QwenAgent
 from server_config import ServerConfigManager
+from ssh_pool import ssh_pool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,9 +40,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局存储
+# 全局存储：请求处理中通过 db 异步访问，后台线程（跟随、数据保留）直接使用 storage
 storage = LogStorage()
+db = AsyncLogStorage(storage)
+# 按错误签名缓存的 AI 分析结果
+analysis_cache = AnalysisCache(db)
+# 分析模型客户端：连接池复用、并发上限、重试与熔断
+llm_client = LLMClient(**ANALYSIS_SERVICE_CONFIG)
+analyzer = ErrorAnalyzer(llm_client, analysis_cache, **ANALYSIS_BATCH_CONFIG)
+# 分析任务工作池：workers 为 0 时由单独运行的 analysis_worker.py 处理队列
+analysis_worker = AnalysisWorker(db, analyzer, **ANALYSIS_QUEUE_CONFIG)
 config_manager = ServerConfigManager()
+follow_manager = LogFollowManager(storage)
+# 原始日志归档：增量采集到的日志按容器追加保存，错误记录其归档位置
+raw_archive = RawLogArchive()
+retention_job = RetentionJob(storage, raw_archive=raw_archive)
 
 
 class SSHConfig(BaseModel):
@@ -47,6 +70,10 @@ class CollectRequest(BaseModel):
     container_name: str
     lines: int = 1000
     analyze: bool = True
+    incremental: bool = True
+    prefilter: bool = False
+    compress: Optional[str] = None
+    profile: Optional[str] = None
 
 
 class CollectByConfigRequest(BaseModel):
@@ -54,6 +81,28 @@ class CollectByConfigRequest(BaseModel):
     container_name: str
     lines: int = 1000
     analyze: bool = True
+    incremental: bool = True
+    prefilter: bool = False
+    compress: Optional[str] = None
+    profile: Optional[str] = None
+
+
+class CollectAllRequest(BaseModel):
+    config_ids: Optional[List[int]] = None
+    lines: int = 1000
+    analyze: bool = True
+    incremental: bool = True
+    prefilter: bool = False
+    compress: Optional[str] = None
+    max_concurrency: int = 9
+    max_per_host: int = 3
+    stream: bool = True
+
+
+class FollowRequest(BaseModel):
+    config_id: int
+    container_name: str
+    profile: Optional[str] = None
 
 
 class ServerConfigCreate(BaseModel):
@@ -64,10 +113,11 @@ class ServerConfigCreate(BaseModel):
     password: Optional[str] = None
     key_file: Optional[str] = None
     containers: Optional[List[str]] = None
+    profiles: Optional[Dict[str, str]] = None
 
 
 @app.post("/api/collect")
-async def collect_logs(request: CollectRequest, background_tasks: BackgroundTasks):
+async def collect_logs(request: CollectRequest):
     """采集Docker容器日志"""
     try:
         # 创建采集器
@@ -76,134 +126,273 @@ async def collect_logs(request: CollectRequest, background_tasks: BackgroundTask
             port=request.ssh_config.port,
             username=request.ssh_config.username,
             password=request.ssh_config.password,
-            key_file=request.ssh_config.key_file
+            key_file=request.ssh_config.key_file,
+            pool=ssh_pool
         )
         
-        # 连接SSH
-        if not collector.connect():
+        # 连接SSH（SSH 与解析都在工作线程中执行，不阻塞事件循环）
+        if not await asyncio.to_thread(collector.connect):
             raise HTTPException(status_code=500, detail="SSH连接失败")
         
-        # 获取日志
-        logs = collector.get_docker_logs(request.container_name, request.lines)
-        
-        # 解析错误
-        errors = collector.parse_error_logs(logs)
-        
-        collector.disconnect()
-        
-        # 如果需要AI分析，在后台执行
-        if request.analyze and errors:
-            background_tasks.add_task(
-                analyze_and_save_errors,
-                request.container_name,
-                errors
+        try:
+            errors, log_lines, cursor, transfer, raw_next_line = await asyncio.to_thread(
+                run_collection,
+                collector, request.container_name, request.lines,
+                request.incremental, request.prefilter, request.compress, request.profile
             )
-        else:
-            # 直接保存未分析的错误
-            for error in errors:
-                storage.save_error(request.container_name, {'original': error})
+        finally:
+            collector.disconnect()
         
-        # 保存采集历史
-        storage.save_collection_history(
-            request.container_name,
-            request.lines,
-            len(errors)
+        return await save_collection_result(
+            collector.host, request.container_name, errors, log_lines, cursor,
+            request.analyze, transfer, raw_next_line
         )
         
+    except Exception as e:
+        logger.error(f"采集日志失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def create_collector(config: dict) -> LogCollector:
+    """根据保存的服务器配置创建采集器，SSH连接来自全局连接池"""
+    return LogCollector(
+        host=config["host"],
+        port=config["port"],
+        username=config["username"],
+        password=config.get("password"),
+        key_file=config.get("key_file"),
+        pool=ssh_pool
+    )
+
+
+def container_profile(config: dict, container_name: str) -> Optional[str]:
+    """服务器配置中为容器指定的解析器配置名称"""
+    return (config.get("profiles") or {}).get(container_name)
+
+
+def run_collection(collector: LogCollector, container_name: str, lines: int,
+                   incremental: bool = True, prefilter: bool = False,
+                   compress: Optional[str] = None, profile: Optional[str] = None):
+    """采集并解析日志，返回 (错误列表, 实际采集行数, 新游标, 传输统计, 归档位置)
+
+    增量模式下从上次的游标继续采集，只解析新增的日志；
+    预筛选模式下在远程用 grep 过滤，只传回候选错误行及其上下文；
+    压缩模式（gzip / zstd / auto）下远程压缩传输，边解压边解析，预筛选优先于压缩；
+    profile 指定解析器配置（json / java / python / nginx），结构化配置不支持预筛选；
+    增量采集（预筛选除外）的日志同时追加到原始日志归档，错误带上 raw_segment / raw_line；
+    归档位置（写完后的下一行行号，未写归档时为 None）需随游标一起入库
+    """
+    collector.configure_parser(container_name, profile)
+    if prefilter and not collector.profile.supports_prefilter:
+        logger.info(f"解析器配置 {collector.profile.name} 不支持远程预筛选，改为完整传输")
+        prefilter = False
+    
+    since = storage.get_collection_cursor(collector.host, container_name) if incremental else None
+    
+    if prefilter:
+        numbered, log_lines, cursor = collector.get_prefiltered_docker_logs(
+            container_name, lines, since, incremental
+        )
+        errors = list(collector.iter_numbered_error_logs(numbered))
+        return errors, log_lines, cursor, None, None
+    
+    if compress:
+        transfer = {}
+        log_cursor = DockerLogCursor(since)
+        raw_lines = collector.iter_compressed_docker_logs(
+            container_name, lines, since, compress, stats=transfer
+        )
+        messages = log_cursor.iter_messages(raw_lines)
+        if not incremental:
+            return list(collector.iter_error_logs(messages)), log_cursor.line_count, None, transfer, None
+        with raw_archive.writer(collector.host, container_name, archive_timestamp(collector),
+                                storage.get_raw_next_line(collector.host, container_name)) as writer:
+            errors = list(collector.iter_error_logs(archived_lines(messages, writer)))
+        link_raw_lines(collector.host, container_name, errors, writer.first_line)
+        return errors, log_cursor.line_count, log_cursor.cursor, transfer, writer.next_line
+    
+    cursor = None
+    if incremental:
+        logs, cursor = collector.get_docker_logs_since(container_name, since, lines)
+    else:
+        logs = collector.get_docker_logs(container_name, lines)
+    
+    errors = collector.parse_error_logs(logs) if logs else []
+    log_lines = logs.count('\n') + 1 if logs else 0
+    raw_next_line = None
+    if incremental and logs:
+        with raw_archive.writer(collector.host, container_name, archive_timestamp(collector),
+                                storage.get_raw_next_line(collector.host, container_name)) as writer:
+            for line in logs.split('\n'):
+                writer.add(line)
+        link_raw_lines(collector.host, container_name, errors, writer.first_line)
+        raw_next_line = writer.next_line
+    return errors, log_lines, cursor, None, raw_next_line
+
+
+def archive_timestamp(collector: LogCollector):
+    """归档块的首个时间戳（epoch 毫秒），用于按时间定位原始日志"""
+    return lambda line: collector.timestamps.extract(line)[1]
+
+
+def archived_lines(lines, writer):
+    """边解析边归档，空闲标记 None 不归档"""
+    for line in lines:
+        if line is not None:
+            writer.add(line)
+        yield line
+
+
+def link_raw_lines(host: str, container_name: str, errors: List[dict], first_line: Optional[int]):
+    """错误行号换算为归档行号：本次采集的第 1 行对应 host 上该容器归档的第 first_line 行"""
+    if first_line is None:
+        return
+    for error in errors:
+        raw_line = first_line + error['line_number'] - 1
+        error['raw_line'] = raw_line
+        error['raw_segment'] = raw_archive.segment_of(host, container_name, raw_line)
+        error['raw_host'] = host
+
+
+async def save_collection_result(host: str, container_name: str, errors: List[dict],
+                                 log_lines: int, cursor: Optional[str], analyze: bool,
+                                 transfer: Optional[dict] = None,
+                                 raw_next_line: Optional[int] = None) -> dict:
+    """保存采集结果、采集历史和增量游标
+
+    错误、采集历史、增量游标和分析任务在同一事务中写入，中途失败时游标不前进，
+    下次从原处重新采集而不会重复入库，已写入原始日志归档的行也会在下次采集前截掉；需要 AI 分析时由分析工作池从队列领取，
+    服务重启不会丢失待分析的错误
+    """
+    await db.save_errors(
+        container_name,
+        ({'original': error} for error in errors),
+        log_lines=log_lines,
+        enqueue_analysis=analyze,
+        collection_cursor=(host, cursor) if cursor else None,
+        raw_next_line=raw_next_line
+    )
+    
+    return {
+        "success": True,
+        "message": f"成功采集 {len(errors)} 个错误",
+        "error_count": len(errors),
+        "log_lines": log_lines,
+        "transfer": transfer,
+        "analyzing": analyze
+    }
+
+
+@app.get("/api/analysis")
+async def get_analysis_stats():
+    """获取分析缓存命中、批量分析、模型调用和工作池统计"""
+    return {
+        "success": True,
+        "data": {
+            "cache": analysis_cache.stats(),
+            "analyzer": analyzer.stats(),
+            "model": llm_client.stats(),
+            "worker": analysis_worker.stats()
+        }
+    }
+
+
+@app.get("/api/analysis/jobs")
+async def get_analysis_jobs():
+    """获取分析队列进度：各状态任务数、各优先级积压、最早待处理任务的等待时长、最近的失败和工作池状态"""
+    try:
         return {
             "success": True,
-            "message": f"成功采集 {len(errors)} 个错误",
-            "error_count": len(errors),
-            "analyzing": request.analyze
+            "data": {
+                **await db.get_analysis_job_stats(),
+                "worker": analysis_worker.stats()
+            }
         }
-        
     except Exception as e:
-        logger.error(f"采集日志失败: {e}")
+        logger.error(f"获取分析队列状态失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def analyze_and_save_errors(container_name: str, errors: List[dict]):
-    """后台任务：分析并保存错误"""
+@app.post("/api/analysis/jobs/retry")
+async def retry_analysis_jobs():
+    """把最终失败和因积压被丢弃的分析任务重新排队"""
     try:
-        # 使用远程 Qwen API
-        import requests
-        
-        # 远程模型服务地址
-        AI_SERVICE_URL = "http://172.16.50.103:8000/v1/chat"
-        
-        for error in errors:
-            error_content = error['content']
-            context = '\n'.join(error['context'][:5])  # 取前5行上下文
-            
-            prompt = f"""请分析以下错误日志，并提供：
-1. 错误类型和严重程度
-2. 可能的原因
-3. 建议的解决方案
-
-错误日志：
-{error_content}
-
-上下文：
-{context}
-"""
-            
-            try:
-                # 调用远程AI服务
-                response = requests.post(
-                    AI_SERVICE_URL,
-                    json={
-                        "prompt": prompt,
-                        "max_tokens": 500,
-                        "temperature": 0.7
-                    },
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    analysis = result.get('response', '分析失败')
-                else:
-                    analysis = f"AI分析失败: HTTP {response.status_code}"
-                    
-            except Exception as e:
-                analysis = f"AI分析失败: {str(e)}"
-            
-            analyzed = {
-                'original': error,
-                'analysis': analysis,
-                'analyzed_at': datetime.now().isoformat()
-            }
-            storage.save_error(container_name, analyzed)
-        
-        logger.info(f"完成 {len(errors)} 个错误的分析")
+        count = await db.retry_failed_analysis_jobs()
+        return {
+            "success": True,
+            "message": f"已重新排队 {count} 个分析任务",
+            "count": count
+        }
     except Exception as e:
-        logger.error(f"分析错误失败: {e}")
+        logger.error(f"重试分析任务失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/errors")
 async def get_errors(
     container_name: Optional[str] = None,
     status: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    order_by: str = 'created_at',
+    cursor: Optional[str] = None
 ):
-    """获取错误日志列表"""
+    """获取错误日志列表（摘要）
+
+    只返回列表列和内容预览，完整上下文和分析结果通过 /api/errors/{id} 获取；
+    把返回的 next_cursor 作为 cursor 传入即可取下一页
+    """
     try:
-        errors = storage.get_errors(container_name, status, limit)
+        errors = await db.get_errors(container_name, status, limit, start_ms, end_ms, order_by,
+                                     cursor=cursor, summary=True)
+        next_cursor = storage.page_cursor(errors[-1], order_by) if errors and len(errors) == limit else None
         return {
             "success": True,
             "data": errors,
-            "count": len(errors)
+            "count": len(errors),
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取错误列表失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/errors/search")
+async def search_errors(
+    q: str,
+    container_name: Optional[str] = None,
+    status: Optional[str] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    order_by: str = 'rank',
+    limit: int = 50
+):
+    """全文检索错误内容、上下文和分析结果
+
+    多个词之间为 AND，每个词按子串匹配（至少 3 个字符）；命中部分以 <mark> 标记
+    """
+    try:
+        results = await db.search_errors(q, container_name, status, start_ms, end_ms, order_by, limit)
+        return {
+            "success": True,
+            "data": results,
+            "count": len(results)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"检索错误失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/errors/{error_id}")
 async def get_error_detail(error_id: int):
     """获取错误详情"""
     try:
-        error = storage.get_error_by_id(error_id)
+        error = await db.get_error_by_id(error_id)
         if not error:
             raise HTTPException(status_code=404, detail="错误不存在")
         
@@ -218,15 +407,95 @@ async def get_error_detail(error_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 一次最多返回的原始日志行数（前后合计）
+RAW_LINES_LIMIT = 2000
+
+
+def check_raw_window(before: int, after: int):
+    if before < 0 or after < 0 or before + after > RAW_LINES_LIMIT:
+        raise HTTPException(status_code=400, detail=f"before / after 不能为负，合计不超过 {RAW_LINES_LIMIT} 行")
+
+
+@app.get("/api/errors/{error_id}/raw")
+async def get_error_raw_lines(error_id: int, before: int = 50, after: int = 50):
+    """从原始日志归档读取错误前后各若干行，不需要重新连接服务器"""
+    check_raw_window(before, after)
+    try:
+        error = await db.get_error_by_id(error_id)
+        if not error:
+            raise HTTPException(status_code=404, detail="错误不存在")
+        if error.get('raw_line') is None or not error.get('raw_host'):
+            raise HTTPException(status_code=404, detail="该错误没有原始日志归档")
+        
+        lines = await asyncio.to_thread(
+            raw_archive.read_lines, error['raw_host'], error['container_name'], error['raw_line'], before, after
+        )
+        if lines is None:
+            raise HTTPException(status_code=404, detail="原始日志归档不存在")
+        return {
+            "success": True,
+            "data": {
+                "host": error['raw_host'],
+                "container_name": error['container_name'],
+                "segment": error.get('raw_segment'),
+                "line": error['raw_line'],
+                "lines": lines
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"读取原始日志失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/raw/{host}/{container_name}")
+async def get_raw_lines(
+    host: str,
+    container_name: str,
+    line: Optional[int] = None,
+    timestamp_ms: Optional[int] = None,
+    before: int = 50,
+    after: int = 50
+):
+    """按归档行号或时间戳（精确到归档块）读取主机上某个容器的原始日志"""
+    check_raw_window(before, after)
+    if line is None and timestamp_ms is None:
+        raise HTTPException(status_code=400, detail="需要指定 line 或 timestamp_ms")
+    try:
+        if line is None:
+            line = await asyncio.to_thread(raw_archive.line_at_timestamp, host, container_name, timestamp_ms)
+            if line is None:
+                raise HTTPException(status_code=404, detail="该时间没有原始日志归档")
+        
+        lines = await asyncio.to_thread(raw_archive.read_lines, host, container_name, line, before, after)
+        if lines is None:
+            raise HTTPException(status_code=404, detail="原始日志归档不存在")
+        return {
+            "success": True,
+            "data": {
+                "host": host,
+                "container_name": container_name,
+                "line": line,
+                "lines": lines
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"读取原始日志失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 class StatusUpdate(BaseModel):
     status: str
 
 
 @app.put("/api/errors/{error_id}/status")
 async def update_error_status(error_id: int, update: StatusUpdate):
-    """更新错误状态"""
+    """更新错误状态（作用于错误所属问题的所有样本）"""
     try:
-        storage.update_error_status(error_id, update.status)
+        await db.update_error_status(error_id, update.status)
         return {
             "success": True,
             "message": "状态更新成功"
@@ -236,11 +505,86 @@ async def update_error_status(error_id: int, update: StatusUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/issues")
+async def get_issues(
+    container_name: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 100
+):
+    """获取按指纹聚合的问题列表"""
+    try:
+        issues = await db.get_issues(container_name, status, limit)
+        return {
+            "success": True,
+            "data": issues,
+            "count": len(issues)
+        }
+    except Exception as e:
+        logger.error(f"获取问题列表失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/issues/{issue_id}")
+async def get_issue_detail(issue_id: int):
+    """获取问题详情及错误样本"""
+    try:
+        issue = await db.get_issue_by_id(issue_id)
+        if not issue:
+            raise HTTPException(status_code=404, detail="问题不存在")
+        
+        return {
+            "success": True,
+            "data": issue
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取问题详情失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.put("/api/issues/{issue_id}/status")
+async def update_issue_status(issue_id: int, update: StatusUpdate):
+    """更新问题状态"""
+    try:
+        await db.update_issue_status(issue_id, update.status)
+        return {
+            "success": True,
+            "message": "状态更新成功"
+        }
+    except Exception as e:
+        logger.error(f"更新状态失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/stats")
+async def get_stats(
+    granularity: str = 'hour',
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    container_name: Optional[str] = None,
+    group_by: str = 'container'
+):
+    """按时间分桶的错误计数（minute / hour / day），group_by 为 container / severity / fingerprint"""
+    try:
+        stats = await db.get_stats(granularity, start_ms, end_ms, container_name, group_by)
+        return {
+            "success": True,
+            "data": stats,
+            "count": len(stats)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"获取错误统计失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/history")
 async def get_collection_history(limit: int = 50):
     """获取采集历史"""
     try:
-        history = storage.get_collection_history(limit)
+        history = await db.get_collection_history(limit)
         return {
             "success": True,
             "data": history
@@ -252,8 +596,8 @@ async def get_collection_history(limit: int = 50):
 
 @app.get("/api/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "ok"}
+    """健康检查，附带存储写队列和组提交统计"""
+    return {"status": "ok", "storage": db.stats()}
 
 
 # ========== 服务器配置管理 ==========
@@ -283,7 +627,8 @@ async def create_config(config: ServerConfigCreate):
             username=config.username,
             password=config.password,
             key_file=config.key_file,
-            containers=config.containers
+            containers=config.containers,
+            profiles=config.profiles
         )
         return {
             "success": True,
@@ -295,6 +640,39 @@ async def create_config(config: ServerConfigCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.put("/api/configs/{config_id}/profiles")
+async def update_config_profiles(config_id: int, profiles: Dict[str, str]):
+    """设置配置下各容器使用的解析器配置"""
+    try:
+        for name in profiles.values():
+            get_profile(name)
+        if not config_manager.update_config(config_id, profiles=profiles):
+            raise HTTPException(status_code=404, detail="配置不存在")
+        return {
+            "success": True,
+            "message": "解析器配置更新成功"
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"更新解析器配置失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/profiles")
+async def get_profiles():
+    """获取可用的解析器配置"""
+    return {
+        "success": True,
+        "data": [
+            {"name": name, "supports_prefilter": profile.supports_prefilter}
+            for name, profile in PROFILES.items()
+        ]
+    }
+
+
 @app.delete("/api/configs/{config_id}")
 async def delete_config(config_id: int):
     """删除服务器配置"""
@@ -310,7 +688,7 @@ async def delete_config(config_id: int):
 
 
 @app.post("/api/collect-by-config")
-async def collect_logs_by_config(request: CollectByConfigRequest, background_tasks: BackgroundTasks):
+async def collect_logs_by_config(request: CollectByConfigRequest):
     """使用保存的配置采集日志"""
     try:
         # 获取配置
@@ -319,59 +697,278 @@ async def collect_logs_by_config(request: CollectByConfigRequest, background_tas
             raise HTTPException(status_code=404, detail="配置不存在")
         
         # 创建采集器
-        collector = LogCollector(
-            host=config["host"],
-            port=config["port"],
-            username=config["username"],
-            password=config.get("password"),
-            key_file=config.get("key_file")
-        )
+        collector = create_collector(config)
         
-        # 连接SSH
-        if not collector.connect():
-            raise HTTPException(status_code=500, detail="SSH��接失败")
+        # 连接SSH（SSH 与解析都在工作线程中执行，不阻塞事件循环）
+        if not await asyncio.to_thread(collector.connect):
+            raise HTTPException(status_code=500, detail="SSH连接失败")
         
-        # 获取日志
-        logs = collector.get_docker_logs(request.container_name, request.lines)
+        try:
+            errors, log_lines, cursor, transfer, raw_next_line = await asyncio.to_thread(
+                run_collection,
+                collector, request.container_name, request.lines,
+                request.incremental, request.prefilter, request.compress,
+                request.profile or container_profile(config, request.container_name)
+            )
+        finally:
+            collector.disconnect()
         
-        # 解析错误
-        errors = collector.parse_error_logs(logs)
+        return await save_collection_result(
+            collector.host, request.container_name, errors, log_lines, cursor,
+            request.analyze, transfer, raw_next_line
+        )
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"采集日志失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+# ========== 批量采集 ==========
+
+def collect_target(config: dict, container_name: str, lines: int, incremental: bool,
+                   prefilter: bool = False, compress: Optional[str] = None):
+    """在工作线程中采集单个 配置×容器，返回 run_collection 的结果"""
+    collector = create_collector(config)
+    if not collector.connect():
+        raise Exception("SSH连接失败")
+    try:
+        return run_collection(
+            collector, container_name, lines, incremental, prefilter, compress,
+            container_profile(config, container_name)
+        )
+    finally:
         collector.disconnect()
+
+
+async def iter_collect_all(configs: List[dict], lines: int, analyze: bool, incremental: bool,
+                           max_concurrency: int = 9,
+                           max_per_host: int = 3, prefilter: bool = False,
+                           compress: Optional[str] = None) -> AsyncIterator[Dict]:
+    """并发采集所有 配置×容器，按完成顺序逐个产出结果
+
+    总并发和单台主机的并发分别受限，单个目标失败只记录在自己的结果里，不影响其他目标
+    """
+    overall = asyncio.Semaphore(max(max_concurrency, 1))
+    per_host: Dict[tuple, asyncio.Semaphore] = {}
+    
+    async def run_target(config: dict, container_name: str) -> Dict:
+        host_key = (config["host"], config["port"])
+        host_limit = per_host.setdefault(host_key, asyncio.Semaphore(max(max_per_host, 1)))
+        result = {
+            "config_id": config["id"],
+            "config_name": config["name"],
+            "host": config["host"],
+            "container_name": container_name
+        }
+        started = time.monotonic()
+        try:
+            async with overall, host_limit:
+                errors, log_lines, cursor, transfer, raw_next_line = await asyncio.to_thread(
+                    collect_target, config, container_name, lines, incremental, prefilter, compress
+                )
+            result.update(await save_collection_result(
+                config["host"], container_name, errors, log_lines, cursor,
+                analyze, transfer, raw_next_line
+            ))
+        except Exception as e:
+            logger.error(f"采集 {config['name']}/{container_name} 失败: {e}")
+            result.update({"success": False, "error": str(e)})
+        result["elapsed"] = round(time.monotonic() - started, 3)
+        return result
+    
+    tasks = [
+        asyncio.create_task(run_target(config, container_name))
+        for config in configs
+        for container_name in config.get("containers") or []
+    ]
+    for task in asyncio.as_completed(tasks):
+        yield await task
+
+
+@app.post("/api/collect-all")
+async def collect_all(request: CollectAllRequest):
+    """并发采集所有保存的服务器配置下的所有容器
+
+    stream 为 True 时以 NDJSON 逐行返回每个目标的结果，最后一行为汇总
+    """
+    if request.config_ids:
+        configs = [config_manager.get_config(config_id) for config_id in request.config_ids]
+        missing = [cid for cid, config in zip(request.config_ids, configs) if not config]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"配置不存在: {missing}")
+    else:
+        configs = list(config_manager.configs)
+    
+    results = iter_collect_all(
+        configs, request.lines, request.analyze, request.incremental,
+        request.max_concurrency, request.max_per_host, request.prefilter, request.compress
+    )
+    started = time.monotonic()
+    
+    def summary(succeeded: int, failed: int) -> Dict:
+        return {
+            "done": True,
+            "total": succeeded + failed,
+            "succeeded": succeeded,
+            "failed": failed,
+            "elapsed": round(time.monotonic() - started, 3)
+        }
+    
+    if request.stream:
+        async def ndjson() -> AsyncIterator[str]:
+            succeeded = failed = 0
+            async for result in results:
+                if result.get("success"):
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+            yield json.dumps(summary(succeeded, failed), ensure_ascii=False) + "\n"
         
-        # 如果需要AI分析，在后台执行
-        if request.analyze and errors:
-            background_tasks.add_task(
-                analyze_and_save_errors,
-                request.container_name,
-                errors
-            )
-        else:
-            # 直接保存未分析的错误
-            for error in errors:
-                storage.save_error(request.container_name, {'original': error})
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    succeeded_results, failed_results = [], []
+    async for result in results:
+        (succeeded_results if result.get("success") else failed_results).append(result)
+    return {
+        "success": True,
+        "data": succeeded_results,
+        "failed": failed_results,
+        **summary(len(succeeded_results), len(failed_results))
+    }
+
+
+# ========== 日志跟随 ==========
+
+@app.post("/api/follow")
+async def start_follow(request: FollowRequest):
+    """开始跟随容器日志，实时解析并保存错误"""
+    try:
+        config = config_manager.get_config(request.config_id)
+        if not config:
+            raise HTTPException(status_code=404, detail="配置不存在")
         
-        # 保存采集历史
-        storage.save_collection_history(
+        collector = create_collector(config)
+        collector.configure_parser(
             request.container_name,
-            request.lines,
-            len(errors)
+            request.profile or container_profile(config, request.container_name)
         )
-        
+        follower = follow_manager.start(collector, request.container_name)
         return {
             "success": True,
-            "message": f"成功采集 {len(errors)} 个错误",
-            "error_count": len(errors),
-            "analyzing": request.analyze
+            "data": follower
         }
-        
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"采集日志失败: {e}")
+        logger.error(f"开始跟随失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/follow")
+async def list_follows():
+    """获取所有跟随任务"""
+    return {
+        "success": True,
+        "data": follow_manager.list()
+    }
+
+
+@app.delete("/api/follow/{follow_id}")
+async def stop_follow(follow_id: int):
+    """停止跟随任务"""
+    if not follow_manager.stop(follow_id):
+        raise HTTPException(status_code=404, detail="跟随任务不存在")
+    return {
+        "success": True,
+        "message": "已停止跟随"
+    }
+
+
+@app.get("/api/ssh-pool")
+async def get_ssh_pool_stats():
+    """获取SSH连接池状态"""
+    return {
+        "success": True,
+        "data": ssh_pool.stats()
+    }
+
+
+class RetentionUpdate(BaseModel):
+    retention_days: Optional[int] = None
+
+
+@app.get("/api/retention")
+async def get_retention():
+    """获取保留期配置、归档分区、原始日志归档和最近一次清理结果"""
+    try:
+        return {
+            "success": True,
+            "data": {
+                "policies": await db.get_retention_policies(),
+                "job": retention_job.to_dict(),
+                "storage": await db.storage_stats(),
+                "raw_archive": await asyncio.to_thread(raw_archive.all_stats)
+            }
+        }
+    except Exception as e:
+        logger.error(f"获取保留期配置失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.put("/api/retention/{container_name}")
+async def update_retention(container_name: str, update: RetentionUpdate):
+    """设置容器保留天数，retention_days 为空时恢复默认保留期"""
+    if update.retention_days is not None and update.retention_days < 1:
+        raise HTTPException(status_code=400, detail="保留天数至少为 1")
+    try:
+        await db.set_retention_policy(container_name, update.retention_days)
+        return {
+            "success": True,
+            "message": "保留期已更新"
+        }
+    except Exception as e:
+        logger.error(f"更新保留期失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/retention/run")
+async def run_retention():
+    """立即执行一轮归档和清理"""
+    try:
+        result = await asyncio.to_thread(retention_job.run_once)
+        return {
+            "success": True,
+            "data": result
+        }
+    except Exception as e:
+        logger.error(f"执行数据保留任务失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    """服务启动时开始后台数据保留任务和分析工作池（继续处理上次未完成的分析任务）"""
+    retention_job.start()
+    if analysis_worker.workers > 0:
+        analysis_worker.start()
+
+
+@app.on_event("shutdown")
+async def stop_all_follows():
+    """服务关闭时停止所有跟随任务和分析工作池，关闭SSH连接池、模型连接池和数据库连接"""
+    follow_manager.stop_all()
+    retention_job.stop()
+    ssh_pool.close_all()
+    await analysis_worker.stop()
+    await llm_client.aclose()
+    db.close()
+    storage.close()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,387 @@
+"""
+原始日志归档模块 - 按主机和容器追加保存采集到的原始日志，支持按行号/时间取任意位置的上下文
+
+每个 (主机, 容器) 一个目录（root_dir/主机/容器），同名容器在不同主机上的日志互不混合，日志按段文件保存：段内由独立压缩的块组成（每块最多 BLOCK_LINES 行），
+同名 .idx 文件为稀疏索引，每块一条定长记录（首行号、首个时间戳、字节偏移、压缩长度、行数）。
+读取时二分索引定位块，通过 mmap 取出该块解压，不需要解压整个段
+"""
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 每块行数：越小随机读取越快，越大压缩率越高
+BLOCK_LINES = 1024
+
+# 段文件超过该大小（压缩后）时切换到新段，过期清理以段为单位
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+# 索引记录：首行号、首个时间戳（epoch 毫秒，无则为 -1）、块字节偏移、块压缩长度、块行数
+INDEX_RECORD = struct.Struct('<qqQII')
+
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+_LEADING_DOTS = re.compile(r'^\.+')
+
+
+def archive_key(name: str) -> str:
+    """主机名 / 容器名对应的归档目录名：只保留安全字符，开头的点（含 . 和 ..）替换掉，不会跳出归档目录"""
+    key = _LEADING_DOTS.sub(lambda match: '_' * len(match.group()), _UNSAFE_NAME.sub('_', name))
+    return key or '_'
+
+
+class _Segment:
+    """一个段文件及其索引"""
+    
+    def __init__(self, number: int, data_path: str, index_path: str):
+        self.number = number
+        self.data_path = data_path
+        self.index_path = index_path
+        self.records: List[Tuple[int, int, int, int, int]] = []
+        self.first_lines: List[int] = []
+        self.size = 0
+        self._map: Optional[mmap.mmap] = None
+    
+    def load(self):
+        """读取索引；段文件中索引之后的残留数据（写入中断）截掉"""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_RECORD.size
+            self.records = [INDEX_RECORD.unpack_from(data, pos) for pos in range(0, usable, INDEX_RECORD.size)]
+            if usable != len(data):
+                with open(self.index_path, 'r+b') as f:
+                    f.truncate(usable)
+        self.first_lines = [record[0] for record in self.records]
+        self.size = self.records[-1][2] + self.records[-1][3] if self.records else 0
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > self.size:
+            with open(self.data_path, 'r+b') as f:
+                f.truncate(self.size)
+    
+    @property
+    def first_line(self) -> int:
+        return self.records[0][0] if self.records else 0
+    
+    @property
+    def end_line(self) -> int:
+        """段内最后一行之后的行号"""
+        return self.records[-1][0] + self.records[-1][4] if self.records else 0
+    
+    def append_block(self, first_line: int, first_ts: Optional[int], lines: List[str]):
+        payload = zlib.compress('\n'.join(lines).encode('utf-8'), 6)
+        record = (first_line, first_ts if first_ts is not None else -1, self.size, len(payload), len(lines))
+        # 先写数据再写索引：中断时索引不会指向不完整的块
+        with open(self.data_path, 'ab') as f:
+            f.write(payload)
+        with open(self.index_path, 'ab') as f:
+            f.write(INDEX_RECORD.pack(*record))
+        self.records.append(record)
+        self.first_lines.append(first_line)
+        self.size += len(payload)
+    
+    def truncate(self, count: int):
+        """只保留前 count 个块"""
+        self.close()
+        del self.records[count:]
+        del self.first_lines[count:]
+        self.size = self.records[-1][2] + self.records[-1][3] if self.records else 0
+        with open(self.index_path, 'r+b') as f:
+            f.truncate(len(self.records) * INDEX_RECORD.size)
+        with open(self.data_path, 'r+b') as f:
+            f.truncate(self.size)
+    
+    def remove(self):
+        self.close()
+        for path in (self.data_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def read_block(self, position: int) -> List[str]:
+        _, _, offset, length, _ = self.records[position]
+        if self._map is None or offset + length > len(self._map):
+            # 段仍在追加时映射长度会过期，需要重新映射
+            self.close()
+            with open(self.data_path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return zlib.decompress(self._map[offset:offset + length]).decode('utf-8').split('\n')
+    
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class _ContainerArchive:
+    """单个容器的段列表，行号在容器内全局递增（从 1 开始）"""
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock = threading.RLock()
+        self.segments: List[_Segment] = []
+        os.makedirs(directory, exist_ok=True)
+        numbers = sorted(int(name[4:-4]) for name in os.listdir(directory)
+                         if name.startswith('seg-') and name.endswith('.log'))
+        for number in numbers:
+            segment = self._segment(number)
+            segment.load()
+            if segment.records:
+                self.segments.append(segment)
+    
+    def _segment(self, number: int) -> _Segment:
+        base = os.path.join(self.directory, f"seg-{number:06d}")
+        return _Segment(number, base + '.log', base + '.idx')
+    
+    @property
+    def next_line(self) -> int:
+        return self.segments[-1].end_line if self.segments else 1
+    
+    def append_block(self, lines: List[str], first_ts: Optional[int]) -> int:
+        first_line = self.next_line
+        if not self.segments or self.segments[-1].size >= SEGMENT_MAX_BYTES:
+            number = self.segments[-1].number + 1 if self.segments else 1
+            self.segments.append(self._segment(number))
+        self.segments[-1].append_block(first_line, first_ts, lines)
+        return first_line
+    
+    def truncate(self, next_line: int):
+        """删除从 next_line 开始的块；每次采集从新块开始写，截断点总在块边界上"""
+        while self.segments and self.segments[-1].first_line >= next_line:
+            self.segments.pop().remove()
+        if self.segments:
+            segment = self.segments[-1]
+            keep = bisect.bisect_left(segment.first_lines, next_line)
+            if keep < len(segment.records):
+                segment.truncate(keep)
+    
+    def segment_index(self, line: int) -> Optional[int]:
+        position = bisect.bisect_right([segment.first_line for segment in self.segments], line) - 1
+        if position < 0 or line >= self.segments[position].end_line:
+            return None
+        return position
+    
+    def iter_lines(self, start: int, end: int) -> Iterator[Tuple[int, str]]:
+        """[start, end) 行号范围内的 (行号, 内容)"""
+        position = self.segment_index(max(start, 1))
+        if position is None:
+            return
+        for segment in self.segments[position:]:
+            block = max(bisect.bisect_right(segment.first_lines, start) - 1, 0)
+            for block_position in range(block, len(segment.records)):
+                first_line = segment.records[block_position][0]
+                if first_line >= end:
+                    return
+                for offset, text in enumerate(segment.read_block(block_position)):
+                    number = first_line + offset
+                    if start <= number < end:
+                        yield number, text
+    
+    def line_at_timestamp(self, timestamp_ms: int) -> Optional[int]:
+        """首个时间戳不晚于 timestamp_ms 且最接近的块的首行（稀疏索引，精度为一个块）
+
+        容器重启、时钟回拨时块时间戳不一定递增，因此扫描全部块而不是遇到更晚的块就停止；
+        所有块都晚于 timestamp_ms 时返回时间戳最早的块
+        """
+        best = None
+        earliest = None
+        for segment in self.segments:
+            for first_line, first_ts, _, _, _ in segment.records:
+                if first_ts < 0:
+                    continue
+                if first_ts <= timestamp_ms and (best is None or first_ts >= best[0]):
+                    best = (first_ts, first_line)
+                if earliest is None or first_ts < earliest[0]:
+                    earliest = (first_ts, first_line)
+        if best is not None:
+            return best[1]
+        return earliest[1] if earliest is not None else None
+
+
+class ArchiveWriter:
+    """向容器归档追加一批日志行，按 BLOCK_LINES 切块写入"""
+    
+    def __init__(self, archive: _ContainerArchive, timestamp_of: Optional[Callable[[str], Optional[int]]]):
+        self.archive = archive
+        self.timestamp_of = timestamp_of
+        self.buffer: List[str] = []
+        self.first_line: Optional[int] = None
+        self.line_count = 0
+    
+    def add(self, line: str):
+        if self.first_line is None:
+            self.first_line = self.archive.next_line
+        self.buffer.append(line)
+        if len(self.buffer) >= BLOCK_LINES:
+            self.flush()
+    
+    def flush(self):
+        if not self.buffer:
+            return
+        first_ts = None
+        if self.timestamp_of:
+            for line in self.buffer:
+                first_ts = self.timestamp_of(line)
+                if first_ts is not None:
+                    break
+        self.archive.append_block(self.buffer, first_ts)
+        self.line_count += len(self.buffer)
+        self.buffer = []
+    
+    @property
+    def next_line(self) -> int:
+        """已写入部分之后的下一行归档行号"""
+        return self.archive.next_line
+
+
+class RawLogArchive:
+    """原始日志归档：root_dir/主机/容器 下每个 (主机, 容器) 一个归档，行号空间互相独立
+
+    容器名相同而主机不同（同一服务部署在多台主机上）时各自归档，采集游标同样按 (主机, 容器) 区分
+    """
+    
+    def __init__(self, root_dir: str = "raw_logs"):
+        self.root_dir = root_dir
+        self._archives: Dict[Tuple[str, str], _ContainerArchive] = {}
+        self._lock = threading.Lock()
+    
+    def _archive(self, host_key: str, container_key: str, create: bool = True) -> Optional[_ContainerArchive]:
+        """打开归档；create 为 False 时（只读请求）归档目录不存在则返回 None，不建目录也不缓存"""
+        with self._lock:
+            archive = self._archives.get((host_key, container_key))
+            if archive is None:
+                directory = os.path.join(self.root_dir, host_key, container_key)
+                if not create and not os.path.isdir(directory):
+                    return None
+                archive = _ContainerArchive(directory)
+                self._archives[(host_key, container_key)] = archive
+            return archive
+    
+    def _container(self, host: str, container_name: str, create: bool = True) -> Optional[_ContainerArchive]:
+        return self._archive(archive_key(host), archive_key(container_name), create)
+    
+    @contextmanager
+    def writer(self, host: str, container_name: str,
+               timestamp_of: Optional[Callable[[str], Optional[int]]] = None,
+               committed_line: Optional[int] = None) -> Iterator[ArchiveWriter]:
+        """边解析边归档：with 块内持有该容器的归档锁，保证一次采集的行号连续
+
+        committed_line 为随采集游标提交的归档位置（下一行行号）：归档中超出该位置的行
+        来自入库失败或中途中断的采集（游标未推进，这次会重新采集），写入前先截掉，避免重复归档。
+        正常退出时写入剩余行，采集结果入库时把 writer.next_line 随游标一起提交；
+        块内抛出异常时不写剩余行，已写入的块由下次采集截掉
+        """
+        archive = self._container(host, container_name)
+        with archive.lock:
+            if committed_line is not None and archive.next_line > committed_line:
+                logger.warning(f"原始日志归档 {host}/{container_name} 有未提交的行 "
+                               f"{committed_line}-{archive.next_line - 1}，截掉后重新归档")
+                archive.truncate(committed_line)
+            writer = ArchiveWriter(archive, timestamp_of)
+            yield writer
+            writer.flush()
+    
+    def append(self, host: str, container_name: str, lines: Iterable[str],
+               timestamp_of: Optional[Callable[[str], Optional[int]]] = None,
+               committed_line: Optional[int] = None) -> Tuple[Optional[int], int]:
+        """追加日志行，返回 (首行的归档行号, 行数)；没有行时首行为 None"""
+        with self.writer(host, container_name, timestamp_of, committed_line) as writer:
+            for line in lines:
+                writer.add(line)
+        return writer.first_line, writer.line_count
+    
+    def segment_of(self, host: str, container_name: str, line: int) -> Optional[int]:
+        """归档行号所在的段号"""
+        archive = self._container(host, container_name, create=False)
+        if archive is None:
+            return None
+        position = archive.segment_index(line)
+        return archive.segments[position].number if position is not None else None
+    
+    def read_lines(self, host: str, container_name: str, line: int,
+                   before: int = 50, after: int = 50) -> Optional[List[Dict]]:
+        """读取归档行号 line 前后的日志；没有该归档时返回 None"""
+        archive = self._container(host, container_name, create=False)
+        if archive is None:
+            return None
+        with archive.lock:
+            return [{'line': number, 'content': text}
+                    for number, text in archive.iter_lines(line - before, line + after + 1)]
+    
+    def line_at_timestamp(self, host: str, container_name: str, timestamp_ms: int) -> Optional[int]:
+        """时间戳对应的大致归档行号（所在块的首行）；没有该归档时返回 None"""
+        archive = self._container(host, container_name, create=False)
+        if archive is None:
+            return None
+        with archive.lock:
+            return archive.line_at_timestamp(timestamp_ms)
+    
+    @staticmethod
+    def _purge_before(archive: _ContainerArchive, cutoff_ms: int) -> List[int]:
+        removed = []
+        with archive.lock:
+            while len(archive.segments) > 1:
+                next_first_ts = next((r[1] for r in archive.segments[1].records if r[1] >= 0), None)
+                if next_first_ts is None or next_first_ts >= cutoff_ms:
+                    break
+                segment = archive.segments.pop(0)
+                segment.remove()
+                removed.append(segment.number)
+        return removed
+    
+    def purge_before(self, host: str, container_name: str, cutoff_ms: int) -> List[int]:
+        """删除全部内容都早于 cutoff_ms 的段（以下一段的首个时间戳判断），当前写入段不删除"""
+        archive = self._container(host, container_name, create=False)
+        return self._purge_before(archive, cutoff_ms) if archive is not None else []
+    
+    def purge(self, policies: Dict[str, int], default_days: int) -> Dict[str, List[int]]:
+        """按容器保留天数（与错误数据相同的保留期配置，各主机上的同名容器相同）删除过期段，
+        返回各归档（主机/容器）删除的段号
+        """
+        days_by_key = {archive_key(name): days for name, days in policies.items()}
+        now_ms = int(time.time() * 1000)
+        dropped = {}
+        for host_key, container_key in self.archives():
+            days = days_by_key.get(container_key, default_days)
+            removed = self._purge_before(self._archive(host_key, container_key), now_ms - days * 86_400_000)
+            if removed:
+                dropped[f"{host_key}/{container_key}"] = removed
+        return dropped
+    
+    def archives(self) -> List[Tuple[str, str]]:
+        """已有的归档 (主机目录名, 容器目录名)"""
+        if not os.path.isdir(self.root_dir):
+            return []
+        result = []
+        for host_key in sorted(os.listdir(self.root_dir)):
+            host_dir = os.path.join(self.root_dir, host_key)
+            if not os.path.isdir(host_dir):
+                continue
+            for container_key in sorted(os.listdir(host_dir)):
+                if os.path.isdir(os.path.join(host_dir, container_key)):
+                    result.append((host_key, container_key))
+        return result
+    
+    def _stats(self, archive: _ContainerArchive) -> Dict:
+        with archive.lock:
+            return {
+                'segments': len(archive.segments),
+                'blocks': sum(len(segment.records) for segment in archive.segments),
+                'lines': archive.next_line - (archive.segments[0].first_line if archive.segments else 1),
+                'bytes': sum(segment.size for segment in archive.segments),
+            }
+    
+    def stats(self, host: str, container_name: str) -> Optional[Dict]:
+        archive = self._container(host, container_name, create=False)
+        return self._stats(archive) if archive is not None else None
+    
+    def all_stats(self) -> Dict[str, Dict]:
+        """各归档（主机/容器）的统计"""
+        return {f"{host_key}/{container_key}": self._stats(self._archive(host_key, container_key))
+                for host_key, container_key in self.archives()}
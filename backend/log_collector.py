@@ -2,28 +2,133 @@
 日志采集模块 - 通过SSH连接远程服务器获取Docker容器日志
 """
 import paramiko
+import codecs
+import os
 import re
+import socket
+import threading
+import time
+import zlib
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator
 import logging
 
+from log_parser import (
+    DEFAULT_MATCHER, DEFAULT_PROFILE, PARALLEL_PARSE_MIN_LINES, LogProfile, TimestampExtractor,
+    extract_timestamp, get_profile, get_timestamp_extractor, iter_error_events, parse_lines_parallel
+)
+from ssh_pool import SSHConnectionPool
+
+try:
+    import zstandard
+except ImportError:  # zstd 压缩为可选功能，未安装时只能使用 gzip
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
+# 远程主机是否安装了 zstd，按主机缓存探测结果
+_remote_zstd: Dict[str, bool] = {}
+
+
+def docker_timestamp_key(ts: str) -> Tuple[str, int]:
+    """把 docker --timestamps 的 RFC3339Nano 时间戳转成可比较的键
+
+    docker 会去掉小数部分末尾的 0，直接按字符串比较并不可靠
+    """
+    ts = ts.rstrip('Z')
+    if '.' in ts:
+        seconds, fraction = ts.split('.', 1)
+        nanos = int(fraction[:9].ljust(9, '0') or 0)
+    else:
+        seconds, nanos = ts, 0
+    return seconds, nanos
+
+
+def split_docker_timestamp(line: str) -> Tuple[Optional[str], str]:
+    """拆分 docker --timestamps 输出的一行，返回 (时间戳, 日志内容)
+
+    没有时间戳前缀的行（例如 docker 自身的报错）时间戳为 None，内容原样返回
+    """
+    ts, sep, message = line.partition(' ')
+    if not sep or not ts[:1].isdigit():
+        return None, line
+    return ts, message
+
+
+class DockerLogCursor:
+    """增量采集游标
+
+    去掉 docker 时间戳前缀，跳过游标（含）之前已采集过的行，并记录见到的最新时间戳。
+    docker logs --since 包含等于游标的那一行，因此需要在本地再过滤一次。
+    """
+    
+    def __init__(self, since: Optional[str] = None):
+        self.since = since
+        self.since_key = docker_timestamp_key(since) if since else None
+        self.cursor = since
+        self._cursor_key = self.since_key
+        self.line_count = 0
+    
+    def strip(self, line: str) -> Optional[str]:
+        """返回去掉时间戳后的日志内容，已采集过的行返回 None"""
+        ts, message = split_docker_timestamp(line)
+        if ts is not None:
+            key = docker_timestamp_key(ts)
+            if self.since_key and key <= self.since_key:
+                return None
+            if self._cursor_key is None or key > self._cursor_key:
+                self.cursor, self._cursor_key = ts, key
+        self.line_count += 1
+        return message
+    
+    def iter_messages(self, lines: Iterable[Optional[str]]) -> Iterator[Optional[str]]:
+        """逐行 strip，流中表示空闲的 None 原样透传"""
+        for line in lines:
+            if line is None:
+                yield None
+                continue
+            message = self.strip(line)
+            if message is not None:
+                yield message
+
+
+# grep -n 输出的行号前缀：命中行为 "行号:"，上下文行为 "行号-"
+GREP_LINE_PREFIX = re.compile(r'(\d+)[:-]')
+
+# 预筛选时在 grep 之前统计总行数：原样转发日志，结束时把行数写到 stderr
+REMOTE_LINE_COUNTER = "awk '{print} END {print NR > \"/dev/stderr\"}'"
+
 
 class LogCollector:
     """SSH连接并采集Docker容器日志"""
     
-    def __init__(self, host: str, port: int, username: str, password: str = None, key_file: str = None):
+    def __init__(self, host: str, port: int, username: str, password: str = None, key_file: str = None,
+                 pool: Optional[SSHConnectionPool] = None):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.key_file = key_file
+        self.pool = pool
         self.client = None
+        # 解析器配置和时间戳提取器，由 configure_parser 按容器设置
+        self.profile: LogProfile = DEFAULT_PROFILE
+        self.timestamps = TimestampExtractor()
+    
+    def configure_parser(self, container_name: str, profile: Optional[str] = None):
+        """为即将采集的容器选择解析器配置，并复用该容器已学到的时间戳格式"""
+        self.profile = get_profile(profile)
+        self.timestamps = get_timestamp_extractor(f"{self.host}/{container_name}")
     
     def connect(self):
-        """建立SSH连接"""
+        """建立SSH连接，指定了连接池时从池中借用"""
         try:
+            if self.pool:
+                self.client = self.pool.acquire(
+                    self.host, self.port, self.username, self.password, self.key_file
+                )
+                return True
+            
             self.client = paramiko.SSHClient()
             self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             
@@ -48,10 +153,14 @@ class LogCollector:
             return False
     
     def disconnect(self):
-        """断开SSH连接"""
+        """断开SSH连接，来自连接池的连接归还给连接池"""
         if self.client:
-            self.client.close()
-            logger.info("SSH连接已断开")
+            if self.pool:
+                self.pool.release(self.host, self.port, self.username, self.client)
+            else:
+                self.client.close()
+                logger.info("SSH连接已断开")
+            self.client = None
     
     def get_docker_logs(self, container_name: str, lines: int = 1000) -> str:
         """获取Docker容器日志"""
@@ -72,83 +181,296 @@ class LogCollector:
             logger.error(f"获取Docker日志失败: {e}")
             raise
     
-    def parse_error_logs(self, logs: str) -> List[Dict]:
-        """解析日志，提取错误信息"""
-        # 更精确的错误匹配模式
-        error_patterns = [
-            r'\bERROR\b',           # ERROR 级别日志
-            r'\bFATAL\b',           # FATAL 级别日志
-            r'\bCRITICAL\b',        # CRITICAL 级别日志
-            r'Exception:',          # Java/Python 异常
-            r'Traceback',           # Python 堆栈跟踪
-            r'at\s+[\w\.]+\(',      # Java 堆栈跟踪
-            r'Caused by:',          # Java 异常链
-            r'java\.lang\.\w+Exception',  # Java 异常类
-            r'Failed to',           # 失败消息
-            r'failed to',
-            r'Cannot',              # 无法执行
-            r'Unable to',           # 无法执行
-            r'Could not',           # 无法执行
-        ]
-        
-        # 排除模式 - 这些不应该被识别为错误
-        exclude_patterns = [
-            r'further occurrences of this error will be logged',  # 提示信息
-            r'error handling',      # 错误处理相关的正常日志
-            r'no error',            # 没有错误
-            r'without error',       # 没有错误
-        ]
+    def get_docker_logs_since(self, container_name: str, since: Optional[str] = None,
+                              lines: int = 1000) -> Tuple[str, Optional[str]]:
+        """增量获取Docker容器日志
+
+        since 为上次采集到的最后一条 docker 时间戳（游标），为空时退化为取最后 lines 行；
+        有游标时取游标之后的全部日志，不再用 -n 截断，否则新增超过 lines 行时较早的部分会被跳过。
+        返回 (去掉时间戳前缀后的日志, 新的游标)，没有新日志时游标保持不变。
+        """
+        if not self.client:
+            raise Exception("SSH未连接")
         
-        lines = logs.split('\n')
-        errors = []
-        current_error = None
+        command = "docker logs --timestamps"
+        command += f" --since {since}" if since else f" -n {lines}"
+        command += f" {container_name}"
+        try:
+            stdin, stdout, stderr = self.client.exec_command(command)
+            logs = stdout.read().decode('utf-8', errors='ignore')
+            errors = stderr.read().decode('utf-8', errors='ignore')
+        except Exception as e:
+            logger.error(f"获取Docker日志失败: {e}")
+            raise
+        
+        log_cursor = DockerLogCursor(since)
+        new_lines = list(log_cursor.iter_messages(line for line in (logs + errors).split('\n') if line))
+        
+        logger.info(f"成功增量获取 {container_name} 的 {len(new_lines)} 行新日志")
+        return '\n'.join(new_lines), log_cursor.cursor
+    
+    def get_latest_docker_timestamp(self, container_name: str) -> Optional[str]:
+        """获取容器最后一行日志的 docker 时间戳，没有日志时返回 None"""
+        if not self.client:
+            raise Exception("SSH未连接")
+        
+        stdin, stdout, stderr = self.client.exec_command(
+            f"docker logs --timestamps -n 1 {container_name} 2>&1"
+        )
+        output = stdout.read().decode('utf-8', errors='ignore')
+        
+        latest = None
+        for line in output.split('\n'):
+            ts, _ = split_docker_timestamp(line)
+            if ts and (latest is None or docker_timestamp_key(ts) > docker_timestamp_key(latest)):
+                latest = ts
+        return latest
+    
+    def get_prefiltered_docker_logs(self, container_name: str, lines: int = 1000,
+                                    since: Optional[str] = None, incremental: bool = False
+                                    ) -> Tuple[List[Optional[Tuple[int, str]]], int, Optional[str]]:
+        """在远程用 grep 预筛选Docker日志，只传回候选错误行及其上下文
+
+        返回 (带原始行号的日志行, 已扫描的行数, 新游标)。已扫描的行数由远程 awk 统计，
+        是 grep 之前的日志总行数，而不是最后一个命中行的行号。行列表中的 None 表示 grep 的分组间隔，
+        可直接交给 iter_numbered_error_logs 解析。
+        增量模式下先取最后一行的时间戳作为 --until 上界，处理完成后游标直接推进到该上界，
+        这样即使最后一段日志没有命中任何模式，游标也不会停留在原地。
+        有游标时扫描游标之后的全部日志，不用 -n 截断。
+        """
+        if not self.client:
+            raise Exception("SSH未连接")
+        
+        cursor = None
+        command = "docker logs"
+        if incremental:
+            cursor = self.get_latest_docker_timestamp(container_name)
+            if cursor is None:
+                return [], 0, since
+            command += f" --timestamps --until {cursor}"
+            if since:
+                command += f" --since {since}"
+        if not since:
+            command += f" -n {lines}"
+        command += f" {container_name} 2>&1 | {REMOTE_LINE_COUNTER} | {DEFAULT_MATCHER.remote_filter_command()}"
+        
+        try:
+            stdin, stdout, stderr = self.client.exec_command(command)
+            output = stdout.read().decode('utf-8', errors='ignore')
+            counter_output = stderr.read().decode('utf-8', errors='ignore').split()
+        except Exception as e:
+            logger.error(f"获取Docker日志失败: {e}")
+            raise
+        
+        log_cursor = DockerLogCursor(since)
+        numbered = []
+        last_line_number = 0
+        for raw in output.split('\n'):
+            if raw == '--':
+                numbered.append(None)
+                continue
+            match = GREP_LINE_PREFIX.match(raw)
+            if not match:
+                continue
+            line_number = int(match.group(1))
+            content = raw[match.end():]
+            if incremental:
+                content = log_cursor.strip(content)
+                if content is None:
+                    continue
+            numbered.append((line_number, content))
+            last_line_number = line_number
+        
+        # 远程没有 awk 等原因拿不到总行数时，退回到最后一个传回行的行号（偏小）
+        scanned = int(counter_output[-1]) if counter_output and counter_output[-1].isdigit() else last_line_number
+        logger.info(f"远程预筛选 {container_name} 日志，扫描 {scanned} 行，传回 {len(numbered)} 行")
+        return numbered, scanned, cursor
+    
+    def stream_docker_logs(self, container_name: str, since: Optional[str] = None,
+                           lines: Optional[int] = 0, follow: bool = True,
+                           stop_event: Optional[threading.Event] = None,
+                           idle_timeout: float = 1.0,
+                           chunk_size: int = 32768) -> Iterator[Optional[str]]:
+        """以流的方式逐行读取Docker容器日志（带 docker 时间戳前缀）
+
+        通过 SSH 通道增量读取，按块拼接出完整的行后逐行产出，内存占用与日志总量无关。
+        超过 idle_timeout 秒没有新数据时产出 None，调用方可借此刷新缓冲、检查停止信号。
+        lines 为 None 时不限制历史行数（配合 since 从游标处续读）。
+        """
+        if not self.client:
+            raise Exception("SSH未连接")
+        
+        command = "docker logs --timestamps"
+        if lines is not None:
+            command += f" -n {lines}"
+        if since:
+            command += f" --since {since}"
+        if follow:
+            command += " -f"
+        command += f" {container_name}"
+        
+        channel = self.client.get_transport().open_session()
+        try:
+            # Docker logs 可能输出到 stderr，合并到同一个流
+            channel.set_combine_stderr(True)
+            channel.settimeout(idle_timeout)
+            channel.exec_command(command)
+            logger.info(f"开始跟随 {container_name} 的日志")
+            yield from self._iter_channel_lines(channel, stop_event=stop_event, chunk_size=chunk_size)
+        finally:
+            channel.close()
+            logger.info(f"停止跟随 {container_name} 的日志")
+    
+    def detect_compression(self) -> str:
+        """选择压缩方式：本地安装了 zstandard 且远程有 zstd 时用 zstd，否则用 gzip"""
+        if zstandard is None:
+            return 'gzip'
+        if self.host not in _remote_zstd:
+            stdin, stdout, stderr = self.client.exec_command("command -v zstd")
+            _remote_zstd[self.host] = stdout.channel.recv_exit_status() == 0
+        return 'zstd' if _remote_zstd[self.host] else 'gzip'
+    
+    def iter_compressed_docker_logs(self, container_name: str, lines: int = 1000,
+                                    since: Optional[str] = None, compression: str = 'gzip',
+                                    stats: Optional[Dict] = None,
+                                    chunk_size: int = 65536) -> Iterator[str]:
+        """在远程压缩后传输Docker日志，本地边接收边解压，逐行产出（带 docker 时间戳前缀）
+
+        有游标 since 时取游标之后的全部日志，没有时取最后 lines 行。
+        compression 可选 gzip / zstd / auto。传入 stats 字典时，读取结束后写入
+        压缩方式、传输字节数、原始字节数、压缩比和传输耗时。
+        """
+        if not self.client:
+            raise Exception("SSH未连接")
+        
+        if compression == 'auto':
+            compression = self.detect_compression()
+        if compression == 'zstd':
+            if zstandard is None:
+                raise Exception("本地未安装 zstandard，无法使用 zstd 压缩")
+            remote_compress = "zstd -1 -c -q"
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        elif compression == 'gzip':
+            remote_compress = "gzip -1 -c"
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            raise ValueError(f"不支持的压缩方式: {compression}")
         
-        for i, line in enumerate(lines):
-            # 检查是否应该排除
-            should_exclude = any(re.search(pattern, line, re.IGNORECASE) for pattern in exclude_patterns)
-            if should_exclude:
+        command = "docker logs --timestamps"
+        command += f" --since {since}" if since else f" -n {lines}"
+        command += f" {container_name} 2>&1 | {remote_compress}"
+        
+        counters = {"compressed_bytes": 0, "raw_bytes": 0}
+        started = time.monotonic()
+        channel = self.client.get_transport().open_session()
+        try:
+            channel.exec_command(command)
+            yield from self._iter_channel_lines(
+                channel, decompressor=decompressor, chunk_size=chunk_size, counters=counters
+            )
+            
+            exit_status = channel.recv_exit_status()
+            if exit_status != 0 and counters["compressed_bytes"] == 0:
+                message = channel.recv_stderr(4096).decode('utf-8', errors='ignore').strip()
+                raise Exception(f"远程压缩命令失败({exit_status}): {message}")
+        finally:
+            channel.close()
+        
+        elapsed = time.monotonic() - started
+        compressed = counters["compressed_bytes"]
+        result = {
+            "compression": compression,
+            "compressed_bytes": compressed,
+            "raw_bytes": counters["raw_bytes"],
+            "ratio": round(counters["raw_bytes"] / compressed, 2) if compressed else None,
+            "transfer_seconds": round(elapsed, 3)
+        }
+        logger.info(
+            f"压缩传输 {container_name} 日志: {compression}, {compressed} -> {counters['raw_bytes']} 字节, "
+            f"压缩比 {result['ratio']}, 耗时 {result['transfer_seconds']} 秒"
+        )
+        if stats is not None:
+            stats.update(result)
+    
+    def _iter_channel_lines(self, channel, stop_event: Optional[threading.Event] = None,
+                            decompressor=None, chunk_size: int = 32768,
+                            counters: Optional[Dict] = None) -> Iterator[Optional[str]]:
+        """从 SSH 通道按块读取数据，拼接出完整的行后逐行产出
+
+        通道设置了超时且超时未收到数据时产出 None；指定 decompressor 时先增量解压再解码
+        """
+        # 多字节字符可能被拆在两个数据块之间，需要增量解码
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        pending = ''
+        while not (stop_event and stop_event.is_set()):
+            try:
+                data = channel.recv(chunk_size)
+            except socket.timeout:
+                yield None
                 continue
+            if not data:
+                break
             
-            # 检查是否匹配错误模式
-            is_error = any(re.search(pattern, line, re.IGNORECASE) for pattern in error_patterns)
+            if counters is not None:
+                counters["compressed_bytes"] += len(data)
+            if decompressor is not None:
+                data = decompressor.decompress(data)
+                if counters is not None:
+                    counters["raw_bytes"] += len(data)
             
-            if is_error:
-                if current_error:
-                    errors.append(current_error)
-                
-                current_error = {
-                    'line_number': i + 1,
-                    'timestamp': self._extract_timestamp(line),
-                    'content': line,
-                    'context': []
-                }
-            elif current_error:
-                # 收集错误的上下文（堆栈信息等）
-                current_error['context'].append(line)
-                if len(current_error['context']) > 10:  # 限制上下文行数
-                    errors.append(current_error)
-                    current_error = None
-        
-        if current_error:
-            errors.append(current_error)
-        
-        return errors
+            pending += decoder.decode(data)
+            *complete, pending = pending.split('\n')
+            for line in complete:
+                yield line
+        
+        if decompressor is not None:
+            tail = decompressor.flush()
+            if counters is not None:
+                counters["raw_bytes"] += len(tail)
+            pending += decoder.decode(tail)
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield pending
+    
+    def parse_error_logs(self, logs: str, workers: Optional[int] = None) -> List[Dict]:
+        """解析日志，提取错误信息
+
+        行数达到 PARALLEL_PARSE_MIN_LINES 时按行切块交给多进程并行解析，
+        workers 为 1 时强制单进程解析，为 None 时使用全部 CPU 核
+        """
+        lines = logs.split('\n')
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(lines) >= PARALLEL_PARSE_MIN_LINES:
+            return parse_lines_parallel(lines, self.profile, workers, self.timestamps)
+        return list(self.iter_numbered_error_logs(enumerate(lines, 1)))
+    
+    def iter_error_logs(self, lines: Iterable[Optional[str]]) -> Iterator[Dict]:
+        """逐行解析日志，以生成器的方式产出错误信息
+
+        lines 中的 None 表示日志流暂时空闲，此时立即产出正在收集上下文的错误，
+        保证跟随模式下错误不会因为等待后续日志而滞留
+        """
+        def numbered():
+            line_number = 0
+            for line in lines:
+                if line is None:
+                    yield None
+                else:
+                    line_number += 1
+                    yield line_number, line
+        
+        return self.iter_numbered_error_logs(numbered())
+    
+    def iter_numbered_error_logs(self, numbered_lines: Iterable[Optional[Tuple[int, str]]]) -> Iterator[Dict]:
+        """解析带原始行号的日志行 (行号, 内容)，None 的含义同 iter_error_logs
+
+        远程预筛选后的日志行号不连续，错误的行号仍取原始日志中的行号
+        """
+        return iter_error_events(numbered_lines, self.profile, self.timestamps)
     
     def _extract_timestamp(self, log_line: str) -> Optional[str]:
         """从日志行中提取时间戳"""
-        # 常见时间戳格式
-        timestamp_patterns = [
-            r'\d{4}-\d{2}-\d{2}[\sT]\d{2}:\d{2}:\d{2}',
-            r'\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2}',
-            r'\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]'
-        ]
-        
-        for pattern in timestamp_patterns:
-            match = re.search(pattern, log_line)
-            if match:
-                return match.group(0)
-        
-        return None
+        return extract_timestamp(log_line)
 
 
 class LogAnalyzer:
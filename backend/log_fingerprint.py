@@ -0,0 +1,66 @@
+"""
+错误指纹模块 - 去掉错误行和栈顶帧中的易变部分，得到稳定的错误指纹
+
+同一个异常每次出现时，数字、UUID、十六进制地址、时间戳、IP 都会变化，
+归一化后相同的错误得到相同指纹，存储层据此把重复出现的错误聚合为一个问题
+"""
+import hashlib
+import re
+from typing import Dict, List
+
+# 参与指纹计算的栈帧数：栈顶几帧足以区分调用位置，更深的帧随调用方变化
+FINGERPRINT_FRAMES = 5
+
+# 替换顺序有讲究：时间戳、UUID、IP 中都含数字，必须先于通用数字替换
+NORMALIZE_RULES = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'), '<TS>'),
+    (re.compile(r'\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2}(?: [+-]\d{4})?'), '<TS>'),
+    (re.compile(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}'), '<TS>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d{1,5})?\b'), '<IP>'),
+    (re.compile(r'\b(?:[0-9a-fA-F]{1,4}:){2,7}[0-9a-fA-F]{1,4}\b'), '<IP>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<HEX>'),
+    # 对象哈希（Foo@1b6d3586）、trace id、提交号等：至少 8 位且含数字的十六进制串
+    (re.compile(r'(?<=@)[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b'), '<HEX>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<NUM>'),
+]
+
+_WHITESPACE = re.compile(r'\s+')
+
+# 栈帧行：Java "at x.y(Foo.java:12)" / "Caused by: ..."，Python 'File "...", line 3, in f'
+STACK_FRAME = re.compile(r'^\s*(?:at\s+\S|Caused by:|File\s+"|\.\.\. \d+ more)')
+
+
+def normalize_message(text: str) -> str:
+    """去掉易变部分并压缩空白"""
+    for pattern, token in NORMALIZE_RULES:
+        text = pattern.sub(token, text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def stack_frames(context: List[str], limit: int = FINGERPRINT_FRAMES) -> List[str]:
+    """上下文中的栈顶帧（归一化后）"""
+    frames = []
+    for line in context:
+        if STACK_FRAME.match(line):
+            frames.append(normalize_message(line))
+            if len(frames) >= limit:
+                break
+    return frames
+
+
+def error_signature(error: Dict) -> str:
+    """错误签名：归一化后的错误行加栈顶帧，每项一行"""
+    lines = [normalize_message(error.get('content') or '')]
+    lines.extend(stack_frames(error.get('context') or []))
+    return '\n'.join(lines)
+
+
+def signature_fingerprint(signature: str) -> str:
+    """签名的 SHA-1 前 16 位"""
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()[:16]
+
+
+def fingerprint(error: Dict) -> str:
+    """错误指纹"""
+    return signature_fingerprint(error_signature(error))
@@ -0,0 +1,179 @@
+"""
+日志跟随模块 - 持续跟随Docker容器日志，实时解析并保存错误
+"""
+import itertools
+import threading
+from datetime import datetime
+from typing import List, Dict, Optional, Iterator
+import logging
+
+from log_collector import LogCollector, DockerLogCursor
+from log_storage import LogStorage
+
+logger = logging.getLogger(__name__)
+
+# 日志持续不断、迟迟不空闲时，攒够这么多错误先入库（不推进游标）
+FOLLOW_SAVE_BATCH = 50
+
+
+class LogFollower:
+    """在后台线程中跟随单个容器的日志流（docker logs -f）"""
+    
+    def __init__(self, follow_id: int, collector: LogCollector, container_name: str,
+                 storage: LogStorage):
+        self.follow_id = follow_id
+        self.collector = collector
+        self.container_name = container_name
+        self.storage = storage
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.log_cursor = DockerLogCursor()
+        self.saved_cursor = None
+        self.pending: List[Dict] = []
+        self.started_at = None
+        self.error_count = 0
+        self.last_error = None
+    
+    def start(self):
+        """启动跟随线程"""
+        self.started_at = datetime.now().isoformat()
+        self.thread = threading.Thread(
+            target=self._run,
+            name=f"follow-{self.collector.host}-{self.container_name}",
+            daemon=True
+        )
+        self.thread.start()
+    
+    def stop(self):
+        """通知跟随线程停止，线程会在下一次空闲检查时退出"""
+        self.stop_event.set()
+    
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+    
+    @property
+    def cursor(self) -> Optional[str]:
+        return self.log_cursor.cursor
+    
+    def _commit(self, advance_cursor: bool = True):
+        """保存已解析出的错误（加入分析队列），advance_cursor 为 True 时在同一事务中推进增量游标，
+        使跟随与增量采集共用同一个进度
+
+        只有解析器已产出全部已读日志中的错误时（空闲标记处理完、日志流结束）才能推进游标，
+        否则游标会越过还在收集上下文的错误，中断后这个错误就永远丢失了
+        """
+        cursor = self.cursor if advance_cursor and self.cursor != self.saved_cursor else None
+        if not self.pending and not cursor:
+            return
+        self.storage.save_errors(
+            self.container_name,
+            ({'original': error} for error in self.pending),
+            enqueue_analysis=True,
+            collection_cursor=(self.collector.host, cursor) if cursor else None
+        )
+        self.pending = []
+        if cursor:
+            self.saved_cursor = cursor
+    
+    def _messages(self, since: Optional[str]) -> Iterator[Optional[str]]:
+        """去掉 docker 时间戳前缀并推进游标，空闲时保存错误和游标"""
+        # 有游标时从游标处续读全部新日志，否则只跟随新产生的日志
+        lines = None if since else 0
+        for line in self.collector.stream_docker_logs(
+            self.container_name, since=since, lines=lines, stop_event=self.stop_event
+        ):
+            if line is None:
+                yield None
+                # 恢复执行时解析器已处理完空闲标记，正在收集上下文的错误都已产出
+                self._commit()
+                continue
+            
+            message = self.log_cursor.strip(line)
+            if message is not None:
+                yield message
+    
+    def _run(self):
+        try:
+            if not self.collector.connect():
+                raise Exception("SSH连接失败")
+            
+            since = self.storage.get_collection_cursor(self.collector.host, self.container_name)
+            self.log_cursor = DockerLogCursor(since)
+            self.saved_cursor = since
+            
+            for error in self.collector.iter_error_logs(self._messages(since)):
+                self.pending.append(error)
+                self.error_count += 1
+                if len(self.pending) >= FOLLOW_SAVE_BATCH:
+                    self._commit(advance_cursor=False)
+            # 日志流结束时解析器已产出全部错误
+            self._commit()
+        except Exception as e:
+            logger.error(f"跟随 {self.container_name} 日志失败: {e}")
+            self.last_error = str(e)
+            try:
+                # 已解析出的错误照常保存，游标停在上次提交处，下次从那里重新读取
+                self._commit(advance_cursor=False)
+            except Exception as save_error:
+                logger.error(f"保存 {self.container_name} 跟随结果失败: {save_error}")
+        finally:
+            self.collector.disconnect()
+    
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.follow_id,
+            "host": self.collector.host,
+            "container_name": self.container_name,
+            "running": self.is_running(),
+            "started_at": self.started_at,
+            "line_count": self.log_cursor.line_count,
+            "error_count": self.error_count,
+            "cursor": self.cursor,
+            "last_error": self.last_error
+        }
+
+
+class LogFollowManager:
+    """管理所有跟随任务，同一主机的同一容器只保留一个跟随任务"""
+    
+    def __init__(self, storage: LogStorage):
+        self.storage = storage
+        self.followers: Dict[int, LogFollower] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def start(self, collector: LogCollector, container_name: str) -> Dict:
+        """开始跟随容器日志，已在跟随时直接返回现有任务"""
+        with self._lock:
+            for follower in self.followers.values():
+                if (follower.is_running() and follower.collector.host == collector.host
+                        and follower.container_name == container_name):
+                    return follower.to_dict()
+            
+            follower = LogFollower(next(self._ids), collector, container_name, self.storage)
+            self.followers[follower.follow_id] = follower
+        
+        follower.start()
+        return follower.to_dict()
+    
+    def stop(self, follow_id: int) -> bool:
+        """停止跟随任务"""
+        with self._lock:
+            follower = self.followers.pop(follow_id, None)
+        if not follower:
+            return False
+        follower.stop()
+        return True
+    
+    def stop_all(self):
+        """停止所有跟随任务"""
+        with self._lock:
+            followers = list(self.followers.values())
+            self.followers.clear()
+        for follower in followers:
+            follower.stop()
+    
+    def list(self) -> List[Dict]:
+        """列出所有跟随任务"""
+        with self._lock:
+            return [follower.to_dict() for follower in self.followers.values()]
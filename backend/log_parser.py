@@ -0,0 +1,632 @@
+"""
+日志解析模块 - 错误行匹配、解析器配置（profile）以及多进程并行解析
+"""
+import calendar
+import json
+import multiprocessing
+import os
+import re
+import shlex
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Dict, Optional, Tuple, Iterable, Iterator
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    _json_loads = json.loads
+
+# 更精确的错误匹配模式
+ERROR_PATTERNS = [
+    r'\bERROR\b',           # ERROR 级别日志
+    r'\bFATAL\b',           # FATAL 级别日志
+    r'\bCRITICAL\b',        # CRITICAL 级别日志
+    r'Exception:',          # Java/Python 异常
+    r'Traceback',           # Python 堆栈跟踪
+    r'at\s+[\w\.]+\(',      # Java 堆栈跟踪
+    r'Caused by:',          # Java 异常链
+    r'java\.lang\.\w+Exception',  # Java 异常类
+    r'Failed to',           # 失败消息
+    r'failed to',
+    r'Cannot',              # 无法执行
+    r'Unable to',           # 无法执行
+    r'Could not',           # 无法执行
+]
+
+# 排除模式 - 这些不应该被识别为错误
+EXCLUDE_PATTERNS = [
+    r'further occurrences of this error will be logged',  # 提示信息
+    r'error handling',      # 错误处理相关的正常日志
+    r'no error',            # 没有错误
+    r'without error',       # 没有错误
+]
+
+# 预筛选关键字（小写）：任何错误模式或排除模式的匹配都必然包含其中之一，
+# 修改上面的模式时需要同步维护
+ERROR_KEYWORDS = (
+    'error', '(', 'exception', 'failed to', 'could not', 'cannot',
+    'unable to', 'fatal', 'critical', 'traceback', 'caused by:',
+)
+
+# 上下文行数超过该值时结束当前错误
+MAX_CONTEXT_LINES = 10
+
+LINE_NORMAL = 0
+LINE_ERROR = 1
+LINE_EXCLUDED = 2
+# 结构化日志中一条非错误的新记录：结束当前错误，但不计入上下文
+LINE_RECORD = 3
+
+
+# Python 正则转义在 POSIX 方括号表达式中的等价写法
+_BRACKET_ESCAPES = {'w': '[:alnum:]_', 'd': '[:digit:]', 's': '[:space:]'}
+
+
+def to_posix_ere(pattern: str) -> str:
+    """把本模块用到的 Python 正则子集转换为 grep -E 可用的 ERE
+
+    方括号内的反斜杠在 ERE 中是普通字符，需要把 \\w、\\d、\\s 换成字符类，其余转义去掉反斜杠；
+    方括号外 GNU grep 支持 \\b、\\w、\\s，只需把 \\d 换成 [[:digit:]]
+    """
+    result = []
+    in_bracket = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            if in_bracket:
+                result.append(_BRACKET_ESCAPES.get(escaped, escaped))
+            elif escaped == 'd':
+                result.append('[[:digit:]]')
+            else:
+                result.append(char + escaped)
+            i += 2
+            continue
+        if char == '[' and not in_bracket:
+            in_bracket = True
+        elif char == ']' and in_bracket:
+            in_bracket = False
+        result.append(char)
+        i += 1
+    return ''.join(result)
+
+
+class ErrorMatcher:
+    """预编译的错误行匹配器
+
+    先用小写关键字做廉价的子串预筛选，绝大多数普通日志行在这一步就被判定为普通行；
+    只有候选行才会执行合并后的排除正则和错误正则，每类各扫描一次。
+    """
+    
+    def __init__(self, error_patterns: List[str] = ERROR_PATTERNS,
+                 exclude_patterns: List[str] = EXCLUDE_PATTERNS,
+                 keywords: Optional[Tuple[str, ...]] = ERROR_KEYWORDS):
+        self.error_re = re.compile('|'.join(f'(?:{p})' for p in error_patterns), re.IGNORECASE)
+        self.exclude_re = re.compile('|'.join(f'(?:{p})' for p in exclude_patterns), re.IGNORECASE)
+        self.keywords = keywords
+        # 远程 grep -E 使用的模式：错误行和排除行都要传回本地，由本地解析器精确判定
+        self.remote_pattern = '|'.join(
+            to_posix_ere(p) for p in list(error_patterns) + list(exclude_patterns)
+        )
+    
+    def remote_filter_command(self) -> str:
+        """构造远程预筛选命令
+
+        输出命中行及其后 MAX_CONTEXT_LINES + 1 行（恰好能让本地解析器收满上下文），
+        -n 保留原始行号。排除行同样会命中并延长上下文窗口，因此被跳过的排除行不会
+        导致上下文缺行。模式中的 \\b、\\s、\\w 依赖 GNU grep。
+        """
+        return (
+            f"grep -a -n -i -E -A {MAX_CONTEXT_LINES + 1} "
+            f"-e {shlex.quote(self.remote_pattern)}"
+        )
+    
+    def classify(self, line: str) -> int:
+        """判断一行日志的类型：LINE_NORMAL / LINE_ERROR / LINE_EXCLUDED"""
+        # 非 ASCII 行的大小写折叠规则与 str.lower() 不完全一致（如 K 与开尔文符号），不做预筛选
+        if self.keywords and line.isascii():
+            lowered = line.lower()
+            for keyword in self.keywords:
+                if keyword in lowered:
+                    break
+            else:
+                return LINE_NORMAL
+        
+        if self.exclude_re.search(line):
+            return LINE_EXCLUDED
+        if self.error_re.search(line):
+            return LINE_ERROR
+        return LINE_NORMAL
+
+
+DEFAULT_MATCHER = ErrorMatcher()
+
+
+# 常见时间戳格式，text 组为保存到 error_logs.timestamp 的原始文本
+_ISO_TIMESTAMP = (
+    r'(?P<text>(?P<y>\d{4})-(?P<mo>\d{2})-(?P<d>\d{2})[\sT](?P<h>\d{2}):(?P<mi>\d{2}):(?P<s>\d{2}))'
+    r'(?:[.,](?P<frac>\d{1,9}))?(?P<tz>Z|[+-]\d{2}:?\d{2})?'
+)
+_CLF_TIMESTAMP = (
+    r'(?P<text>(?P<d>\d{2})/(?P<mon>\w{3})/(?P<y>\d{4}):(?P<h>\d{2}):(?P<mi>\d{2}):(?P<s>\d{2}))'
+    r'(?: (?P<tz>[+-]\d{4}))?'
+)
+_SLASH_TIMESTAMP = (
+    r'(?P<text>(?P<y>\d{4})/(?P<mo>\d{2})/(?P<d>\d{2}) (?P<h>\d{2}):(?P<mi>\d{2}):(?P<s>\d{2}))'
+)
+_MONTHS = {name: i for i, name in enumerate(calendar.month_abbr) if name}
+
+
+def _epoch_ms(match: re.Match) -> Optional[int]:
+    """把时间戳匹配结果换算为毫秒级 epoch，没有时区的时间按本机时区处理"""
+    groups = match.groupdict()
+    try:
+        month = int(groups['mo']) if groups.get('mo') else _MONTHS[groups['mon'].title()]
+        fields = (int(groups['y']), month, int(groups['d']),
+                  int(groups['h']), int(groups['mi']), int(groups['s']))
+    except (KeyError, ValueError):
+        return None
+    if not (1 <= fields[1] <= 12 and 1 <= fields[2] <= 31
+            and fields[3] < 24 and fields[4] < 60 and fields[5] < 61):
+        return None
+    
+    frac = groups.get('frac')
+    millis = int(frac[:3].ljust(3, '0')) if frac else 0
+    tz = groups.get('tz')
+    try:
+        if tz:
+            offset = 0
+            if tz != 'Z':
+                digits = tz[1:].replace(':', '')
+                offset = int(digits[:2]) * 3600 + int(digits[2:4]) * 60
+                if tz[0] == '-':
+                    offset = -offset
+            seconds = calendar.timegm(fields + (0, 0, 0)) - offset
+        else:
+            seconds = int(time.mktime(fields + (0, 0, -1)))
+    except (ValueError, OverflowError):
+        return None
+    return seconds * 1000 + millis
+
+
+def _epoch_ms_from_number(value: float) -> int:
+    """数字时间戳：大于 1e11 视为毫秒，否则视为秒"""
+    return int(value) if value > 1e11 else int(value * 1000)
+
+
+class TimestampFormat:
+    """一种时间戳格式：预编译的正则和换算为 epoch 毫秒的方法"""
+    
+    def __init__(self, name: str, pattern: str):
+        self.name = name
+        self.regex = re.compile(pattern)
+    
+    def to_epoch_ms(self, match: re.Match) -> Optional[int]:
+        return _epoch_ms(match)
+
+
+ISO_TIMESTAMP = TimestampFormat('iso', _ISO_TIMESTAMP)
+CLF_TIMESTAMP = TimestampFormat('clf', _CLF_TIMESTAMP)
+SLASH_TIMESTAMP = TimestampFormat('slash', _SLASH_TIMESTAMP)
+
+# 从整行中探测时间戳时的尝试顺序（带方括号的 ISO 格式总会先被 iso 命中，不再单列）
+DETECT_TIMESTAMP_FORMATS = (ISO_TIMESTAMP, CLF_TIMESTAMP)
+# 解析器配置直接给出时间戳文本时可识别的格式
+NORMALIZE_TIMESTAMP_FORMATS = (ISO_TIMESTAMP, CLF_TIMESTAMP, SLASH_TIMESTAMP)
+
+
+class TimestampExtractor:
+    """按容器学习时间戳格式
+
+    第一次识别出时间戳后记住格式和它在行中的位置，之后先在该位置用这一个预编译正则锚定匹配，
+    失败时才回退到逐个格式探测。除原始文本外同时给出毫秒级 epoch，便于排序和按时间范围查询。
+    """
+    
+    def __init__(self):
+        self.format: Optional[TimestampFormat] = None
+        self.offset: Optional[int] = None
+        self.text_format: Optional[TimestampFormat] = None
+    
+    def extract(self, line: str) -> Tuple[Optional[str], Optional[int]]:
+        """从日志行中提取时间戳，返回 (原始文本, epoch 毫秒)"""
+        fmt = self.format
+        if fmt is not None:
+            match = fmt.regex.match(line, self.offset)
+            if match is None:
+                match = fmt.regex.search(line)
+            if match:
+                return match.group('text'), fmt.to_epoch_ms(match)
+        
+        for candidate in DETECT_TIMESTAMP_FORMATS:
+            match = candidate.regex.search(line)
+            if match:
+                if self.format is None:
+                    self.format, self.offset = candidate, match.start()
+                return match.group('text'), candidate.to_epoch_ms(match)
+        return None, None
+    
+    def normalize(self, value: Any) -> Optional[int]:
+        """把解析器配置给出的时间戳（文本或数字）换算为 epoch 毫秒"""
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return _epoch_ms_from_number(value)
+        
+        text = str(value).strip()
+        if text.replace('.', '', 1).isdigit():
+            return _epoch_ms_from_number(float(text))
+        
+        fmt = self.text_format
+        if fmt is not None:
+            match = fmt.regex.match(text)
+            if match:
+                return fmt.to_epoch_ms(match)
+        for candidate in NORMALIZE_TIMESTAMP_FORMATS:
+            match = candidate.regex.match(text)
+            if match:
+                self.text_format = candidate
+                return candidate.to_epoch_ms(match)
+        return None
+
+
+def extract_timestamp(log_line: str) -> Optional[str]:
+    """从日志行中提取时间戳（不学习格式）"""
+    return TimestampExtractor().extract(log_line)[0]
+
+
+_timestamp_extractors: Dict[str, TimestampExtractor] = {}
+
+
+def get_timestamp_extractor(key: str) -> TimestampExtractor:
+    """获取某个容器（key 通常为 "主机/容器名"）的时间戳提取器，学到的格式在进程内缓存"""
+    return _timestamp_extractors.setdefault(key, TimestampExtractor())
+
+
+class LogProfile:
+    """解析器配置基类，也是通用文本日志的解析方式：用 ErrorMatcher 扫描整行
+
+    parse 返回 (行类型, 字段)，字段只在错误行时给出，可包含 timestamp、level、logger、
+    thread 以及预先收集的 context（如 JSON 日志里的堆栈字段）。
+    字段中没有 timestamp 时由 TimestampExtractor 从整行中提取
+    """
+    
+    name = 'generic'
+    # 是否可以配合远程 grep 预筛选使用
+    supports_prefilter = True
+    
+    def __init__(self, matcher: ErrorMatcher = DEFAULT_MATCHER):
+        self.matcher = matcher
+    
+    def parse(self, line: str) -> Tuple[int, Optional[Dict]]:
+        kind = self.matcher.classify(line)
+        if kind == LINE_ERROR:
+            return kind, {}
+        return kind, None
+
+
+class HeaderLogProfile(LogProfile):
+    """按日志头解析的文本日志：匹配日志头的行是一条新记录，其余行是上一条记录的延续（堆栈等）"""
+    
+    supports_prefilter = False
+    headers: List[re.Pattern] = []
+    error_levels = frozenset()
+    logger_name = None
+    
+    def parse(self, line: str) -> Tuple[int, Optional[Dict]]:
+        for header in self.headers:
+            match = header.match(line)
+            if match:
+                break
+        else:
+            return LINE_NORMAL, None
+        
+        groups = match.groupdict()
+        level = groups.get('level') or groups.get('status')
+        if not self.is_error_level(level):
+            return LINE_RECORD, None
+        return LINE_ERROR, {
+            'timestamp': groups.get('timestamp'),
+            'level': level.upper(),
+            'logger': groups.get('logger') or self.logger_name,
+            'thread': groups.get('thread') or groups.get('thread2')
+        }
+    
+    def is_error_level(self, level: Optional[str]) -> bool:
+        return bool(level) and level.upper() in self.error_levels
+
+
+class JavaLogProfile(HeaderLogProfile):
+    """Java logback/log4j 及 Spring Boot 默认格式
+
+    2024-01-01 10:00:00.123 [main] ERROR c.o.market.OrderService - ...
+    2024-01-01 10:00:00.123 ERROR [main] c.o.market.OrderService - ...
+    2024-01-01 10:00:00.123 ERROR 1234 --- [main] c.o.market.OrderService : ...
+    """
+    
+    name = 'java'
+    headers = [re.compile(
+        r'(?P<timestamp>\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d{1,9})?(?:Z|[+-]\d{2}:?\d{2})?)\s+'
+        r'(?:\[(?P<thread>[^\]]*)\]\s+)?'
+        r'(?P<level>TRACE|DEBUG|INFO|WARN|WARNING|ERROR|FATAL)\s+'
+        r'(?:\d+\s+---\s+)?'
+        r'(?:\[\s*(?P<thread2>[^\]]*?)\s*\]\s+)?'
+        r'(?:(?P<logger>[\w.$]+)\s*[-:]\s)?'
+    )]
+    error_levels = frozenset({'ERROR', 'FATAL'})
+
+
+class PythonLogProfile(HeaderLogProfile):
+    """Python logging 常见格式
+
+    2024-01-01 10:00:00,123 - app.module - ERROR - ...
+    ERROR:app.module:...（logging.basicConfig 默认格式，uvicorn 的 "ERROR:    ..." 也属此类）
+    """
+    
+    name = 'python'
+    headers = [
+        re.compile(
+            r'(?P<timestamp>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:,\d{3})?)\s+-\s+'
+            r'(?P<logger>\S+)\s+-\s+(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL)\s+-\s'
+        ),
+        re.compile(r'(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL):(?P<logger>[^:\s]*)'),
+    ]
+    error_levels = frozenset({'ERROR', 'CRITICAL'})
+
+
+class NginxLogProfile(HeaderLogProfile):
+    """nginx 错误日志与 combined 格式访问日志，访问日志中 5xx 视为错误
+
+    2024/01/01 10:00:00 [error] 31#31: *1 connect() failed ...
+    10.0.0.1 - - [01/Jan/2024:10:00:00 +0800] "GET /api HTTP/1.1" 502 157 ...
+    """
+    
+    name = 'nginx'
+    headers = [
+        re.compile(r'(?P<timestamp>\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) \[(?P<level>\w+)\] (?P<thread>\d+#\d+):'),
+        re.compile(r'\S+ \S+ \S+ \[(?P<timestamp>[^\]]+)\] "[^"]*" (?P<status>\d{3}) '),
+    ]
+    error_levels = frozenset({'ERROR', 'CRIT', 'ALERT', 'EMERG'})
+    logger_name = 'nginx'
+    
+    def is_error_level(self, level: Optional[str]) -> bool:
+        if level and level.isdigit():
+            return level.startswith('5')
+        return super().is_error_level(level)
+
+
+class JsonLogProfile(LogProfile):
+    """JSON Lines 日志：按 level 字段过滤，不做正则扫描
+
+    非 JSON 的行（例如直接打印到 stderr 的堆栈）视为上一条记录的延续
+    """
+    
+    name = 'json'
+    supports_prefilter = False
+    level_keys = ('level', 'levelname', 'severity', 'log.level', 'lvl', '@l')
+    timestamp_keys = ('@timestamp', 'timestamp', 'time', 'ts', 'asctime', '@t')
+    logger_keys = ('logger', 'logger_name', 'log.logger', 'name')
+    thread_keys = ('thread', 'thread_name', 'threadName', 'process.thread.name')
+    stack_keys = ('stack_trace', 'stacktrace', 'exception', 'exc_info', 'stack', 'error.stack_trace')
+    error_levels = frozenset({'ERROR', 'ERR', 'FATAL', 'CRITICAL', 'CRIT', 'PANIC', 'ALERT', 'EMERG', 'SEVERE'})
+    
+    def parse(self, line: str) -> Tuple[int, Optional[Dict]]:
+        stripped = line.lstrip()
+        if not stripped.startswith('{'):
+            return LINE_NORMAL, None
+        try:
+            record = _json_loads(stripped)
+        except ValueError:
+            return LINE_NORMAL, None
+        if not isinstance(record, dict):
+            return LINE_NORMAL, None
+        
+        level = _lookup(record, self.level_keys)
+        if not self.is_error_level(level):
+            return LINE_RECORD, None
+        
+        timestamp = _lookup(record, self.timestamp_keys)
+        stack = _lookup(record, self.stack_keys)
+        context = []
+        if stack:
+            text = stack if isinstance(stack, str) else json.dumps(stack, ensure_ascii=False)
+            context = text.splitlines()[:MAX_CONTEXT_LINES + 1]
+        return LINE_ERROR, {
+            'timestamp': str(timestamp) if timestamp is not None else None,
+            'level': str(level).upper(),
+            'logger': _lookup(record, self.logger_keys),
+            'thread': _lookup(record, self.thread_keys),
+            'context': context
+        }
+    
+    def is_error_level(self, level: Any) -> bool:
+        if isinstance(level, bool) or level is None:
+            return False
+        if isinstance(level, (int, float)):
+            # pino / bunyan 的数字级别：50 为 error，60 为 fatal
+            return level >= 50
+        return str(level).upper() in self.error_levels
+
+
+def _lookup(record: Dict, keys: Tuple[str, ...]) -> Any:
+    """按顺序查找第一个存在的字段，带点的键同时支持扁平写法和嵌套对象"""
+    for key in keys:
+        if key in record:
+            return record[key]
+        if '.' in key:
+            value = record
+            for part in key.split('.'):
+                if not isinstance(value, dict) or part not in value:
+                    break
+                value = value[part]
+            else:
+                return value
+    return None
+
+
+DEFAULT_PROFILE = LogProfile()
+
+# 可在服务器配置中按容器选择的解析器配置
+PROFILES: Dict[str, LogProfile] = {
+    profile.name: profile
+    for profile in (DEFAULT_PROFILE, JsonLogProfile(), JavaLogProfile(), PythonLogProfile(), NginxLogProfile())
+}
+
+
+def get_profile(name: Optional[str] = None) -> LogProfile:
+    """按名称获取解析器配置，名称为空时使用通用配置"""
+    if not name:
+        return DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"未知的解析器配置: {name}，可选: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def iter_error_events(numbered_lines: Iterable[Optional[Tuple[int, str]]],
+                      profile: LogProfile = DEFAULT_PROFILE,
+                      timestamps: Optional[TimestampExtractor] = None) -> Iterator[Dict]:
+    """解析器核心：逐行分类，把错误行及其后的上下文组装成错误事件
+
+    每个错误事件只由错误行本身和它之后的若干行决定，与之前的行无关，
+    这也是并行解析可以按行切块的前提
+    """
+    parse = profile.parse
+    timestamps = timestamps or TimestampExtractor()
+    current_error = None
+    
+    for item in numbered_lines:
+        if item is None:
+            if current_error:
+                yield current_error
+                current_error = None
+            continue
+        line_number, line = item
+        
+        kind, fields = parse(line)
+        if kind == LINE_EXCLUDED:
+            continue
+        
+        if kind == LINE_ERROR:
+            if current_error:
+                yield current_error
+            
+            if 'timestamp' in fields:
+                timestamp = fields['timestamp']
+                timestamp_ms = timestamps.normalize(timestamp)
+            else:
+                timestamp, timestamp_ms = timestamps.extract(line)
+            
+            current_error = {
+                'line_number': line_number,
+                'timestamp': timestamp,
+                'timestamp_ms': timestamp_ms,
+                'content': line,
+                'context': fields.get('context') or []
+            }
+            for key in ('level', 'logger', 'thread'):
+                if fields.get(key):
+                    current_error[key] = fields[key]
+            if len(current_error['context']) > MAX_CONTEXT_LINES:
+                yield current_error
+                current_error = None
+        elif kind == LINE_RECORD:
+            if current_error:
+                yield current_error
+                current_error = None
+        elif current_error:
+            # 收集错误的上下文（堆栈信息等）
+            current_error['context'].append(line)
+            if len(current_error['context']) > MAX_CONTEXT_LINES:  # 限制上下文行数
+                yield current_error
+                current_error = None
+    
+    if current_error:
+        yield current_error
+
+
+# 达到该行数才启用多进程解析，行数较少时进程间传输的开销得不偿失
+PARALLEL_PARSE_MIN_LINES = 200_000
+
+# 每块额外携带的后续行数，用于补全块尾错误的上下文
+PARALLEL_PARSE_OVERLAP = 256
+
+_parse_pool = None
+_parse_pool_workers = 0
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    """进程池在首次并行解析时创建并在进程内复用，只在需要更多进程时重建
+
+    API 进程中有存储写线程、SSH 连接回收线程等，fork 可能复制其他线程持有的锁导致子进程死锁，
+    因此用 spawn 启动工作进程（子进程会导入主模块，主模块的启动代码需放在 __main__ 判断内）
+    """
+    global _parse_pool, _parse_pool_workers
+    with _parse_pool_lock:
+        if _parse_pool is None or _parse_pool_workers < workers:
+            if _parse_pool is not None:
+                # 已提交的任务会继续执行完，其他线程正在等待的结果不受影响
+                _parse_pool.shutdown(wait=False)
+            _parse_pool = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=multiprocessing.get_context('spawn'))
+            _parse_pool_workers = workers
+        return _parse_pool
+
+
+def _parse_chunk(lines: List[str], first_line_number: int, owned: int, at_end: bool,
+                 profile: LogProfile, timestamps: TimestampExtractor) -> Tuple[List[Dict], bool]:
+    """解析一个块：只产出错误行落在前 owned 行内的错误，后面的重叠行仅用于补全上下文
+
+    返回 (错误列表, 最后一个错误是否因块尾截断而可能缺少上下文)
+    """
+    errors = []
+    last_owned = first_line_number + owned - 1
+    reached_next = False
+    for error in iter_error_events(enumerate(lines, first_line_number), profile, timestamps):
+        if error['line_number'] > last_owned:
+            reached_next = True
+            break
+        errors.append(error)
+    
+    # 最后一个错误既没有收满上下文、也没有遇到下一个错误行，说明是被块尾强行结束的
+    truncated = (
+        bool(errors) and not at_end and not reached_next
+        and len(errors[-1]['context']) <= MAX_CONTEXT_LINES
+    )
+    return errors, truncated
+
+
+def parse_lines_parallel(lines: List[str], profile: LogProfile = DEFAULT_PROFILE,
+                         workers: Optional[int] = None,
+                         timestamps: Optional[TimestampExtractor] = None) -> List[Dict]:
+    """多进程并行解析日志行，结果与单进程解析完全一致
+
+    按行切块，每块附带 PARALLEL_PARSE_OVERLAP 行重叠，块只负责错误行落在本块内的错误；
+    若块尾错误的上下文超出了重叠范围（大量排除行时可能出现），回到完整数据上重新组装该错误
+    """
+    workers = workers or os.cpu_count() or 1
+    timestamps = timestamps or TimestampExtractor()
+    total = len(lines)
+    chunk_size = max(-(-total // (workers * 4)), PARALLEL_PARSE_OVERLAP * 4)
+    
+    pool = _get_parse_pool(workers)
+    futures = []
+    for start in range(0, total, chunk_size):
+        owned = min(chunk_size, total - start)
+        end = start + owned + PARALLEL_PARSE_OVERLAP
+        futures.append(pool.submit(
+            _parse_chunk, lines[start:end], start + 1, owned, end >= total, profile, timestamps
+        ))
+    
+    errors = []
+    for future in futures:
+        chunk_errors, truncated = future.result()
+        if truncated:
+            index = chunk_errors[-1]['line_number'] - 1
+            chunk_errors[-1] = next(iter_error_events(
+                enumerate(lines[index:], index + 1), profile, timestamps
+            ))
+        errors.extend(chunk_errors)
+    return errors
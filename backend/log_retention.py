@@ -0,0 +1,86 @@
+"""
+数据保留模块 - 后台定期归档冷数据、清理过期数据并回收数据库空间
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+from log_archive import RawLogArchive
+from log_storage import LogStorage, DEFAULT_HOT_DAYS, DEFAULT_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionJob:
+    """在后台线程中定期执行：冷数据移入月分区 -> 按保留期清理 -> 增量 vacuum
+
+    传入 raw_archive 时按同样的保留期删除原始日志归档中的过期段
+    """
+    
+    def __init__(self, storage: LogStorage,
+                 interval: float = 3600,
+                 hot_days: int = DEFAULT_HOT_DAYS,
+                 default_retention_days: int = DEFAULT_RETENTION_DAYS,
+                 vacuum_pages: int = 0,
+                 raw_archive: Optional[RawLogArchive] = None):
+        self.storage = storage
+        self.raw_archive = raw_archive
+        self.interval = interval
+        self.hot_days = hot_days
+        self.default_retention_days = default_retention_days
+        self.vacuum_pages = vacuum_pages
+        self.stop_event = threading.Event()
+        self.run_lock = threading.Lock()
+        self.thread = None
+        self.last_run: Optional[Dict] = None
+    
+    def start(self):
+        """启动后台线程"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """通知后台线程退出"""
+        self.stop_event.set()
+    
+    def run_once(self) -> Dict:
+        """执行一轮归档、清理和空间回收，返回本轮结果"""
+        with self.run_lock:
+            started = time.time()
+            result = {'started_at': datetime.now().isoformat()}
+            result['archived'] = self.storage.archive_errors(self.hot_days)
+            result.update(self.storage.purge_expired(self.default_retention_days))
+            result['vacuum'] = self.storage.incremental_vacuum(self.vacuum_pages)
+            if self.raw_archive is not None:
+                result['raw_segments_dropped'] = self.raw_archive.purge(
+                    self.storage.get_retention_policies(), self.default_retention_days
+                )
+            result['elapsed'] = round(time.time() - started, 3)
+            self.last_run = result
+            logger.info(
+                f"数据保留任务完成: 归档 {result['archived']} 条, 删除错误 {result['errors']} 条, "
+                f"删除分区 {len(result['partitions_dropped'])} 个, 回收 {result['vacuum']['pages_freed']} 页"
+            )
+            return result
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"数据保留任务失败: {e}")
+            self.stop_event.wait(self.interval)
+    
+    def to_dict(self) -> Dict:
+        return {
+            'running': self.thread is not None and self.thread.is_alive(),
+            'interval': self.interval,
+            'hot_days': self.hot_days,
+            'default_retention_days': self.default_retention_days,
+            'last_run': self.last_run,
+        }
@@ -2,90 +2,873 @@
 日志存储模块 - 使用SQLite存储解析后的日志
 """
 import sqlite3
+import base64
+import glob
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Dict, Optional, Tuple
 import logging
 
+from log_fingerprint import error_signature, signature_fingerprint
+from log_parser import TimestampExtractor
+
 logger = logging.getLogger(__name__)
 
+# 每个连接打开后执行的 PRAGMA：WAL 让读写互不阻塞，NORMAL 同步在 WAL 下
+# 只在检查点 fsync，页缓存 64MB、内存映射 256MB，临时表/排序放内存
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 30000",
+)
+
+# 每个问题保留的错误样本数：首次出现的一条加最近的若干条
+ISSUE_SAMPLE_LIMIT = 5
+
+# 超过 DEFAULT_HOT_DAYS 天的错误移入按月分区的归档库；未单独配置保留期的容器保留 DEFAULT_RETENTION_DAYS 天
+DEFAULT_HOT_DAYS = 7
+DEFAULT_RETENTION_DAYS = 90
+
+# 归档后合并全文索引段时每轮最多写入的页数，避免一次重写整个索引
+SEARCH_MERGE_PAGES = 2000
+
+# 归档分区的表结构：context / analysis 为 zlib 压缩后的 BLOB，读取时透明解压
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS part.error_logs (
+        id INTEGER PRIMARY KEY,
+        container_name TEXT NOT NULL,
+        timestamp TEXT,
+        timestamp_ms INTEGER,
+        line_number INTEGER,
+        error_content TEXT NOT NULL,
+        context BLOB,
+        analysis BLOB,
+        severity TEXT,
+        status TEXT,
+        created_at TEXT NOT NULL,
+        analyzed_at TEXT,
+        issue_id INTEGER,
+        raw_segment INTEGER,
+        raw_line INTEGER,
+        raw_host TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS part.idx_error_logs_container_created ON error_logs (container_name, created_at)",
+)
+
+# 分区建表之后新增的列：旧分区挂载时补上
+ARCHIVE_ADDED_COLUMNS = (('raw_segment', 'INTEGER'), ('raw_line', 'INTEGER'), ('raw_host', 'TEXT'))
+
+ARCHIVE_COLUMNS = ('id', 'container_name', 'timestamp', 'timestamp_ms', 'line_number', 'error_content',
+                   'context', 'analysis', 'severity', 'status', 'created_at', 'analyzed_at', 'issue_id',
+                   'raw_segment', 'raw_line', 'raw_host')
+
+
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode('utf-8'), 6) if text else None
+
+
+def _decompress(value):
+    """归档行的压缩列解压为文本，热库中的文本原样返回"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+def _month_start(month: str) -> datetime:
+    return datetime.strptime(month, '%Y-%m')
+
+
+def _next_month(month: str) -> str:
+    start = _month_start(month)
+    return f"{start.year + start.month // 12:04d}-{start.month % 12 + 1:02d}"
+
+
+# 错误计数汇总的时间粒度（毫秒）与各粒度的保留天数：细粒度只保留近期，天级汇总长期保留
+ROLLUP_GRANULARITIES = {'minute': 60_000, 'hour': 3_600_000, 'day': 86_400_000}
+ROLLUP_RETENTION_DAYS = {'minute': 2, 'hour': 35, 'day': 400}
+
+# 分析缓存行的最长保留天数，缓存有效期（见 log_analysis.ANALYSIS_CACHE_TTL）不应超过它
+ANALYSIS_CACHE_RETENTION_DAYS = 30
+
+# 已完成 / 最终失败的分析任务保留天数
+ANALYSIS_JOB_RETENTION_DAYS = 7
+
+# 分析任务失败后重试的最长退避（毫秒）
+ANALYSIS_RETRY_MAX_DELAY_MS = 3_600_000
+
+# 分析任务优先级：先按日志级别，错误行内容提示更严重时取更高者（默认解析器没有级别，只看内容）
+PRIORITY_CRITICAL, PRIORITY_ERROR, PRIORITY_FAILURE, PRIORITY_WARNING = 4, 3, 2, 1
+LEVEL_PRIORITY = {
+    'FATAL': PRIORITY_CRITICAL, 'CRITICAL': PRIORITY_CRITICAL, 'CRIT': PRIORITY_CRITICAL,
+    'PANIC': PRIORITY_CRITICAL, 'ALERT': PRIORITY_CRITICAL, 'EMERG': PRIORITY_CRITICAL,
+    'ERROR': PRIORITY_ERROR, 'ERR': PRIORITY_ERROR, 'SEVERE': PRIORITY_ERROR,
+    'WARN': PRIORITY_WARNING, 'WARNING': PRIORITY_WARNING,
+}
+CONTENT_PRIORITY = [
+    (re.compile(r'\b(?:FATAL|CRITICAL|PANIC)\b|OutOfMemoryError|StackOverflowError'), PRIORITY_CRITICAL),
+    (re.compile(r'\bERROR\b|Exception\b|Traceback|Caused by:'), PRIORITY_ERROR),
+    (re.compile(r'[Ff]ailed to|Unable to|Cannot'), PRIORITY_FAILURE),
+]
+
+# 积压超过阈值时只领取不低于该优先级的任务，其余推迟
+DEFER_MIN_PRIORITY = PRIORITY_ERROR
+
+# 积压超过丢弃阈值时，不高于该优先级的任务标记为 shed（可通过重试接口重新排队）
+SHED_MAX_PRIORITY = PRIORITY_WARNING
+
+@lru_cache(maxsize=4096)
+def _local_bucket_base(utc_hour: int) -> Tuple[int, int]:
+    # 该 UTC 小时内的本地时区偏移和本地零点（epoch 毫秒）；夏令时只在整点切换，按小时缓存
+    local = time.localtime(utc_hour * 3600)
+    midnight = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1))
+    return local.tm_gmtoff * 1000, int(midnight) * 1000
+
+
+def rollup_bucket(ms: int, granularity: str) -> int:
+    """时间所在分桶的起始 epoch 毫秒：按该时间点的本地时区对齐，天级分桶从当天本地零点开始
+
+    时区偏移按时间点计算而不是进程启动时取一次，跨夏令时切换后分桶不会错开一小时，
+    重建汇总与运行中写入的分桶一致；切换当天的天级分桶为 23 或 25 小时
+    """
+    offset, midnight = _local_bucket_base(ms // 3_600_000)
+    if granularity == 'day':
+        return midnight
+    size = ROLLUP_GRANULARITIES[granularity]
+    return (ms + offset) // size * size - offset
+
+
+def _count_rollups(counter: Counter, seen: int, severity: Optional[str], fp: str):
+    """一次错误出现计入各粒度的分桶"""
+    for granularity in ROLLUP_GRANULARITIES:
+        counter[(granularity, rollup_bucket(seen, granularity), severity or '', fp)] += 1
+
+
+def _record_rollups(cursor: sqlite3.Cursor, container_name: str, counter: Counter):
+    cursor.executemany("""
+        INSERT INTO error_rollups (granularity, bucket, container_name, severity, fingerprint, count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (granularity, bucket, container_name, severity, fingerprint)
+        DO UPDATE SET count = count + excluded.count
+    """, [(granularity, bucket, container_name, severity, fp, count)
+          for (granularity, bucket, severity, fp), count in counter.items()])
+
+
+# 错误列表摘要中内容预览的字符数
+ERROR_PREVIEW_CHARS = 200
+
+# 全文检索各列的 bm25 权重：错误行 > 上下文 > 分析结果
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)
+
+# trigram 分词下检索词至少 3 个字符
+SEARCH_MIN_TERM_CHARS = 3
+
+
+def fts_query(text: str) -> str:
+    """检索文本转 FTS5 查询：按空白切分，每个词作为短语加引号（不解析 FTS 语法），词之间为 AND
+
+    少于 3 个字符的词无法用 trigram 索引匹配，直接丢弃；没有可用的词时抛出 ValueError
+    """
+    terms = [term for term in text.split() if len(term) >= SEARCH_MIN_TERM_CHARS]
+    if not terms:
+        raise ValueError(f"检索词至少需要 {SEARCH_MIN_TERM_CHARS} 个字符")
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def encode_page_cursor(key, last_id: int) -> str:
+    """分页游标：排序键和 id 的 JSON，base64 编码后对调用方不透明"""
+    return base64.urlsafe_b64encode(json.dumps([key, last_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_page_cursor(cursor: str):
+    """解析分页游标，返回 (排序键, id)；格式不对时抛出 ValueError"""
+    try:
+        key, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    if not isinstance(last_id, int) or not (key is None or isinstance(key, (str, int))):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return key, last_id
+
+
+def _migrate_base_tables(cursor: sqlite3.Cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS error_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            container_name TEXT NOT NULL,
+            timestamp TEXT,
+            line_number INTEGER,
+            error_content TEXT NOT NULL,
+            context TEXT,
+            analysis TEXT,
+            severity TEXT,
+            status TEXT DEFAULT 'new',
+            created_at TEXT NOT NULL,
+            analyzed_at TEXT
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS collection_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            container_name TEXT NOT NULL,
+            collected_at TEXT NOT NULL,
+            log_lines INTEGER,
+            error_count INTEGER
+        )
+    """)
+
+
+def _migrate_collection_cursors(cursor: sqlite3.Cursor):
+    # 增量采集游标：记录每个 (主机, 容器) 最后采集到的 docker 时间戳
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS collection_cursors (
+            host TEXT NOT NULL,
+            container_name TEXT NOT NULL,
+            last_timestamp TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (host, container_name)
+        )
+    """)
+
+
+def _migrate_timestamp_ms(cursor: sqlite3.Cursor):
+    # 日志时间戳换算后的 epoch 毫秒；引入迁移前已补过该列的库跳过
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(error_logs)")]
+    if 'timestamp_ms' not in columns:
+        cursor.execute("ALTER TABLE error_logs ADD COLUMN timestamp_ms INTEGER")
+
+
+def _migrate_cursor_raw_line(cursor: sqlite3.Cursor):
+    # 游标同时记录原始日志归档已提交到的位置（下一行的归档行号），
+    # 归档中超出该位置的行来自入库失败或中断的采集，下次采集前截掉
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(collection_cursors)")]
+    if 'raw_next_line' not in columns:
+        cursor.execute("ALTER TABLE collection_cursors ADD COLUMN raw_next_line INTEGER")
+
+
+def _backfill_timestamp_ms(cursor: sqlite3.Cursor, batch_size: int = 5000):
+    # 历史行只有 timestamp 文本，按采集时相同的规则换算，否则按时间过滤和排序时会漏掉或排错；
+    # 按 id 分批读取，换算不出的行保持为空
+    extractor = TimestampExtractor()
+    last_id = 0
+    while True:
+        rows = cursor.execute("""
+            SELECT id, timestamp FROM error_logs
+            WHERE id > ? AND timestamp_ms IS NULL AND timestamp IS NOT NULL AND timestamp != ''
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for error_id, text in rows:
+            timestamp_ms = extractor.normalize(text)
+            if timestamp_ms is None:
+                timestamp_ms = extractor.extract(text)[1]
+            if timestamp_ms is not None:
+                updates.append((timestamp_ms, error_id))
+        cursor.executemany("UPDATE error_logs SET timestamp_ms = ? WHERE id = ?", updates)
+
+
+def _migrate_query_indexes(cursor: sqlite3.Cursor):
+    # 对应 get_errors 的过滤条件与排序：等值列在前、排序列在后，
+    # 排序由索引顺序直接给出，不需要临时 B 树；索引隐含 rowid，可作为 id 次序
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_created ON error_logs (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_container_created ON error_logs (container_name, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_status_created ON error_logs (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_container_status_created "
+        "ON error_logs (container_name, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_timestamp ON error_logs (timestamp_ms)",
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_container_timestamp ON error_logs (container_name, timestamp_ms)",
+        "CREATE INDEX IF NOT EXISTS idx_collection_history_collected ON collection_history (collected_at)",
+    ):
+        cursor.execute(statement)
+    cursor.execute("ANALYZE")
+
+
+def analysis_priority(level: Optional[str], content: str) -> int:
+    """错误的分析优先级（1-4，越大越先分析）"""
+    priority = LEVEL_PRIORITY.get((level or '').upper(), PRIORITY_WARNING)
+    for pattern, content_priority in CONTENT_PRIORITY:
+        if content_priority <= priority:
+            break
+        if pattern.search(content or ''):
+            return content_priority
+    return priority
+
+
+def _now_ms() -> int:
+    return int(datetime.now().timestamp() * 1000)
+
+
+def _record_issues(cursor: sqlite3.Cursor, container_name: str, groups: Dict[str, Dict]) -> Dict[str, sqlite3.Row]:
+    """按指纹累加问题出现次数，返回 {指纹: 问题行(id, status)}
+
+    groups 为 {指纹: {signature, count, first_seen, last_seen, severity}}；
+    已解决的问题再次出现时重新打开
+    """
+    cursor.executemany("""
+        INSERT INTO issues 
+        (container_name, fingerprint, signature, severity, count, first_seen, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (container_name, fingerprint) DO UPDATE SET
+            count = count + excluded.count,
+            first_seen = MIN(first_seen, excluded.first_seen),
+            last_seen = MAX(last_seen, excluded.last_seen),
+            severity = COALESCE(excluded.severity, severity),
+            status = CASE WHEN status = 'resolved' THEN 'new' ELSE status END
+    """, [
+        (container_name, fp, group['signature'], group['severity'],
+         group['count'], group['first_seen'], group['last_seen'])
+        for fp, group in groups.items()
+    ])
+    
+    issues = {}
+    for fp in groups:
+        issues[fp] = cursor.execute(
+            "SELECT id, status FROM issues WHERE container_name = ? AND fingerprint = ?",
+            (container_name, fp)
+        ).fetchone()
+    return issues
+
+
+def _migrate_issues(cursor: sqlite3.Cursor):
+    # 按指纹聚合的问题；first_seen / last_seen 为 epoch 毫秒（优先取日志时间）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS issues (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            container_name TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            severity TEXT,
+            status TEXT DEFAULT 'new',
+            count INTEGER NOT NULL DEFAULT 0,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            UNIQUE (container_name, fingerprint)
+        )
+    """)
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(error_logs)")]
+    if 'issue_id' not in columns:
+        cursor.execute("ALTER TABLE error_logs ADD COLUMN issue_id INTEGER")
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_error_logs_issue ON error_logs (issue_id)",
+        "CREATE INDEX IF NOT EXISTS idx_issues_last_seen ON issues (last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_issues_container_last_seen ON issues (container_name, last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_issues_status_last_seen ON issues (status, last_seen)",
+    ):
+        cursor.execute(statement)
+    
+    # 已有错误归入问题；旧样本不删除，之后该问题再次出现时按样本上限裁剪
+    rows = cursor.execute("""
+        SELECT id, container_name, timestamp_ms, error_content, context, severity, created_at
+        FROM error_logs WHERE issue_id IS NULL ORDER BY id
+    """).fetchall()
+    by_container: Dict[str, Dict[str, Dict]] = {}
+    row_fingerprints = []
+    for row in rows:
+        try:
+            context = json.loads(row['context']) if row['context'] else []
+        except (json.JSONDecodeError, TypeError):
+            context = []
+        signature = error_signature({'content': row['error_content'], 'context': context})
+        fp = signature_fingerprint(signature)
+        seen = row['timestamp_ms'] or int(datetime.fromisoformat(row['created_at']).timestamp() * 1000)
+        group = by_container.setdefault(row['container_name'], {}).setdefault(fp, {
+            'signature': signature, 'severity': None, 'count': 0, 'first_seen': seen, 'last_seen': seen,
+        })
+        group['count'] += 1
+        group['first_seen'] = min(group['first_seen'], seen)
+        group['last_seen'] = max(group['last_seen'], seen)
+        group['severity'] = row['severity'] or group['severity']
+        row_fingerprints.append((row['id'], row['container_name'], fp))
+    
+    issue_ids = {}
+    for container_name, groups in by_container.items():
+        for fp, issue in _record_issues(cursor, container_name, groups).items():
+            issue_ids[(container_name, fp)] = issue['id']
+    cursor.executemany(
+        "UPDATE error_logs SET issue_id = ? WHERE id = ?",
+        [(issue_ids[(container_name, fp)], row_id) for row_id, container_name, fp in row_fingerprints]
+    )
+    # 问题状态沿用最近一条错误的状态
+    cursor.execute("""
+        UPDATE issues SET status = COALESCE(
+            (SELECT status FROM error_logs WHERE issue_id = issues.id ORDER BY id DESC LIMIT 1), 'new')
+    """)
+
+
+def _migrate_error_search(cursor: sqlite3.Cursor):
+    # 外部内容 FTS5 索引，不重复存储原文；trigram 分词支持子串匹配，中文分析结果也能检索
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS error_logs_fts USING fts5(
+            error_content, context, analysis,
+            content='error_logs', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    # 触发器保持索引同步，样本裁剪删除的行也会从索引中移除
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS error_logs_fts_insert AFTER INSERT ON error_logs BEGIN
+            INSERT INTO error_logs_fts (rowid, error_content, context, analysis)
+            VALUES (new.id, new.error_content, new.context, new.analysis);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS error_logs_fts_delete AFTER DELETE ON error_logs BEGIN
+            INSERT INTO error_logs_fts (error_logs_fts, rowid, error_content, context, analysis)
+            VALUES ('delete', old.id, old.error_content, old.context, old.analysis);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS error_logs_fts_update
+        AFTER UPDATE OF error_content, context, analysis ON error_logs BEGIN
+            INSERT INTO error_logs_fts (error_logs_fts, rowid, error_content, context, analysis)
+            VALUES ('delete', old.id, old.error_content, old.context, old.analysis);
+            INSERT INTO error_logs_fts (rowid, error_content, context, analysis)
+            VALUES (new.id, new.error_content, new.context, new.analysis);
+        END
+    """)
+    cursor.execute("INSERT INTO error_logs_fts (error_logs_fts) VALUES ('rebuild')")
+
+
+def _migrate_retention_policies(cursor: sqlite3.Cursor):
+    # 按容器配置的保留天数，未配置的容器使用默认保留期
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS retention_policies (
+            container_name TEXT PRIMARY KEY,
+            retention_days INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+
+
+def _migrate_error_rollups(cursor: sqlite3.Cursor):
+    # 错误计数汇总：入库时按 粒度 × 分桶 × 容器 × 级别 × 指纹 累加，主键以分桶时间在前，按时间范围查询走主键
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS error_rollups (
+            granularity TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            container_name TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (granularity, bucket, container_name, severity, fingerprint)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migrate_raw_log_refs(cursor: sqlite3.Cursor):
+    # 错误在原始日志归档中的位置：段号与容器内的归档行号，周围日志从归档读取
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(error_logs)")]
+    for column in ('raw_segment', 'raw_line'):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE error_logs ADD COLUMN {column} INTEGER")
+
+
+def _migrate_raw_log_host(cursor: sqlite3.Cursor):
+    # 原始日志归档按 (主机, 容器) 分开保存，错误记录归档所属主机；
+    # 之前的引用指向不区分主机的归档，raw_host 为空，不再读取
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(error_logs)")]
+    if 'raw_host' not in columns:
+        cursor.execute("ALTER TABLE error_logs ADD COLUMN raw_host TEXT")
+
+
+def _migrate_analysis_cache(cursor: sqlite3.Cursor):
+    # 按错误签名缓存的 AI 分析结果；prompt_version 随提示词模板变化，旧版本的行读取时忽略
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            prompt_version INTEGER NOT NULL,
+            analysis TEXT NOT NULL,
+            analyzed_at TEXT NOT NULL,
+            created_ms INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_created ON analysis_cache (created_ms)")
+
+
+def _migrate_analysis_jobs(cursor: sqlite3.Cursor):
+    # 待分析错误的持久队列：state 为 pending / leased / done / failed；
+    # available_at 为任务可被领取的时间，领取后推迟为租约到期时间，工作进程崩溃时租约到期后自动重新可见
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INTEGER PRIMARY KEY,
+            error_id INTEGER NOT NULL UNIQUE,
+            container_name TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at INTEGER NOT NULL,
+            lease_token TEXT,
+            last_error TEXT,
+            created_ms INTEGER NOT NULL,
+            updated_ms INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_state ON analysis_jobs (state, available_at)")
+
+
+def _migrate_analysis_priority(cursor: sqlite3.Cursor):
+    # 分析任务按优先级（严重程度）和错误发生时间领取；已有的任务按错误行补算
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(analysis_jobs)")]
+    if 'priority' not in columns:
+        cursor.execute("ALTER TABLE analysis_jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 2")
+    if 'occurred_ms' not in columns:
+        cursor.execute("ALTER TABLE analysis_jobs ADD COLUMN occurred_ms INTEGER NOT NULL DEFAULT 0")
+    rows = cursor.execute("""
+        SELECT j.id, e.severity, e.error_content, COALESCE(e.timestamp_ms, j.created_ms) AS occurred_ms
+        FROM analysis_jobs j JOIN error_logs e ON e.id = j.error_id
+        WHERE j.state IN ('pending', 'leased')
+    """).fetchall()
+    cursor.executemany(
+        "UPDATE analysis_jobs SET priority = ?, occurred_ms = ? WHERE id = ?",
+        [(analysis_priority(row[1], row[2]), row[3], row[0]) for row in rows]
+    )
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_analysis_jobs_priority
+        ON analysis_jobs (state, priority DESC, occurred_ms DESC)
+    """)
+
+
+# 数据库迁移：(版本, 说明, 升级函数)，按版本递增追加，已发布的步骤不要修改
+MIGRATIONS = [
+    (1, "错误日志与采集历史表", _migrate_base_tables),
+    (2, "增量采集游标表", _migrate_collection_cursors),
+    (3, "error_logs 增加 timestamp_ms 列", _migrate_timestamp_ms),
+    (4, "错误列表查询索引", _migrate_query_indexes),
+    (5, "错误指纹聚合为问题", _migrate_issues),
+    (6, "错误全文索引", _migrate_error_search),
+    (7, "按容器的保留期配置", _migrate_retention_policies),
+    (8, "错误计数汇总", _migrate_error_rollups),
+    (9, "错误引用原始日志归档位置", _migrate_raw_log_refs),
+    (10, "AI 分析结果缓存", _migrate_analysis_cache),
+    (11, "持久化分析任务队列", _migrate_analysis_jobs),
+    (12, "分析任务优先级", _migrate_analysis_priority),
+    (13, "原始日志归档区分主机", _migrate_raw_log_host),
+    (14, "补算历史错误的 timestamp_ms", _backfill_timestamp_ms),
+    (15, "游标记录原始日志归档位置", _migrate_cursor_raw_line),
+]
+
 
 class LogStorage:
-    """日志存储"""
+    """日志存储
+
+    连接长期复用：写操作共用一个写连接（加锁串行），读操作每个线程一个读连接。
+    WAL 模式下读连接不会被写事务阻塞。
+    """
     
-    def __init__(self, db_path: str = "logs.db"):
+    def __init__(self, db_path: str = "logs.db", archive_dir: Optional[str] = None):
         self.db_path = db_path
+        # 按月分区的归档库目录，默认与数据库同名加 _archive 后缀
+        self.archive_dir = archive_dir or os.path.splitext(db_path)[0] + '_archive'
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._group_depth = 0
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
         self.init_db()
     
+    def _connect(self) -> sqlite3.Connection:
+        """打开一个调优后的连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def _reader(self) -> sqlite3.Connection:
+        """当前线程的读连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    def _writer_connection(self) -> sqlite3.Connection:
+        """写连接，调用方需持有写锁"""
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+    
+    @contextmanager
+    def _write(self):
+        """在写连接上执行一个事务，异常时回滚
+
+        处于 group_commit() 中时改用保存点：单个写操作失败只回滚自己，由外层统一提交
+        """
+        with self._write_lock:
+            conn = self._writer_connection()
+            if self._group_depth:
+                savepoint = f"write_{self._group_depth}"
+                self._group_depth += 1
+                conn.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    yield conn.cursor()
+                    conn.execute(f"RELEASE {savepoint}")
+                except Exception:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    conn.execute(f"RELEASE {savepoint}")
+                    raise
+                finally:
+                    self._group_depth -= 1
+                return
+            try:
+                yield conn.cursor()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    @contextmanager
+    def group_commit(self):
+        """把多个写操作合并为一个事务提交（组提交），减少 fsync 次数
+
+        组内不能执行 ATTACH / VACUUM 等不能在事务中执行的维护操作
+        """
+        with self._write_lock:
+            conn = self._writer_connection()
+            conn.execute("BEGIN IMMEDIATE")
+            self._group_depth = 1
+            try:
+                yield
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._group_depth = 0
+    
+    def close(self):
+        """关闭所有连接"""
+        with self._write_lock, self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+            self._writer = None
+            self._local = threading.local()
+    
     def init_db(self):
-        """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """初始化数据库：按版本顺序执行未应用的迁移"""
+        self._enable_incremental_vacuum()
+        with self._write() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TEXT NOT NULL
+                )
+            """)
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS error_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                container_name TEXT NOT NULL,
-                timestamp TEXT,
-                line_number INTEGER,
-                error_content TEXT NOT NULL,
-                context TEXT,
-                analysis TEXT,
-                severity TEXT,
-                status TEXT DEFAULT 'new',
-                created_at TEXT NOT NULL,
-                analyzed_at TEXT
-            )
-        """)
+        for version, description, upgrade in MIGRATIONS:
+            with self._write() as cursor:
+                # 显式开启写事务：DDL 与版本记录一起提交，多进程同时启动时只有一个执行迁移
+                cursor.execute("BEGIN IMMEDIATE")
+                if self._schema_version(cursor) >= version:
+                    continue
+                upgrade(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat())
+                )
+                logger.info(f"数据库迁移到版本 {version}: {description}")
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS collection_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                container_name TEXT NOT NULL,
-                collected_at TEXT NOT NULL,
-                log_lines INTEGER,
-                error_count INTEGER
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
         logger.info("数据库初始化完成")
     
-    def save_error(self, container_name: str, error_data: Dict) -> int:
-        """保存单个错误日志"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+    def _enable_incremental_vacuum(self):
+        """开启增量 vacuum，删除数据后可以分批归还空间；切换需要一次完整 VACUUM"""
+        with self._write_lock:
+            conn = self._writer_connection()
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return
+            # 连接时设置 WAL 已写入文件头，即使是空库也要 VACUUM 才能生效
+            logger.info("数据库切换为增量 vacuum 模式，执行一次完整 VACUUM")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    
+    @staticmethod
+    def _schema_version(cursor: sqlite3.Cursor) -> int:
+        row = cursor.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        return row[0] or 0
+    
+    @property
+    def schema_version(self) -> int:
+        """当前数据库结构版本"""
+        return self._schema_version(self._reader().cursor())
+    
+    INSERT_ERROR_SQL = """
+        INSERT INTO error_logs 
+        (container_name, timestamp, timestamp_ms, line_number, error_content, context, 
+         analysis, severity, analyzed_at, created_at, issue_id, status, raw_segment, raw_line, raw_host)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    
+    @staticmethod
+    def _error_params(container_name: str, error_data: Dict, created_at: str,
+                      issue: sqlite3.Row) -> tuple:
+        """错误数据转插入参数，样本继承所属问题的状态"""
         original = error_data.get('original', {})
-        
-        cursor.execute("""
-            INSERT INTO error_logs 
-            (container_name, timestamp, line_number, error_content, context, 
-             analysis, analyzed_at, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+        return (
             container_name,
             original.get('timestamp'),
+            original.get('timestamp_ms'),
             original.get('line_number'),
             original.get('content', ''),
             json.dumps(original.get('context', []), ensure_ascii=False),
             error_data.get('analysis', ''),
+            original.get('level'),
             error_data.get('analyzed_at'),
-            datetime.now().isoformat()
-        ))
+            created_at,
+            issue['id'],
+            issue['status'],
+            original.get('raw_segment'),
+            original.get('raw_line'),
+            original.get('raw_host')
+        )
+    
+    def save_error(self, container_name: str, error_data: Dict) -> int:
+        """保存单个错误日志，返回错误样本 id"""
+        with self._write() as cursor:
+            self._save_occurrences(cursor, container_name, [error_data])
+            return cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    
+    def save_errors(self, container_name: str, errors: Iterable[Dict],
+                    log_lines: Optional[int] = None,
+                    batch_size: int = 500,
+                    enqueue_analysis: bool = False,
+                    collection_cursor: Optional[Tuple[str, str]] = None,
+                    raw_next_line: Optional[int] = None) -> int:
+        """批量保存错误日志，返回保存条数（出现次数）
+
+        所有错误在同一个事务中写入；传入 log_lines 时同一事务内写入采集历史，
+        传入 collection_cursor (host, 游标) 时同一事务内推进增量游标，
+        错误、历史与游标要么都落库、要么都不落库，失败重试不会重复写入同一段日志；
+        raw_next_line 为本次采集写完原始日志归档后的下一行行号，随游标一起提交。
+        enqueue_analysis 为 True 时，写入的样本中尚无分析结果的在同一事务中加入分析任务队列
+        """
+        with self._write() as cursor:
+            saved = self._save_occurrences(cursor, container_name, errors, batch_size, enqueue_analysis)
+            if log_lines is not None:
+                self._insert_collection_history(cursor, container_name, log_lines, saved)
+            if collection_cursor is not None:
+                self._upsert_collection_cursor(cursor, collection_cursor[0], container_name,
+                                               collection_cursor[1], raw_next_line)
+        
+        return saved
+    
+    def _save_occurrences(self, cursor: sqlite3.Cursor, container_name: str,
+                          errors: Iterable[Dict], batch_size: int = 500,
+                          enqueue_analysis: bool = False) -> int:
+        """按指纹聚合错误：累加问题计数和计数汇总，只写入有限的样本并裁剪旧样本"""
+        created_at = datetime.now().isoformat()
+        now_ms = _now_ms()
+        groups: Dict[str, Dict] = {}
+        rollups = Counter()
+        saved = 0
         
-        error_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        for error_data in errors:
+            original = error_data.get('original', {})
+            signature = error_signature(original)
+            fp = signature_fingerprint(signature)
+            seen = original.get('timestamp_ms') or now_ms
+            group = groups.get(fp)
+            if group is None:
+                group = groups[fp] = {
+                    'signature': signature, 'severity': None, 'count': 0,
+                    'first_seen': seen, 'last_seen': seen,
+                    'first': error_data, 'recent': deque(maxlen=ISSUE_SAMPLE_LIMIT - 1),
+                }
+            else:
+                group['recent'].append(error_data)
+            group['count'] += 1
+            group['first_seen'] = min(group['first_seen'], seen)
+            group['last_seen'] = max(group['last_seen'], seen)
+            group['severity'] = original.get('level') or group['severity']
+            _count_rollups(rollups, seen, original.get('level'), fp)
+            saved += 1
         
-        return error_id
+        if not groups:
+            return 0
+        
+        issues = _record_issues(cursor, container_name, groups)
+        _record_rollups(cursor, container_name, rollups)
+        # 写连接串行写入，本次插入的样本 id 都大于当前最大 id
+        last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM error_logs").fetchone()[0]
+        
+        batch = []
+        for fp, group in groups.items():
+            for error_data in (group['first'], *group['recent']):
+                batch.append(self._error_params(container_name, error_data, created_at, issues[fp]))
+                if len(batch) >= batch_size:
+                    cursor.executemany(self.INSERT_ERROR_SQL, batch)
+                    batch = []
+        if batch:
+            cursor.executemany(self.INSERT_ERROR_SQL, batch)
+        
+        # 同一问题的样本签名相同，新样本直接沿用问题最近一次成功的分析，
+        # 裁剪掉已分析的旧样本不会丢失分析，重复出现的错误也不会再次排队分析
+        for issue in issues.values():
+            analysed = cursor.execute("""
+                SELECT e.analysis, e.analyzed_at FROM error_logs e
+                LEFT JOIN analysis_jobs j ON j.error_id = e.id
+                WHERE e.issue_id = ? AND e.id <= ? AND COALESCE(e.analysis, '') != ''
+                AND COALESCE(j.state, 'done') = 'done' AND e.analysis NOT LIKE 'AI分析失败%'
+                ORDER BY e.id DESC LIMIT 1
+            """, (issue['id'], last_id)).fetchone()
+            if analysed:
+                cursor.execute("""
+                    UPDATE error_logs SET analysis = ?, analyzed_at = ?
+                    WHERE issue_id = ? AND id > ? AND COALESCE(analysis, '') = ''
+                """, (analysed['analysis'], analysed['analyzed_at'], issue['id'], last_id))
+        
+        # 每个问题只保留首个样本和最近 ISSUE_SAMPLE_LIMIT - 1 个样本
+        cursor.executemany("""
+            DELETE FROM error_logs WHERE issue_id = ?
+            AND id != (SELECT MIN(id) FROM error_logs WHERE issue_id = ?)
+            AND id NOT IN (SELECT id FROM error_logs WHERE issue_id = ? ORDER BY id DESC LIMIT ?)
+        """, [(issue['id'], issue['id'], issue['id'], ISSUE_SAMPLE_LIMIT - 1) for issue in issues.values()])
+        
+        if enqueue_analysis:
+            # 裁剪后仍保留的新样本才需要分析；id 被复用时替换旧错误遗留的任务
+            rows = cursor.execute("""
+                SELECT id, container_name, severity, error_content, timestamp_ms FROM error_logs
+                WHERE id > ? AND COALESCE(analysis, '') = ''
+            """, (last_id,)).fetchall()
+            cursor.executemany("""
+                INSERT OR REPLACE INTO analysis_jobs
+                (error_id, container_name, priority, occurred_ms, available_at, created_ms, updated_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(row['id'], row['container_name'], analysis_priority(row['severity'], row['error_content']),
+                   row['timestamp_ms'] or now_ms, now_ms, now_ms, now_ms) for row in rows])
+        
+        return saved
     
     def save_collection_history(self, container_name: str, log_lines: int, error_count: int):
         """保存采集历史"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        with self._write() as cursor:
+            self._insert_collection_history(cursor, container_name, log_lines, error_count)
+    
+    @staticmethod
+    def _insert_collection_history(cursor: sqlite3.Cursor, container_name: str,
+                                   log_lines: int, error_count: int):
         cursor.execute("""
             INSERT INTO collection_history 
             (container_name, collected_at, log_lines, error_count)
@@ -96,98 +879,774 @@ class LogStorage:
             log_lines,
             error_count
         ))
+    
+    def get_collection_cursor(self, host: str, container_name: str) -> Optional[str]:
+        """获取增量采集游标"""
+        cursor = self._reader().execute("""
+            SELECT last_timestamp FROM collection_cursors 
+            WHERE host = ? AND container_name = ?
+        """, (host, container_name))
+        row = cursor.fetchone()
         
-        conn.commit()
-        conn.close()
+        return row[0] if row else None
+    
+    def get_raw_next_line(self, host: str, container_name: str) -> Optional[int]:
+        """原始日志归档已随游标提交到的位置（下一行的归档行号），没有记录时返回 None"""
+        row = self._reader().execute("""
+            SELECT raw_next_line FROM collection_cursors WHERE host = ? AND container_name = ?
+        """, (host, container_name)).fetchone()
+        return row[0] if row else None
+    
+    def save_collection_cursor(self, host: str, container_name: str, last_timestamp: str):
+        """保存增量采集游标"""
+        with self._write() as cursor:
+            self._upsert_collection_cursor(cursor, host, container_name, last_timestamp)
+    
+    @staticmethod
+    def _upsert_collection_cursor(cursor: sqlite3.Cursor, host: str, container_name: str,
+                                  last_timestamp: str, raw_next_line: Optional[int] = None):
+        # 没有写归档的采集（预筛选、跟随）保留原来的归档位置
+        cursor.execute("""
+            INSERT INTO collection_cursors 
+            (host, container_name, last_timestamp, updated_at, raw_next_line)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (host, container_name) DO UPDATE SET
+                last_timestamp = excluded.last_timestamp,
+                updated_at = excluded.updated_at,
+                raw_next_line = COALESCE(excluded.raw_next_line, raw_next_line)
+        """, (
+            host,
+            container_name,
+            last_timestamp,
+            datetime.now().isoformat(),
+            raw_next_line
+        ))
     
     def get_errors(self, container_name: Optional[str] = None, 
                    status: Optional[str] = None, 
-                   limit: int = 100) -> List[Dict]:
-        """获取错误日志列表"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+                   limit: int = 100,
+                   start_ms: Optional[int] = None,
+                   end_ms: Optional[int] = None,
+                   order_by: str = 'created_at',
+                   cursor: Optional[str] = None,
+                   summary: bool = False) -> List[Dict]:
+        """获取错误日志列表
+
+        start_ms / end_ms 按日志时间（epoch 毫秒）过滤，order_by 为 timestamp 时按日志时间排序；
+        cursor 为上一页 page_cursor() 的返回值，从该行之后继续（键集分页）；
+        summary 时只返回列表列和截断的内容预览，不含 context / analysis
+        """
+        after = decode_page_cursor(cursor) if cursor else None
+        query, params = self._errors_query(container_name, status, limit, start_ms, end_ms,
+                                           order_by, after, summary)
+        rows = self._reader().execute(query, params).fetchall()
         
-        query = "SELECT * FROM error_logs WHERE 1=1"
+        if order_by == 'timestamp' and after and after[0] is not None and len(rows) < limit:
+            # 有日志时间的行取完后，接着取排在最后的无日志时间的行；分两次查询都能走索引
+            query, params = self._errors_query(container_name, status, limit - len(rows), start_ms, end_ms,
+                                               order_by, (None, None), summary)
+            rows += self._reader().execute(query, params).fetchall()
+        
+        if summary:
+            return [dict(row) for row in rows]
+        return [self._error_row(row) for row in rows]
+    
+    @staticmethod
+    def page_cursor(row: Dict, order_by: str = 'created_at') -> str:
+        """列表中最后一行对应的分页游标"""
+        key = row['timestamp_ms'] if order_by == 'timestamp' else row['created_at']
+        return encode_page_cursor(key, row['id'])
+    
+    @staticmethod
+    def _errors_query(container_name: Optional[str], status: Optional[str], limit: int,
+                      start_ms: Optional[int], end_ms: Optional[int], order_by: str,
+                      after: Optional[tuple] = None, summary: bool = False):
+        """构造错误列表查询，after 为 (排序键, id)，只取排在其后的行"""
+        if summary:
+            query = f"""
+                SELECT e.id, e.container_name, e.timestamp, e.timestamp_ms, e.line_number,
+                       e.severity, e.status, e.created_at, e.analyzed_at, e.issue_id,
+                       substr(e.error_content, 1, {ERROR_PREVIEW_CHARS}) AS preview,
+                       e.analyzed_at IS NOT NULL AS analyzed,
+                       i.count AS occurrences
+                FROM error_logs e LEFT JOIN issues i ON i.id = e.issue_id WHERE 1=1"""
+        else:
+            query = "SELECT e.* FROM error_logs e WHERE 1=1"
         params = []
         
         if container_name:
-            query += " AND container_name = ?"
+            query += " AND e.container_name = ?"
             params.append(container_name)
         
         if status:
-            query += " AND status = ?"
+            query += " AND e.status = ?"
             params.append(status)
         
-        query += " ORDER BY created_at DESC LIMIT ?"
-        params.append(limit)
+        if start_ms is not None:
+            query += " AND e.timestamp_ms >= ?"
+            params.append(start_ms)
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        if end_ms is not None:
+            query += " AND e.timestamp_ms < ?"
+            params.append(end_ms)
         
-        errors = []
-        for row in rows:
-            error = dict(row)
-            if error.get('context'):
-                try:
-                    error['context'] = json.loads(error['context'])
-                except (json.JSONDecodeError, TypeError):
-                    error['context'] = []
+        if after:
+            key, last_id = after
+            if order_by != 'timestamp':
+                query += " AND (e.created_at, e.id) < (?, ?)"
+                params.extend([key, last_id])
+            elif key is None:
+                # 无日志时间的行排在最后
+                query += " AND e.timestamp_ms IS NULL"
+                if last_id is not None:
+                    query += " AND e.id < ?"
+                    params.append(last_id)
             else:
-                error['context'] = []
-            errors.append(error)
+                query += " AND (e.timestamp_ms, e.id) < (?, ?)"
+                params.extend([key, last_id])
+        
+        if order_by == 'timestamp':
+            query += " ORDER BY e.timestamp_ms DESC, e.id DESC LIMIT ?"
+        else:
+            query += " ORDER BY e.created_at DESC, e.id DESC LIMIT ?"
+        params.append(limit)
+        return query, params
+    
+    def explain_errors_query(self, container_name: Optional[str] = None,
+                             status: Optional[str] = None,
+                             start_ms: Optional[int] = None,
+                             end_ms: Optional[int] = None,
+                             order_by: str = 'created_at',
+                             cursor: Optional[str] = None,
+                             summary: bool = False) -> List[str]:
+        """返回 get_errors 对应查询的 EXPLAIN QUERY PLAN 明细"""
+        after = decode_page_cursor(cursor) if cursor else None
+        query, params = self._errors_query(container_name, status, 100, start_ms, end_ms,
+                                           order_by, after, summary)
+        rows = self._reader().execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        return [row['detail'] for row in rows]
+    
+    def search_errors(self, text: str,
+                      container_name: Optional[str] = None,
+                      status: Optional[str] = None,
+                      start_ms: Optional[int] = None,
+                      end_ms: Optional[int] = None,
+                      order_by: str = 'rank',
+                      limit: int = 50,
+                      mark: tuple = ('<mark>', '</mark>')) -> List[Dict]:
+        """全文检索错误内容、上下文和分析结果
+
+        order_by 为 rank 时按 bm25 相关度排序，为 recent 时按入库顺序倒序（FTS 直接按 rowid 倒序取，
+        命中很多时更快）；返回摘要列和各字段的高亮片段，文本未做 HTML 转义
+        """
+        query = """
+            SELECT e.id, e.container_name, e.timestamp, e.timestamp_ms, e.severity, e.status,
+                   e.created_at, e.analyzed_at, e.issue_id,
+                   bm25(error_logs_fts, ?, ?, ?) AS score,
+                   snippet(error_logs_fts, 0, ?, ?, '…', 24) AS content_snippet,
+                   snippet(error_logs_fts, 1, ?, ?, '…', 24) AS context_snippet,
+                   snippet(error_logs_fts, 2, ?, ?, '…', 24) AS analysis_snippet
+            FROM error_logs_fts JOIN error_logs e ON e.id = error_logs_fts.rowid
+            WHERE error_logs_fts MATCH ?"""
+        params = [*SEARCH_WEIGHTS, *mark, *mark, *mark, fts_query(text)]
+        
+        if container_name:
+            query += " AND e.container_name = ?"
+            params.append(container_name)
+        
+        if status:
+            query += " AND e.status = ?"
+            params.append(status)
+        
+        if start_ms is not None:
+            query += " AND e.timestamp_ms >= ?"
+            params.append(start_ms)
+        
+        if end_ms is not None:
+            query += " AND e.timestamp_ms < ?"
+            params.append(end_ms)
+        
+        if order_by == 'recent':
+            query += " ORDER BY error_logs_fts.rowid DESC LIMIT ?"
+        else:
+            query += " ORDER BY score LIMIT ?"
+        params.append(limit)
         
-        conn.close()
-        return errors
+        rows = self._reader().execute(query, params).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            # snippet 在该列没有命中时返回开头片段，没有命中的列置空
+            for column in ('context_snippet', 'analysis_snippet'):
+                if not result[column] or mark[0] not in result[column]:
+                    result[column] = None
+            results.append(result)
+        return results
     
     def get_error_by_id(self, error_id: int) -> Optional[Dict]:
         """获取单个错误详情"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM error_logs WHERE id = ?", (error_id,))
-        row = cursor.fetchone()
+        conn = self._reader()
+        row = conn.execute("SELECT * FROM error_logs WHERE id = ?", (error_id,)).fetchone()
+        if not row:
+            row = self._find_archived_error(error_id)
+        if not row:
+            return None
         
-        if row:
-            error = dict(row)
-            if error.get('context'):
-                try:
-                    error['context'] = json.loads(error['context'])
-                except (json.JSONDecodeError, TypeError):
-                    error['context'] = []
-            else:
+        error = self._error_row(row)
+        if error.get('issue_id') is not None:
+            issue = conn.execute("SELECT * FROM issues WHERE id = ?", (error['issue_id'],)).fetchone()
+            error['issue'] = dict(issue) if issue else None
+        job = conn.execute(
+            "SELECT state, attempts, last_error FROM analysis_jobs WHERE error_id = ?", (error_id,)
+        ).fetchone()
+        error['analysis_job'] = dict(job) if job else None
+        return error
+    
+    @staticmethod
+    def _error_row(row: sqlite3.Row) -> Dict:
+        """错误日志行转字典，context 反序列化为列表，归档行的压缩列透明解压"""
+        error = dict(row)
+        error['context'] = _decompress(error.get('context'))
+        if 'analysis' in error:
+            error['analysis'] = _decompress(error['analysis'])
+        if error.get('context'):
+            try:
+                error['context'] = json.loads(error['context'])
+            except (json.JSONDecodeError, TypeError):
                 error['context'] = []
-            conn.close()
-            return error
-        
-        conn.close()
-        return None
+        else:
+            error['context'] = []
+        return error
     
     def update_error_status(self, error_id: int, status: str):
-        """更新错误状态"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """更新错误状态：作用于错误所属的整个问题"""
+        with self._write() as cursor:
+            row = cursor.execute("SELECT issue_id FROM error_logs WHERE id = ?", (error_id,)).fetchone()
+            if row and row['issue_id'] is not None:
+                self._set_issue_status(cursor, row['issue_id'], status)
+            else:
+                cursor.execute("""
+                    UPDATE error_logs SET status = ? WHERE id = ?
+                """, (status, error_id))
+    
+    def update_issue_status(self, issue_id: int, status: str):
+        """更新问题状态，同步到该问题的所有样本"""
+        with self._write() as cursor:
+            self._set_issue_status(cursor, issue_id, status)
+    
+    @staticmethod
+    def _set_issue_status(cursor: sqlite3.Cursor, issue_id: int, status: str):
+        cursor.execute("UPDATE issues SET status = ? WHERE id = ?", (status, issue_id))
+        cursor.execute("UPDATE error_logs SET status = ? WHERE issue_id = ?", (status, issue_id))
+    
+    def get_issues(self, container_name: Optional[str] = None,
+                   status: Optional[str] = None,
+                   limit: int = 100) -> List[Dict]:
+        """获取问题列表，按最近出现时间倒序"""
+        query = "SELECT * FROM issues WHERE 1=1"
+        params = []
         
-        cursor.execute("""
-            UPDATE error_logs SET status = ? WHERE id = ?
-        """, (status, error_id))
+        if container_name:
+            query += " AND container_name = ?"
+            params.append(container_name)
+        
+        if status:
+            query += " AND status = ?"
+            params.append(status)
         
-        conn.commit()
-        conn.close()
+        query += " ORDER BY last_seen DESC LIMIT ?"
+        params.append(limit)
+        
+        return [dict(row) for row in self._reader().execute(query, params).fetchall()]
+    
+    def get_issue_by_id(self, issue_id: int) -> Optional[Dict]:
+        """获取问题详情及其错误样本"""
+        conn = self._reader()
+        row = conn.execute("SELECT * FROM issues WHERE id = ?", (issue_id,)).fetchone()
+        if not row:
+            return None
+        
+        issue = dict(row)
+        samples = conn.execute(
+            "SELECT * FROM error_logs WHERE issue_id = ? ORDER BY id DESC", (issue_id,)
+        ).fetchall()
+        issue['samples'] = [self._error_row(sample) for sample in samples]
+        return issue
     
     def get_collection_history(self, limit: int = 50) -> List[Dict]:
         """获取采集历史"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        rows = self._reader().execute("""
             SELECT * FROM collection_history 
             ORDER BY collected_at DESC LIMIT ?
-        """, (limit,))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        """, (limit,)).fetchall()
         
         return [dict(row) for row in rows]
+    
+    # ---------- 保留期、分区与空间回收 ----------
+    
+    def get_retention_policies(self) -> Dict[str, int]:
+        """按容器配置的保留天数"""
+        rows = self._reader().execute("SELECT container_name, retention_days FROM retention_policies").fetchall()
+        return {row['container_name']: row['retention_days'] for row in rows}
+    
+    def set_retention_policy(self, container_name: str, retention_days: Optional[int]):
+        """设置容器保留天数，None 表示恢复默认保留期"""
+        with self._write() as cursor:
+            if retention_days is None:
+                cursor.execute("DELETE FROM retention_policies WHERE container_name = ?", (container_name,))
+            else:
+                cursor.execute("""
+                    INSERT OR REPLACE INTO retention_policies (container_name, retention_days, updated_at)
+                    VALUES (?, ?, ?)
+                """, (container_name, retention_days, datetime.now().isoformat()))
+    
+    def _partition_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"errors-{month}.db")
+    
+    def list_partitions(self) -> List[Dict]:
+        """归档分区列表，按月份升序"""
+        partitions = []
+        for path in sorted(glob.glob(os.path.join(self.archive_dir, "errors-*.db"))):
+            month = os.path.basename(path)[len("errors-"):-len(".db")]
+            partitions.append({'month': month, 'path': path, 'size_bytes': os.path.getsize(path)})
+        return partitions
+    
+    @contextmanager
+    def _attached_partition(self, month: str):
+        """在写连接上挂载月分区（不存在时创建）；ATTACH/DETACH 不能在事务中执行"""
+        with self._write_lock:
+            conn = self._writer_connection()
+            os.makedirs(self.archive_dir, exist_ok=True)
+            conn.execute("ATTACH DATABASE ? AS part", (self._partition_path(month),))
+            try:
+                conn.execute("PRAGMA part.auto_vacuum = INCREMENTAL")
+                for statement in ARCHIVE_SCHEMA:
+                    conn.execute(statement)
+                columns = [row[1] for row in conn.execute("PRAGMA part.table_info(error_logs)")]
+                for column, column_type in ARCHIVE_ADDED_COLUMNS:
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE part.error_logs ADD COLUMN {column} {column_type}")
+                conn.commit()
+                yield conn
+            finally:
+                conn.execute("DETACH DATABASE part")
+    
+    def _find_archived_error(self, error_id: int) -> Optional[sqlite3.Row]:
+        """在归档分区中按 id 查找错误，从最近的月份开始"""
+        for partition in reversed(self.list_partitions()):
+            conn = sqlite3.connect(f"file:{partition['path']}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            try:
+                row = conn.execute("SELECT * FROM error_logs WHERE id = ?", (error_id,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            finally:
+                conn.close()
+            if row:
+                return row
+        return None
+    
+    def archive_errors(self, hot_days: int = DEFAULT_HOT_DAYS, batch_size: int = 1000) -> int:
+        """把入库超过 hot_days 天的错误按月移入归档分区，context / analysis 压缩存储，返回移动条数
+
+        每批先写入分区并提交、再从热库删除；中途失败时重跑会覆盖分区中已写入的行，不会丢数据
+        """
+        cutoff = (datetime.now() - timedelta(days=hot_days)).isoformat()
+        months = [row[0] for row in self._reader().execute(
+            "SELECT DISTINCT substr(created_at, 1, 7) FROM error_logs WHERE created_at < ?", (cutoff,)
+        ).fetchall()]
+        
+        moved = 0
+        placeholders = ', '.join('?' * len(ARCHIVE_COLUMNS))
+        for month in months:
+            upper = min(f"{_next_month(month)}-01", cutoff)
+            with self._attached_partition(month) as conn:
+                while True:
+                    rows = conn.execute(f"""
+                        SELECT {', '.join(ARCHIVE_COLUMNS)} FROM main.error_logs
+                        WHERE created_at >= ? AND created_at < ? ORDER BY created_at LIMIT ?
+                    """, (f"{month}-01", upper, batch_size)).fetchall()
+                    if not rows:
+                        break
+                    with self._write() as cursor:
+                        cursor.executemany(
+                            f"INSERT OR REPLACE INTO part.error_logs ({', '.join(ARCHIVE_COLUMNS)}) VALUES ({placeholders})",
+                            [tuple(_compress(row[c]) if c in ('context', 'analysis') else row[c] for c in ARCHIVE_COLUMNS)
+                             for row in rows]
+                        )
+                    with self._write() as cursor:
+                        cursor.executemany("DELETE FROM main.error_logs WHERE id = ?", [(row['id'],) for row in rows])
+                    moved += len(rows)
+            logger.info(f"归档分区 {month} 完成")
+        
+        if moved:
+            # 外部内容 FTS 的删除以标记形式写入，合并索引段后才真正释放
+            with self._write() as cursor:
+                cursor.execute("INSERT INTO error_logs_fts (error_logs_fts, rank) VALUES ('merge', ?)",
+                               (SEARCH_MERGE_PAGES,))
+        return moved
+    
+    @staticmethod
+    def _expire(cursor: sqlite3.Cursor, table: str, time_column: str,
+                policies: Dict[str, int], default_days: int) -> int:
+        """按容器保留期删除过期行，返回删除条数"""
+        now = datetime.now()
+        deleted = 0
+        for container_name, days in policies.items():
+            cursor.execute(f"DELETE FROM {table} WHERE container_name = ? AND {time_column} < ?",
+                           (container_name, (now - timedelta(days=days)).isoformat()))
+            deleted += cursor.rowcount
+        
+        query = f"DELETE FROM {table} WHERE {time_column} < ?"
+        params = [(now - timedelta(days=default_days)).isoformat()]
+        if policies:
+            query += f" AND container_name NOT IN ({', '.join('?' * len(policies))})"
+            params.extend(policies)
+        cursor.execute(query, params)
+        return deleted + cursor.rowcount
+    
+    def purge_expired(self, default_days: int = DEFAULT_RETENTION_DAYS) -> Dict:
+        """按保留期清理过期数据
+
+        整个月都已超过所有容器保留期的分区直接删除文件；其余分区和热库按容器删除过期行
+        """
+        policies = self.get_retention_policies()
+        result = {'errors': 0, 'history': 0, 'issues': 0, 'partitions_dropped': []}
+        
+        with self._write() as cursor:
+            result['errors'] += self._expire(cursor, 'error_logs', 'created_at', policies, default_days)
+            result['history'] += self._expire(cursor, 'collection_history', 'collected_at', policies, default_days)
+            # 超过保留期未再出现、且已没有热样本的问题
+            cursor.execute("""
+                DELETE FROM issues WHERE last_seen < ?
+                AND NOT EXISTS (SELECT 1 FROM error_logs WHERE issue_id = issues.id)
+            """, (int((datetime.now() - timedelta(days=max([default_days, *policies.values()]))).timestamp() * 1000),))
+            result['issues'] += cursor.rowcount
+            result['rollups'] = 0
+            for granularity, days in ROLLUP_RETENTION_DAYS.items():
+                cursor.execute("DELETE FROM error_rollups WHERE granularity = ? AND bucket < ?",
+                               (granularity, _now_ms() - days * 86_400_000))
+                result['rollups'] += cursor.rowcount
+            cursor.execute("DELETE FROM analysis_cache WHERE created_ms < ?",
+                           (_now_ms() - ANALYSIS_CACHE_RETENTION_DAYS * 86_400_000,))
+            result['analysis_cache'] = cursor.rowcount
+            cursor.execute("DELETE FROM analysis_jobs WHERE state IN ('done', 'failed', 'shed') AND updated_ms < ?",
+                           (_now_ms() - ANALYSIS_JOB_RETENTION_DAYS * 86_400_000,))
+            result['analysis_jobs'] = cursor.rowcount
+        
+        longest = max([default_days, *policies.values()])
+        drop_before = datetime.now() - timedelta(days=longest)
+        for partition in self.list_partitions():
+            if _month_start(_next_month(partition['month'])) <= drop_before:
+                with self._write_lock:
+                    for suffix in ('', '-wal', '-shm'):
+                        if os.path.exists(partition['path'] + suffix):
+                            os.remove(partition['path'] + suffix)
+                result['partitions_dropped'].append(partition['month'])
+                logger.info(f"删除过期归档分区 {partition['month']}")
+                continue
+            
+            with self._attached_partition(partition['month']) as conn:
+                with self._write() as cursor:
+                    result['errors'] += self._expire(cursor, 'part.error_logs', 'created_at', policies, default_days)
+                conn.executescript("PRAGMA part.incremental_vacuum;")
+        
+        return result
+    
+    def get_cached_analyses(self, keys: List[str], prompt_version: int) -> Dict[str, Dict]:
+        """按缓存键批量读取指定提示词版本的分析结果：{cache_key: {analysis, analyzed_at, created_ms}}"""
+        conn = self._reader()
+        cached = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(f"""
+                SELECT cache_key, analysis, analyzed_at, created_ms FROM analysis_cache
+                WHERE cache_key IN ({', '.join('?' * len(chunk))}) AND prompt_version = ?
+            """, (*chunk, prompt_version)).fetchall()
+            for row in rows:
+                cached[row['cache_key']] = {
+                    'analysis': row['analysis'],
+                    'analyzed_at': row['analyzed_at'],
+                    'created_ms': row['created_ms'],
+                }
+        return cached
+    
+    def save_cached_analysis(self, key: str, prompt_version: int, analysis: str, analyzed_at: str):
+        """写入或覆盖一条分析缓存"""
+        with self._write() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO analysis_cache (cache_key, prompt_version, analysis, analyzed_at, created_ms)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, prompt_version, analysis, analyzed_at, _now_ms()))
+    
+    def lease_analysis_jobs(self, limit: int, visibility_ms: int, lease_token: str,
+                            max_attempts: int, min_priority: int = 0) -> List[Dict]:
+        """按优先级从高到低、同优先级新错误优先，领取最多 limit 个可执行的分析任务，
+        租约 visibility_ms 毫秒内其他工作进程不可见；min_priority 以下的任务本次不领取
+
+        返回 [{job_id, error_id, attempts, error: {content, context, level, container_name}}]；
+        错误行已被裁剪或归档的任务直接标记完成，租约多次到期（工作进程反复崩溃）的任务标记失败
+        """
+        now_ms = _now_ms()
+        with self._write() as cursor:
+            cursor.execute("""
+                UPDATE analysis_jobs SET state = 'failed', last_error = '租约多次到期未完成', updated_ms = ?
+                WHERE state = 'leased' AND available_at <= ? AND attempts >= ?
+            """, (now_ms, now_ms, max_attempts))
+            leased = cursor.execute("""
+                UPDATE analysis_jobs
+                SET state = 'leased', lease_token = ?, available_at = ?, attempts = attempts + 1, updated_ms = ?
+                WHERE id IN (
+                    SELECT id FROM analysis_jobs
+                    WHERE state IN ('pending', 'leased') AND available_at <= ? AND priority >= ?
+                    ORDER BY priority DESC, occurred_ms DESC LIMIT ?
+                )
+                RETURNING id, error_id, attempts, priority, occurred_ms
+            """, (lease_token, now_ms + visibility_ms, now_ms, now_ms, min_priority, limit)).fetchall()
+            if not leased:
+                return []
+            
+            rows = {row['id']: row for row in cursor.execute(f"""
+                SELECT id, container_name, error_content, context, severity FROM error_logs
+                WHERE id IN ({', '.join('?' * len(leased))})
+            """, [job['error_id'] for job in leased]).fetchall()}
+            missing = [(now_ms, job['id']) for job in leased if job['error_id'] not in rows]
+            if missing:
+                cursor.executemany("""
+                    UPDATE analysis_jobs SET state = 'done', last_error = '错误已删除', updated_ms = ? WHERE id = ?
+                """, missing)
+        
+        jobs = []
+        for job in sorted(leased, key=lambda job: (-job['priority'], -job['occurred_ms'])):
+            row = rows.get(job['error_id'])
+            if row is None:
+                continue
+            error = self._error_row(row)
+            jobs.append({
+                'job_id': job['id'],
+                'error_id': job['error_id'],
+                'attempts': job['attempts'],
+                'priority': job['priority'],
+                'error': {
+                    'content': error['error_content'],
+                    'context': error['context'],
+                    'level': error['severity'],
+                    'container_name': error['container_name'],
+                },
+            })
+        return jobs
+    
+    def complete_analysis_jobs(self, lease_token: str, results: List[tuple]):
+        """写入分析结果并完成任务：results 为 [(job_id, analysis, analyzed_at)]
+
+        租约已到期并被其他工作进程领取的任务（lease_token 不符）不写入
+        """
+        now_ms = _now_ms()
+        with self._write() as cursor:
+            for job_id, analysis, analyzed_at in results:
+                job = cursor.execute("""
+                    UPDATE analysis_jobs SET state = 'done', last_error = NULL, updated_ms = ?
+                    WHERE id = ? AND lease_token = ? AND state = 'leased'
+                    RETURNING error_id
+                """, (now_ms, job_id, lease_token)).fetchone()
+                if job:
+                    cursor.execute("UPDATE error_logs SET analysis = ?, analyzed_at = ? WHERE id = ?",
+                                   (analysis, analyzed_at, job['error_id']))
+    
+    def fail_analysis_jobs(self, lease_token: str, failures: List[tuple], max_attempts: int,
+                           retry_delay_ms: int):
+        """记录分析失败：failures 为 [(job_id, 失败原因)]
+
+        未达到 max_attempts 的任务按指数退避重新排队；达到的标记失败，并把失败原因写入错误的分析结果
+        """
+        now_ms = _now_ms()
+        with self._write() as cursor:
+            for job_id, message in failures:
+                job = cursor.execute("""
+                    UPDATE analysis_jobs
+                    SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                        available_at = ? + MIN(? * (1 << MIN(attempts - 1, 16)), ?),
+                        last_error = ?, updated_ms = ?
+                    WHERE id = ? AND lease_token = ? AND state = 'leased'
+                    RETURNING state, error_id
+                """, (max_attempts, now_ms, retry_delay_ms, ANALYSIS_RETRY_MAX_DELAY_MS,
+                      message, now_ms, job_id, lease_token)).fetchone()
+                if job and job['state'] == 'failed':
+                    cursor.execute("UPDATE error_logs SET analysis = ?, analyzed_at = ? WHERE id = ?",
+                                   (message, datetime.now().isoformat(), job['error_id']))
+    
+    def retry_failed_analysis_jobs(self) -> int:
+        """把最终失败和因积压被丢弃的任务重新排队，返回任务数"""
+        now_ms = _now_ms()
+        with self._write() as cursor:
+            cursor.execute("""
+                UPDATE analysis_jobs SET state = 'pending', attempts = 0, available_at = ?, updated_ms = ?
+                WHERE state IN ('failed', 'shed')
+            """, (now_ms, now_ms))
+            return cursor.rowcount
+    
+    def count_pending_analysis_jobs(self) -> int:
+        """待分析任务数（积压）"""
+        return self._reader().execute("SELECT COUNT(*) FROM analysis_jobs WHERE state = 'pending'").fetchone()[0]
+    
+    def shed_analysis_jobs(self, count: int, max_priority: int = SHED_MAX_PRIORITY) -> int:
+        """积压过多时丢弃最多 count 个不高于 max_priority 的待分析任务（最旧的先丢），返回丢弃数"""
+        now_ms = _now_ms()
+        with self._write() as cursor:
+            cursor.execute("""
+                UPDATE analysis_jobs SET state = 'shed', last_error = '积压过多，跳过分析', updated_ms = ?
+                WHERE id IN (
+                    SELECT id FROM analysis_jobs WHERE state = 'pending' AND priority <= ?
+                    ORDER BY priority, occurred_ms LIMIT ?
+                )
+            """, (now_ms, max_priority, count))
+            return cursor.rowcount
+    
+    def get_analysis_job_stats(self) -> Dict:
+        """分析队列进度：各状态任务数、各优先级积压、最早待处理任务的等待时长和最近的失败"""
+        conn = self._reader()
+        counts = {state: 0 for state in ('pending', 'leased', 'done', 'failed', 'shed')}
+        counts.update({row[0]: row[1] for row in conn.execute(
+            "SELECT state, COUNT(*) FROM analysis_jobs GROUP BY state"
+        )})
+        pending_by_priority = {row[0]: row[1] for row in conn.execute(
+            "SELECT priority, COUNT(*) FROM analysis_jobs WHERE state = 'pending' GROUP BY priority"
+        )}
+        oldest = conn.execute(
+            "SELECT MIN(created_ms) FROM analysis_jobs WHERE state IN ('pending', 'leased')"
+        ).fetchone()[0]
+        failures = conn.execute("""
+            SELECT id, error_id, container_name, attempts, last_error, updated_ms FROM analysis_jobs
+            WHERE state = 'failed' ORDER BY updated_ms DESC LIMIT 10
+        """).fetchall()
+        return {
+            'counts': counts,
+            'pending_by_priority': pending_by_priority,
+            'oldest_pending_age_ms': _now_ms() - oldest if oldest else None,
+            'recent_failures': [dict(row) for row in failures],
+        }
+    
+    def incremental_vacuum(self, max_pages: int = 0) -> Dict:
+        """归还空闲页给文件系统，max_pages 为 0 时归还全部"""
+        with self._write_lock:
+            conn = self._writer_connection()
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # execute 只单步执行一次（只释放一页），executescript 才会执行到结束
+            conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return {'pages_freed': before - after, 'free_pages': after}
+    
+    def storage_stats(self) -> Dict:
+        """热库大小、空闲页数和归档分区"""
+        conn = self._reader()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            'hot_bytes': conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+            'free_pages': conn.execute("PRAGMA freelist_count").fetchone()[0],
+            'error_rows': conn.execute("SELECT COUNT(*) FROM error_logs").fetchone()[0],
+            'partitions': self.list_partitions(),
+        }
+    
+    # ---------- 错误计数汇总 ----------
+    
+    def get_stats(self, granularity: str = 'hour',
+                  start_ms: Optional[int] = None,
+                  end_ms: Optional[int] = None,
+                  container_name: Optional[str] = None,
+                  group_by: str = 'container') -> List[Dict]:
+        """按时间分桶的错误计数
+
+        group_by 为 container / severity / fingerprint，后两者同时按容器区分；
+        只读取汇总表，开销与分桶数成正比，与错误条数无关
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"不支持的时间粒度: {granularity}")
+        if group_by not in ('container', 'severity', 'fingerprint'):
+            raise ValueError(f"不支持的分组: {group_by}")
+        
+        end_ms = end_ms if end_ms is not None else _now_ms()
+        if start_ms is None:
+            start_ms = end_ms - ROLLUP_RETENTION_DAYS[granularity] * 86_400_000
+        
+        columns = "r.bucket, r.container_name"
+        if group_by == 'severity':
+            columns += ", r.severity"
+        elif group_by == 'fingerprint':
+            columns += ", r.fingerprint"
+        
+        query = f"""
+            SELECT {columns}, SUM(r.count) AS count FROM error_rollups r
+            WHERE r.granularity = ? AND r.bucket >= ? AND r.bucket < ?"""
+        params = [granularity, rollup_bucket(start_ms, granularity), end_ms]
+        if container_name:
+            query += " AND r.container_name = ?"
+            params.append(container_name)
+        query += f" GROUP BY {columns} ORDER BY r.bucket"
+        
+        if group_by == 'fingerprint':
+            # 附上对应问题的 id，方便从统计跳转到问题详情
+            query = f"""
+                SELECT s.*, i.id AS issue_id FROM ({query}) s
+                LEFT JOIN issues i ON i.container_name = s.container_name AND i.fingerprint = s.fingerprint
+                ORDER BY s.bucket"""
+        
+        return [dict(row) for row in self._reader().execute(query, params).fetchall()]
+    
+    def rollups_started_ms(self) -> Optional[int]:
+        """开始在入库时累加汇总的时间（汇总表迁移的执行时间）"""
+        row = self._reader().execute(
+            "SELECT applied_at FROM schema_version WHERE description = ?", ("错误计数汇总",)
+        ).fetchone()
+        return int(datetime.fromisoformat(row['applied_at']).timestamp() * 1000) if row else None
+    
+    def rebuild_rollups(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> int:
+        """用已存储的错误行（热库和归档分区）重建 [start_ms, end_ms) 内的汇总，返回计入的错误数
+
+        按指纹聚合后重复出现的错误只保留了样本，之后的出现次数只存在于入库时累加的汇总中，
+        重建会把这部分计数丢掉；因此 end_ms 默认取开始累加汇总的时间，只回填此前的历史数据
+        """
+        if end_ms is None:
+            end_ms = self.rollups_started_ms() or _now_ms()
+        start_ms = start_ms or 0
+        
+        fingerprints = {row['id']: row['fingerprint'] for row in
+                        self._reader().execute("SELECT id, fingerprint FROM issues").fetchall()}
+        counters: Dict[str, Counter] = {}
+        counted = 0
+        
+        def count_rows(rows):
+            nonlocal counted
+            for row in rows:
+                seen = row['timestamp_ms'] or int(datetime.fromisoformat(row['created_at']).timestamp() * 1000)
+                if not start_ms <= seen < end_ms:
+                    continue
+                fp = fingerprints.get(row['issue_id'], '')
+                _count_rollups(counters.setdefault(row['container_name'], Counter()), seen, row['severity'], fp)
+                counted += 1
+        
+        row_query = "SELECT container_name, timestamp_ms, created_at, severity, issue_id FROM error_logs"
+        count_rows(self._reader().execute(row_query))
+        for partition in self.list_partitions():
+            conn = sqlite3.connect(f"file:{partition['path']}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            try:
+                count_rows(conn.execute(row_query))
+            finally:
+                conn.close()
+        
+        with self._write() as cursor:
+            # 只重建完整落在 [start_ms, end_ms) 内的分桶，跨越边界的分桶保持不变
+            # 分桶完整落在 end_ms 之前等价于起点早于 end_ms 所在分桶的起点（天级分桶不一定是 24 小时）
+            for granularity in ROLLUP_GRANULARITIES:
+                end_bucket = rollup_bucket(end_ms, granularity)
+                cursor.execute("""
+                    DELETE FROM error_rollups WHERE granularity = ? AND bucket >= ? AND bucket < ?
+                """, (granularity, start_ms, end_bucket))
+                for container_name, counter in counters.items():
+                    partial = Counter({key: count for key, count in counter.items()
+                                       if key[0] == granularity and start_ms <= key[1] < end_bucket})
+                    _record_rollups(cursor, container_name, partial)
+        
+        logger.info(f"重建错误计数汇总完成: {counted} 条错误")
+        return counted
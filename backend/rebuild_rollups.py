@@ -0,0 +1,34 @@
+"""重建错误计数汇总 - 用已存储的错误行回填汇总表
+
+用法: python rebuild_rollups.py [--db logs.db] [--start 2024-01-01] [--end 2024-02-01]
+不指定 --end 时只回填开始在入库时累加汇总之前的历史数据
+"""
+import argparse
+from datetime import datetime
+
+from log_storage import LogStorage
+
+
+def parse_ms(value: str) -> int:
+    """本地时间日期/时间转 epoch 毫秒"""
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建错误计数汇总")
+    parser.add_argument("--db", default="logs.db", help="数据库路径")
+    parser.add_argument("--start", type=parse_ms, help="起始时间（含），如 2024-01-01 或 2024-01-01T08:00")
+    parser.add_argument("--end", type=parse_ms, help="结束时间（不含）")
+    args = parser.parse_args()
+    
+    storage = LogStorage(args.db)
+    started = storage.rollups_started_ms()
+    if args.end is None and started:
+        print(f"汇总自 {datetime.fromtimestamp(started / 1000).isoformat()} 起在入库时累加，只回填此前的数据")
+    counted = storage.rebuild_rollups(args.start, args.end)
+    print(f"重建完成: 计入 {counted} 条错误")
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -33,7 +33,7 @@ class ServerConfigManager:
     
     def add_config(self, name: str, host: str, port: int, username: str, 
                    password: str = None, key_file: str = None, 
-                   containers: List[str] = None) -> Dict:
+                   containers: List[str] = None, profiles: Dict[str, str] = None) -> Dict:
         """添加配置"""
         config = {
             "id": len(self.configs) + 1,
@@ -43,7 +43,9 @@ class ServerConfigManager:
             "username": username,
             "password": password,
             "key_file": key_file,
-            "containers": containers or []
+            "containers": containers or [],
+            # 容器名 -> 解析器配置名称（json / java / python / nginx），未指定的容器使用通用解析
+            "profiles": profiles or {}
         }
         self.configs.append(config)
         self._save_configs()
@@ -0,0 +1,226 @@
+"""
+SSH连接池 - 按 主机/端口/用户/凭据 复用 paramiko 连接，避免每次采集都重新握手认证
+"""
+import hashlib
+import hmac
+import os
+import paramiko
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (host, port, username, 凭据摘要)
+PoolKey = Tuple[str, int, str, str]
+
+# 凭据摘要的进程内随机密钥，内存中不保存可离线比对的密码哈希
+_CREDENTIAL_SECRET = os.urandom(32)
+
+
+def credential_digest(password: Optional[str], key_file: Optional[str]) -> str:
+    """密码 / 密钥文件的摘要：凭据不同的请求不会复用已认证的连接"""
+    material = f"{key_file or ''}\0{password or ''}".encode('utf-8')
+    return hmac.new(_CREDENTIAL_SECRET, material, hashlib.sha256).hexdigest()
+
+
+class PooledConnection:
+    """连接池中的一条SSH连接，多个采集任务可以在同一条连接上各开一个通道"""
+    
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.leases = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class SSHConnectionPool:
+    """进程级SSH连接池
+
+    - 同一 (host, port, username) 且凭据相同才共享一条连接，每次借出占用一个通道名额；
+      凭据不同（例如采集接口传入的临时凭据）会重新认证，不会借到别人已认证的连接
+    - 每个 (host, port, username) 同时借出的通道数不超过 max_channels_per_host（sshd 默认 MaxSessions 为 10）
+    - 借出前做健康检查，连接失效时自动重连
+    - 开启 keepalive，空闲超过 idle_timeout 秒的连接由后台线程回收
+    """
+    
+    def __init__(self, max_channels_per_host: int = 8, idle_timeout: float = 300,
+                 keepalive_interval: int = 30, connect_timeout: float = 10,
+                 acquire_timeout: float = 60):
+        self.max_channels_per_host = max_channels_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self._connections: Dict[PoolKey, PooledConnection] = {}
+        self._semaphores: Dict[Tuple[str, int, str], threading.BoundedSemaphore] = {}
+        self._key_locks: Dict[Tuple[str, int, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._closed = threading.Event()
+    
+    def acquire(self, host: str, port: int, username: str, password: str = None,
+                key_file: str = None) -> paramiko.SSHClient:
+        """借出一条可用的SSH连接，用完必须调用 release 归还"""
+        key = (host, port, username, credential_digest(password, key_file))
+        semaphore, key_lock = self._slots(key)
+        
+        if not semaphore.acquire(timeout=self.acquire_timeout):
+            raise Exception(f"{host} 的SSH通道数已达上限 {self.max_channels_per_host}")
+        
+        try:
+            # 同一主机的握手串行进行，不同主机之间互不阻塞
+            with key_lock:
+                conn = self._connections.get(key)
+                if conn and not self._is_healthy(conn.client):
+                    logger.info(f"SSH连接 {username}@{host}:{port} 已失效，重新连接")
+                    self._discard(key, conn)
+                    conn = None
+                
+                if conn is None:
+                    client = self._connect(host, port, username, password, key_file)
+                    conn = PooledConnection(client)
+                    with self._lock:
+                        self._connections[key] = conn
+                
+                with self._lock:
+                    conn.leases += 1
+                    conn.last_used = time.monotonic()
+        except Exception:
+            semaphore.release()
+            raise
+        
+        self._ensure_reaper()
+        return conn.client
+    
+    def release(self, host: str, port: int, username: str, client: paramiko.SSHClient):
+        """归还连接，连接本身保持打开以供复用"""
+        with self._lock:
+            for key, conn in self._connections.items():
+                if key[:3] == (host, port, username) and conn.client is client:
+                    conn.leases = max(conn.leases - 1, 0)
+                    conn.last_used = time.monotonic()
+                    break
+            semaphore = self._semaphores.get((host, port, username))
+        
+        if semaphore:
+            semaphore.release()
+    
+    def evict_idle(self) -> int:
+        """关闭空闲超时或已失效的连接，返回关闭的连接数"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (key, conn) for key, conn in self._connections.items()
+                if conn.leases == 0 and (
+                    now - conn.last_used > self.idle_timeout
+                    or not self._is_healthy(conn.client, probe=False)
+                )
+            ]
+            for key, conn in expired:
+                del self._connections[key]
+        
+        for key, conn in expired:
+            conn.client.close()
+            logger.info(f"回收空闲SSH连接 {key[2]}@{key[0]}:{key[1]}")
+        return len(expired)
+    
+    def close_all(self):
+        """关闭所有连接并停止回收线程"""
+        self._closed.set()
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.client.close()
+    
+    def stats(self) -> List[Dict]:
+        """连接池状态"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "host": host,
+                    "port": port,
+                    "username": username,
+                    "leases": conn.leases,
+                    "max_channels": self.max_channels_per_host,
+                    "active": self._is_healthy(conn.client, probe=False),
+                    "age_seconds": round(now - conn.created_at, 1),
+                    "idle_seconds": round(now - conn.last_used, 1) if conn.leases == 0 else 0
+                }
+                for (host, port, username, _), conn in self._connections.items()
+            ]
+    
+    def _slots(self, key: PoolKey) -> Tuple[threading.BoundedSemaphore, threading.Lock]:
+        # 通道上限按 (host, port, username) 计算，与凭据无关
+        key = key[:3]
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.BoundedSemaphore(self.max_channels_per_host)
+                self._key_locks[key] = threading.Lock()
+            return self._semaphores[key], self._key_locks[key]
+    
+    def _connect(self, host: str, port: int, username: str, password: str = None,
+                 key_file: str = None) -> paramiko.SSHClient:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        
+        if key_file:
+            client.connect(
+                hostname=host,
+                port=port,
+                username=username,
+                key_filename=key_file,
+                timeout=self.connect_timeout
+            )
+        else:
+            client.connect(
+                hostname=host,
+                port=port,
+                username=username,
+                password=password,
+                timeout=self.connect_timeout
+            )
+        
+        client.get_transport().set_keepalive(self.keepalive_interval)
+        logger.info(f"SSH连接池新建连接 {username}@{host}:{port}")
+        return client
+    
+    def _is_healthy(self, client: paramiko.SSHClient, probe: bool = True) -> bool:
+        """检查连接是否可用，probe 为 True 时额外发送一个 ignore 包探测链路"""
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if probe:
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+    
+    def _discard(self, key: PoolKey, conn: PooledConnection):
+        with self._lock:
+            if self._connections.get(key) is conn:
+                del self._connections[key]
+        conn.client.close()
+    
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="ssh-pool-reaper", daemon=True)
+        self._reaper.start()
+    
+    def _reap_loop(self):
+        interval = max(min(self.idle_timeout / 2, 60), 1)
+        while not self._closed.wait(interval):
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.error(f"回收SSH连接失败: {e}")
+
+
+# 全局连接池，采集接口、跟随任务和调度器共用
+ssh_pool = SSHConnectionPool()